@@ -3,16 +3,19 @@ agent_cfg:
 """
 import json
 import os
-from typing import Generator, Optional, Dict, List, Callable, Any
-from model import Message, OpenaiLLM,Messages
+from typing import Generator, Optional, Dict, List, Callable, Any, Union
+from model import Message, OpenaiLLM, RouterLLM, Messages
 import uuid
 default_save_path="/agent_save"
 class BaseAgent:
-    def __init__(self,llm_cfg:Optional[Dict],system_prompt:Optional[str]=None,save_path:Optional[str]=default_save_path):
-        self.llm = OpenaiLLM(llm_cfg)
+    def __init__(self,llm_cfg:Union[Dict,List[Dict],None],system_prompt:Optional[str]=None,save_path:Optional[str]=default_save_path):
+        # 传入多个配置时按延迟在多个供应商之间路由
+        self.llm = RouterLLM(llm_cfg) if isinstance(llm_cfg,list) else OpenaiLLM(llm_cfg)
         self.system_prompt = system_prompt or "You are a helpful assistant."
         self.messages = Messages(system_prompt=self.system_prompt)
         self._session_id = str(uuid.uuid4().hex)
+        # 用量按会话和agent类型汇总 见model.get_metrics
+        self.llm.metrics_tags = {"session": self._session_id, "agent": type(self).__name__}
         self._save_path = save_path
         os.makedirs(self._save_path, exist_ok=True)
     def chat(self, prompt: str):
@@ -41,6 +44,7 @@ class BaseAgent:
         data = json.loads(js_data)
         agent = cls(llm_cfg, system_prompt=data.get("system_prompt"), save_path=save_path)
         agent._session_id = data.get("_session_id")
+        agent.llm.metrics_tags["session"] = agent._session_id
         agent.messages = Messages.from_json_list(data.get("messages", []))
         return agent
 
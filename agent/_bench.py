@@ -0,0 +1,62 @@
+"""
+基于本地mock服务的agent基准 不需要真实的key
+python -m agent._bench [N]
+每个agent一轮对话: mock先调用第一个工具 拿到结果后回复文本 所以每轮正好两次chat请求和一次工具调用
+RagAgent额外经过VectorStore的检索和rerank
+"""
+import contextlib
+import io
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from ._fncall import FnCallAgent
+from ._rag import RagAgent
+
+
+def _run(make_agent, n: int, concurrency: int) -> Dict:
+    samples: List[float] = []
+
+    def _one(i: int):
+        agent = make_agent()
+        start = time.perf_counter()
+        agent.chat(f"what time is it {i}")
+        samples.append(time.perf_counter() - start)
+        roles = [msg.role for msg in agent.messages]
+        assert roles.count("tool") == 1 and roles[-1] == "assistant", roles
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(_one, range(n)))
+    elapsed = time.perf_counter() - start
+    samples.sort()
+    return {"turns_per_s": n / elapsed, "p50_ms": samples[len(samples) // 2] * 1000,
+            "p95_ms": samples[max(0, int(len(samples) * 0.95) - 1)] * 1000}
+
+
+def bench(n: int = 50, concurrency: int = 8) -> Dict[str, Dict]:
+    from config import get_mock_model
+    from model._mock_server import MockLLMServer
+    from rag._bench import _docs, mock_store
+    from tools import get_tools_list
+    server = MockLLMServer(port=0, ttft=0.01, tokens_per_s=2000, dim=64).start()
+    llm_cfg = get_mock_model(server.url)
+    tools = get_tools_list(["get_current_time"])
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            vb = mock_store(server.url, tmp, _docs(20))
+            # agent会把回复打印到stdout
+            with contextlib.redirect_stdout(io.StringIO()):
+                results["fncall_agent"] = _run(lambda: FnCallAgent(llm_cfg, "bench", tools), n, concurrency)
+                results["rag_agent"] = _run(lambda: RagAgent(llm_cfg, "bench", tools, vb), n, concurrency)
+        results["mock_server"] = dict(server.stats)
+    finally:
+        server.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    for name, result in bench(int(sys.argv[1]) if len(sys.argv) > 1 else 50).items():
+        print(f"{name}: " + " ".join(f"{key} {value:.1f}" if isinstance(value, float) else f"{key} {value}"
+                                     for key, value in result.items()))
@@ -1,10 +1,11 @@
+import json
 from time import time
 
-from model import Messages,OpenaiLLM
+from model import Message,Messages,OpenaiLLM
 from ._base import BaseAgent
 from dataclasses import dataclass
 from typing import Dict, List, Any, Optional
-from utils import parse_json_resp
+from utils import parse_json_resp,JsonStreamParser
 
 @dataclass
 class Share:
@@ -54,11 +55,27 @@ class Control(BaseAgent):
         while True:
             self.messages.add_user_msg(self.enhanced_prompt.format(prompt=prompt,context=str(self._context)))
             resp=self.llm.chat(self.messages,stream=True)
-            self._format_resp(resp)
+            self._stream_resp(resp)
             task=self._parser_resp(self.last_msg().content)
             if task.agent_id==-1:
                 break
             self._exec_agent(task)
+    def _stream_resp(self,resp):
+        """边生成边解析 agent_id和prompt一完整就停止生成 不等待reasoning等其余字段"""
+        parser=JsonStreamParser()
+        for msg in resp:
+            if msg.reasoning_content:
+                print(msg.reasoning_content,end="",flush=True)
+            if msg.content:
+                print(msg.content,end="",flush=True)
+                parser.feed(msg.content)
+                if "agent_id" in parser.fields and "prompt" in parser.fields:
+                    resp.close()
+                    break
+        if parser.fields.keys()>={"agent_id","prompt"}:
+            # 提前停止时历史中只有不完整的回复 替换为已解析出的字段
+            last=self.last_msg()
+            self.messages.replace(-1,Message.assistant(last.id,last.created,content=json.dumps(parser.fields,ensure_ascii=False)))
     def _parser_resp(self,resp:str):
         data=parse_json_resp(resp)
         print(type(data))
@@ -1,14 +1,18 @@
 from rag import(
     TiktokenTokenizer,
     Parser,
-    VectorStore
+    VectorStore,
+    VectorStoreClient
 )
 from model import OpenaiLLM
 from config import get_siliconflow_model
 from ._base import BaseAgent
-from typing import Optional,List,Dict
+from typing import Optional,List,Dict,Union
 
-def get_vb():
+def get_vb(server_url:Optional[str]=None)->Union[VectorStore,VectorStoreClient]:
+    # 指定server_url时连接共享的向量库服务 不在本进程加载索引
+    if server_url:
+        return VectorStoreClient(server_url)
     dim=1024*4
     chunk_size=512*4
     leap_size=128
@@ -19,12 +23,12 @@ def get_vb():
     vb=VectorStore(dim=dim,llm=llm,tokenizer=tokenizer,chunk_size=chunk_size,leap_size=leap_size)
     return vb
 
-def vb_insert(vb:VectorStore,file_path:str):
+def vb_insert(vb:Union[VectorStore,VectorStoreClient],file_path:str):
     vb.add_doc(Parser.parser(file_path))
 
 
 class RagAgent(BaseAgent):
-    def __init__(self, llm_cfg, system_prompt = None,tools:Optional[List[Dict]]=None,vb:VectorStore=None):
+    def __init__(self, llm_cfg, system_prompt = None,tools:Optional[List[Dict]]=None,vb:Union[VectorStore,VectorStoreClient]=None):
         super().__init__(llm_cfg, system_prompt)
         self.tools=tools
         self.vb=vb
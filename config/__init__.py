@@ -1,7 +1,8 @@
-from .llm import get_ali_model,get_ark_model,get_siliconflow_model
+from .llm import get_ali_model,get_ark_model,get_siliconflow_model,get_mock_model
 
 all=[
     get_ali_model,
     get_ark_model,
     get_siliconflow_model,
+    get_mock_model,
 ]
\ No newline at end of file
@@ -1,6 +1,6 @@
 import os
 
-def get_model(api_key,base_url,model,embedding_model=None,rerank_model=None):
+def get_model(api_key,base_url,model,embedding_model=None,rerank_model=None,limit_cfg=None,cache_cfg=None,context_cfg=None):
     llm_config={
         "client_cfg": {
             "api_key": api_key,
@@ -14,37 +14,49 @@ def get_model(api_key,base_url,model,embedding_model=None,rerank_model=None):
             },
         'embedding_cfg':{
             "model": embedding_model,
-            "encoding_format":"float",
+            # base64比JSON浮点数组小且解码快 见model/_openai.py:decode_embeddings
+            "encoding_format":"base64",
         },
         "rerank_cfg":{
             'model':rerank_model
-        }
+        },
+        # 客户端限流 见model/_limiter.py 为空时不限流
+        # 需要时按账号的实际配额传入 如{"rpm":..,"tpm":..,"max_concurrency":..} 智谱按并发数限制 只需max_concurrency
+        "limit_cfg":limit_cfg or {},
+        "cache_cfg":cache_cfg or {},
+        # 按token预算压缩历史 见model/_context.py 为空时不压缩
+        "context_cfg":context_cfg or {},
     }
     return llm_config
-def get_ali_model():
+def get_ali_model(limit_cfg=None):
     api_key =os.getenv("DASHSCOPE_API_KEY") 
     base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
     model ="qwen-plus-latest" 
-    return get_model(api_key,base_url,model)
+    return get_model(api_key,base_url,model,limit_cfg=limit_cfg)
    
-def get_siliconflow_model():
+def get_siliconflow_model(limit_cfg=None):
     api_key=os.getenv("siliconflow_api_key")
     base_url='https://api.siliconflow.cn/v1'
     model="Qwen/Qwen3-235B-A22B-Instruct-2507"#'moonshotai/Kimi-K2-Instruct' #工具调用模型kimi有点偷工减料
     embedding_model="Qwen/Qwen3-Embedding-8B"
     rerank_model="Qwen/Qwen3-Reranker-8B"
-    return get_model(api_key,base_url,model,embedding_model,rerank_model)
+    return get_model(api_key,base_url,model,embedding_model,rerank_model,limit_cfg)
 
-def get_ark_model():
+def get_ark_model(limit_cfg=None):
     api_key=os.getenv("ark_api_key")
     base_url = "https://ark.cn-beijing.volces.com/api/v3"
     model ="kimi-k2-250711"
     embedding_model="doubao-embedding-large-text-250515"
-    return get_model(api_key,base_url,model,embedding_model)
+    return get_model(api_key,base_url,model,embedding_model,limit_cfg=limit_cfg)
 
 
-def get_zhipuai_model():
+def get_zhipuai_model(limit_cfg=None):
     api_key =os.getenv("zhipuai")
     base_url = "https://open.bigmodel.cn/api/paas/v4"
     model = "GLM-4-Air-250414"#"GLM-4-Flash-250414"
-    return get_model(api_key,base_url,model)
+    return get_model(api_key,base_url,model,limit_cfg=limit_cfg)
+
+
+def get_mock_model(base_url:str="http://127.0.0.1:8766/v1"):
+    """本地mock服务 python -m model._mock_server 用于压测和基准 不需要真实的key"""
+    return get_model("mock",base_url,"mock-chat","mock-embedding","mock-rerank")
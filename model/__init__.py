@@ -1,13 +1,35 @@
 from ._openai import OpenaiLLM
+from ._router import RouterLLM
 from .base import BaseLLM
-from .msg import Message, Messages
-from .func import execute_func,func_call
+from .msg import Message, Messages, to_wire
+from .func import execute_func,aexecute_func,func_call,afunc_call
+from ._request_llm import get_request_stats
+from ._cache import ResponseCache,get_response_cache
+from ._metrics import MetricsRegistry,get_metrics
+from ._context import ContextManager
+from ._embed_batch import EmbeddingBatcher
+from ._batch import BatchRunner
+from ._tool_executor import ToolExecutor,get_tool_executor
 
 __all__ = [
     "OpenaiLLM",
+    "RouterLLM",
     "BaseLLM",
     "Message",
     "Messages",
+    "to_wire",
     "execute_func",
+    "aexecute_func",
     "func_call",
+    "afunc_call",
+    "get_request_stats",
+    "ResponseCache",
+    "get_response_cache",
+    "MetricsRegistry",
+    "get_metrics",
+    "ContextManager",
+    "EmbeddingBatcher",
+    "BatchRunner",
+    "ToolExecutor",
+    "get_tool_executor",
 ]
\ No newline at end of file
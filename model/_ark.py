@@ -3,32 +3,37 @@ Ark LLM 模型的实现
 实现了Ark的聊天、嵌入、多模态嵌入、机器人聊天、图像生成等功能
 """
 from typing import Callable, Dict, List, Union
-from .base import OpenaiLLM,execute_func
+from ._openai import OpenaiLLM
+from .func import execute_func
 from .msg import Message
+from ._client import get_client
 from volcenginesdkarkruntime import Ark
 class ArkLLM(OpenaiLLM):
     def __init__(self, llm_config: Dict | None = None):
         super().__init__(llm_config)
         def _chat(*args,**kwargs):
-            client=Ark(**self.client_cfg)
+            client=self.client()
             return client.chat.completions.create(*args,**{**self.generation_cfg,**kwargs})
         def _embed(*args,**kwargs):
-            client=Ark(**self.client_cfg)
+            client=self.client()
             return client.embeddings.create(*args,**{**self.embedding_cfg,**kwargs})
         def _multi_embed(*args,**kwargs):
-            client=Ark(**self.client_cfg)
+            client=self.client()
             return client.multimodal_embeddings.create(*args,**kwargs)
         def _bot_chat(*args,**kwargs):
-            client=Ark(**self.client_cfg)
+            client=self.client()
             return client.bot_chat.completions.create(*args,**kwargs)
         def _img_gen(*args,**kwargs):
-            client=Ark(**self.client_cfg)
+            client=self.client()
             return client.images.generate(*args,**kwargs)
-        self._chat = _chat
-        self._embed=_embed
+        self._chat = self._limited(_chat,self.chat_cfg)
+        self._embed=self._limited(_embed,self.embedding_cfg)
         self._multi_embed=_multi_embed
         self._bot_chat=_bot_chat
         self._img_gen=_img_gen
+
+    def client(self)->Ark:
+        return get_client(Ark,self.client_cfg,self.pool_cfg)
         
     def embed(self, *args,**kwargs):
         """
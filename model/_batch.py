@@ -0,0 +1,239 @@
+"""
+离线批量推理
+读取JSONL请求 有界并发执行(限流由llm的limit_cfg负责) 失败按退避重试
+结果边完成边写入JSONL 完成的id记录在checkpoint中 中断后重新运行会跳过已完成的请求
+也可以使用供应商的/batches接口(OpenAI兼容)
+
+输入每行为OpenAI batch格式 {"custom_id":..,"url":"/v1/chat/completions","body":{...}}
+或简写 {"id":..,"messages":[...],...} url缺省为chat
+输出每行为 {"custom_id":..,"response":{"status_code":200,"body":{...}},"error":null}
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from ._openai import OpenaiLLM
+from ._limiter import error_status, is_retryable
+
+chat_url = "/v1/chat/completions"
+embeddings_url = "/v1/embeddings"
+
+
+def _read_requests(input_path: str) -> Iterator[Tuple[str, str, Dict]]:
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if "body" in data:
+                yield str(data.get("custom_id", line_no)), data.get("url", chat_url), data["body"]
+            else:
+                custom_id = str(data.pop("custom_id", data.pop("id", line_no)))
+                yield custom_id, data.pop("url", chat_url), data
+
+
+def _dump(resp) -> Dict:
+    return resp.model_dump() if hasattr(resp, "model_dump") else resp
+
+
+class BatchRunner:
+    def __init__(self, llm: OpenaiLLM, concurrency: int = 16, retries: int = 3, backoff: float = 1.0):
+        """
+        concurrency: 同时在途的请求数 实际速率还受llm的limit_cfg限制
+        retries/backoff: 429/5xx/网络错误的重试次数和指数退避的基数(秒)
+        """
+        self.llm = llm
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = {"submitted": 0, "succeeded": 0, "failed": 0, "skipped": 0, "retries": 0, "elapsed": 0.0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _checkpoint_path(output_path: str) -> str:
+        return f"{output_path}.ckpt"
+
+    def completed_ids(self, output_path: str) -> Set[str]:
+        path = self._checkpoint_path(output_path)
+        if not os.path.exists(path):
+            return set()
+        with open(path, "r", encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def _call(self, url: str, body: Dict):
+        if url.endswith("/embeddings"):
+            return self.llm._embed(**body)
+        if url.endswith("/completions") and not url.endswith("/chat/completions"):
+            return self.llm._completion(**body)
+        return self.llm._chat(**{**body, "stream": False})
+
+    def _run_one(self, custom_id: str, url: str, body: Dict) -> Dict:
+        for attempt in range(self.retries + 1):
+            try:
+                resp = self._call(url, body)
+                return {"custom_id": custom_id, "response": {"status_code": 200, "body": _dump(resp)}, "error": None}
+            except Exception as e:
+                if attempt == self.retries or not is_retryable(e):
+                    status = error_status(e)
+                    return {"custom_id": custom_id, "response": {"status_code": status, "body": None} if status else None,
+                            "error": {"type": type(e).__name__, "message": str(e)}}
+                with self._lock:
+                    self.stats["retries"] += 1
+                time.sleep(self.backoff * (2 ** attempt))
+
+    def run(self, input_path: str, output_path: str, resume: bool = True) -> Dict:
+        """
+        resume为True时跳过checkpoint中已完成的请求并追加写入 否则覆盖输出
+        失败的请求写入error但不记入checkpoint 重新运行时会再次尝试
+        """
+        start = time.monotonic()
+        done = self.completed_ids(output_path) if resume else set()
+        mode = "a" if resume else "w"
+        # 有界提交 输入文件不必整体读入内存
+        slots = threading.Semaphore(self.concurrency * 2)
+        with open(output_path, mode, encoding="utf-8") as out, \
+                open(self._checkpoint_path(output_path), mode, encoding="utf-8") as ckpt, \
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch") as executor:
+
+            def _task(custom_id: str, url: str, body: Dict):
+                try:
+                    result = self._run_one(custom_id, url, body)
+                    line = json.dumps(result, ensure_ascii=False, default=str)
+                    with self._lock:
+                        out.write(line + "\n")
+                        out.flush()
+                        if result["error"] is None:
+                            # 结果落盘之后再记checkpoint 中断时最多重复一条
+                            ckpt.write(custom_id + "\n")
+                            ckpt.flush()
+                            self.stats["succeeded"] += 1
+                        else:
+                            self.stats["failed"] += 1
+                finally:
+                    slots.release()
+
+            for custom_id, url, body in _read_requests(input_path):
+                if custom_id in done:
+                    self.stats["skipped"] += 1
+                    continue
+                slots.acquire()
+                self.stats["submitted"] += 1
+                executor.submit(_task, custom_id, url, body)
+        self.stats["elapsed"] = time.monotonic() - start
+        return self.stats
+
+    def run_provider(self, input_path: str, output_path: str, poll_interval: float = 30,
+                     completion_window: str = "24h", resume: bool = True) -> Dict:
+        """
+        使用供应商的/files+/batches接口 适合不要求时效的大批量任务 通常有价格优惠
+        一个batch只能对应一个endpoint 输入中混有chat/embeddings等请求时按url拆成多个batch分别提交
+        请求体中没有model时补上llm的chat_cfg/embedding_cfg中的模型
+        """
+        client = self.llm.client()
+        done = self.completed_ids(output_path) if resume else set()
+        groups: Dict[str, List[str]] = {}
+        for custom_id, url, body in _read_requests(input_path):
+            if custom_id in done:
+                self.stats["skipped"] += 1
+                continue
+            cfg = self.llm.embedding_cfg if url.endswith("/embeddings") else self.llm.chat_cfg
+            groups.setdefault(url, []).append(json.dumps({"custom_id": custom_id, "method": "POST", "url": url,
+                                                          "body": {**cfg, **body}}, ensure_ascii=False))
+        if not groups:
+            return self.stats
+        start = time.monotonic()
+        batches = []
+        for endpoint, lines in groups.items():
+            self.stats["submitted"] += len(lines)
+            with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False, encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            try:
+                with open(f.name, "rb") as fp:
+                    file = client.files.create(file=fp, purpose="batch")
+            finally:
+                os.remove(f.name)
+            batches.append(client.batches.create(input_file_id=file.id, endpoint=endpoint,
+                                                 completion_window=completion_window))
+        terminal = ("completed", "failed", "expired", "cancelled")
+        while any(batch.status not in terminal for batch in batches):
+            time.sleep(poll_interval)
+            batches = [batch if batch.status in terminal else client.batches.retrieve(batch.id) for batch in batches]
+        self.stats["elapsed"] = time.monotonic() - start
+        self.stats["batches"] = {batch.endpoint: {"id": batch.id, "status": batch.status} for batch in batches}
+        mode = "a" if resume else "w"
+        with open(output_path, mode, encoding="utf-8") as out, open(self._checkpoint_path(output_path), mode, encoding="utf-8") as ckpt:
+            for file_id in [i for batch in batches for i in (batch.output_file_id, batch.error_file_id)]:
+                if not file_id:
+                    continue
+                for line in client.files.content(file_id).text.splitlines():
+                    if not line.strip():
+                        continue
+                    result = json.loads(line)
+                    out.write(line + "\n")
+                    response = result.get("response") or {}
+                    if not result.get("error") and response.get("status_code") == 200:
+                        ckpt.write(str(result["custom_id"]) + "\n")
+                        self.stats["succeeded"] += 1
+                    else:
+                        self.stats["failed"] += 1
+        return self.stats
+
+
+def _bench(n: int, concurrency: int, throttle_rate: float) -> Dict[str, Dict]:
+    """
+    对本地mock服务跑一遍run和run_provider 输入混有chat和embeddings
+    run先只跑前一半再跑全部 检查续跑时跳过已完成的请求 mock按throttle_rate返回429 检查重试后全部完成
+    run_provider中被429的请求下一轮续跑时重新提交
+    """
+    from config import get_mock_model
+    from ._mock_server import MockLLMServer
+    server = MockLLMServer(port=0, ttft=0.01, tokens_per_s=2000, throttle_rate=throttle_rate, seed=0).start()
+    llm = OpenaiLLM(get_mock_model(server.url))
+    requests_ = [{"custom_id": f"chat-{i}", "messages": [{"role": "user", "content": f"question {i}"}]} for i in range(n)]
+    requests_ += [{"custom_id": f"embed-{i}", "url": embeddings_url, "input": [f"text {i}"]} for i in range(n // 4)]
+    ids = {r["custom_id"] for r in requests_}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        half, full = os.path.join(tmp, "half.jsonl"), os.path.join(tmp, "full.jsonl")
+        for path, items in ((half, requests_[:len(requests_) // 2]), (full, requests_)):
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(r) + "\n" for r in items)
+
+        output = os.path.join(tmp, "run.jsonl")
+        first = BatchRunner(llm, concurrency=concurrency, retries=8, backoff=0.01).run(half, output)
+        second = BatchRunner(llm, concurrency=concurrency, retries=8, backoff=0.01).run(full, output)
+        assert second["skipped"] == first["succeeded"], (first, second)
+        assert BatchRunner(llm).completed_ids(output) == ids
+        if throttle_rate:
+            assert first["retries"] + second["retries"] > 0 or server.stats["throttled"] > 0
+        results["run"] = {"first": first, "resume": second}
+
+        output = os.path.join(tmp, "provider.jsonl")
+        passes = []
+        for _ in range(10):
+            stats = BatchRunner(llm).run_provider(full, output, poll_interval=0.05)
+            passes.append(stats)
+            if not stats["failed"]:
+                break
+        assert len(passes[0]["batches"]) == 2, passes[0]
+        assert BatchRunner(llm).completed_ids(output) == ids
+        results["run_provider"] = {"passes": passes}
+    results["server"] = dict(server.stats)
+    server.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    # python -m model._batch requests.jsonl results.jsonl [concurrency]
+    # python -m model._batch --bench [N]  对本地mock服务检查续跑/429重试/run_provider
+    import sys
+    if sys.argv[1] == "--bench":
+        for name, result in _bench(int(sys.argv[2]) if len(sys.argv) > 2 else 200, 16, 0.2).items():
+            print(name, json.dumps(result, default=str))
+        sys.exit(0)
+    from config import get_siliconflow_model
+    runner = BatchRunner(OpenaiLLM(get_siliconflow_model()), concurrency=int(sys.argv[3]) if len(sys.argv) > 3 else 16)
+    print(runner.run(sys.argv[1], sys.argv[2]))
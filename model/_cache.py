@@ -0,0 +1,181 @@
+"""
+LLM响应的磁盘缓存(录制/回放)
+key为(供应商,base_url,模型,生成参数,消息,工具)的规范化JSON的sha256 同名模型在不同供应商之间不会串用
+流式响应按原始的chunk序列保存 回放时保持原来的分块
+mode:
+    record: 命中直接回放 未命中请求后写入
+    replay: 只读 命中回放 未命中正常请求但不写入
+    bypass: 不读不写
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional
+
+default_cache_path = "storage/llm_cache"
+default_max_bytes = 512 * 1024 * 1024
+
+
+class _Record:
+    """把保存的dict还原成可以按属性访问的对象 兼容SDK响应的用法"""
+    __slots__ = ("_data",)
+
+    def __init__(self, data: Dict):
+        self._data = data
+
+    def __getattr__(self, name: str):
+        return _wrap(self._data.get(name))
+
+    def model_dump(self, *args, **kwargs) -> Dict:
+        return self._data
+
+
+def _wrap(value: Any):
+    if isinstance(value, dict):
+        return _Record(value)
+    if isinstance(value, list):
+        return [_wrap(v) for v in value]
+    return value
+
+
+def _dump(obj: Any) -> Any:
+    return obj.model_dump() if hasattr(obj, "model_dump") else obj
+
+
+class ResponseCache:
+    def __init__(self, path: str = default_cache_path, mode: str = "record", max_bytes: int = default_max_bytes):
+        if mode not in ("record", "replay", "bypass"):
+            raise ValueError(f"unknown cache mode {mode}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        self._size = sum(os.path.getsize(f) for f in self._files())
+
+    def _files(self):
+        for root, _, names in os.walk(self.path):
+            for name in names:
+                if name.endswith(".json"):
+                    yield os.path.join(root, name)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    @staticmethod
+    def key(params: Dict[str, Any]) -> str:
+        # Messages.to_wire已经算好了整个历史的hash 不必再序列化一遍
+        digest = getattr(params.get("messages"), "digest", None)
+        if digest:
+            params = {**params, "messages": digest}
+        data = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        file = self._file(key)
+        try:
+            with open(file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        # 用mtime记录最近使用 淘汰时按mtime从旧到新删除
+        try:
+            os.utime(file)
+        except OSError:
+            # 只读目录 或者读取后刚被其它进程淘汰 不影响这次命中
+            pass
+        with self._lock:
+            self.stats["hits"] += 1
+        return data
+
+    def put(self, key: str, data: Dict):
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        payload = json.dumps(data, ensure_ascii=False)
+        tmp = f"{file}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(payload)
+        old = os.path.getsize(file) if os.path.exists(file) else 0
+        os.replace(tmp, file)
+        with self._lock:
+            self.stats["writes"] += 1
+            self._size += os.path.getsize(file) - old
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # 淘汰到容量的90% 避免每次写入都扫描目录
+        # 多个进程共用缓存目录时 文件可能已被别的进程淘汰
+        mtimes = {}
+        for file in self._files():
+            try:
+                mtimes[file] = os.path.getmtime(file)
+            except FileNotFoundError:
+                pass
+        for file in sorted(mtimes, key=mtimes.get):
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                size = os.path.getsize(file)
+                os.remove(file)
+            except FileNotFoundError:
+                continue
+            self._size -= size
+            self.stats["evictions"] += 1
+
+    def _record_stream(self, key: str, resp) -> Iterator:
+        chunks = []
+        try:
+            for chunk in resp:
+                chunks.append(_dump(chunk))
+                yield chunk
+            # 只保存完整读完的流
+            self.put(key, {"stream": True, "chunks": chunks})
+        finally:
+            # 调用方提前停止迭代时关闭底层连接 不再继续生成
+            if hasattr(resp, "close"):
+                resp.close()
+
+    def wrap(self, fn: Callable, cfg: Dict, scope: Optional[Dict] = None) -> Callable:
+        """
+        包装请求函数 cfg为会合并进请求参数的默认配置(如chat_cfg) 参与key的计算
+        scope: 请求参数之外区分响应来源的信息 如{"provider":..,"base_url":..} 也参与key的计算
+        """
+        def _call(*args, **kwargs):
+            if self.mode == "bypass":
+                return fn(*args, **kwargs)
+            params = {**cfg, **kwargs}
+            key = self.key({**params, "_scope": scope} if scope else params)
+            data = self.get(key)
+            if data is not None:
+                if data.get("stream"):
+                    return iter([_Record(chunk) for chunk in data["chunks"]])
+                return _Record(data["response"])
+            resp = fn(*args, **kwargs)
+            if self.mode != "record":
+                return resp
+            if params.get("stream", False):
+                return self._record_stream(key, resp)
+            self.put(key, {"stream": False, "response": _dump(resp)})
+            return resp
+        return _call
+
+
+_caches: Dict[tuple, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(cache_cfg: Optional[Dict]) -> Optional[ResponseCache]:
+    """cache_cfg: {"path":..,"mode":"record"|"replay"|"bypass","max_bytes":..} 为空时不缓存"""
+    if not cache_cfg:
+        return None
+    cfg = {"path": default_cache_path, "mode": "record", "max_bytes": default_max_bytes, **cache_cfg}
+    key = (os.path.abspath(cfg["path"]), cfg["mode"], cfg["max_bytes"])
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ResponseCache(**cfg)
+        return _caches[key]
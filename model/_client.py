@@ -0,0 +1,77 @@
+"""
+长连接的SDK客户端池
+每个(provider,base_url,api_key)只创建一个客户端 所有agent共享同一个httpx连接池
+避免每次请求都重新建立TCP/TLS连接
+异步客户端的连接绑定在创建它的事件循环上 按事件循环分别缓存 循环被回收时一起释放
+"""
+import asyncio
+import atexit
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+default_pool_cfg = {
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 60,
+    "http2": False,
+    "connect_timeout": 10,
+    "timeout": 600,
+}
+_clients: Dict[tuple, Any] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, Any]]" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _http_client(pool_cfg: Dict, is_async: bool = False):
+    import httpx
+    cfg = {**default_pool_cfg, **pool_cfg}
+    limits = httpx.Limits(
+        max_connections=cfg["max_connections"],
+        max_keepalive_connections=cfg["max_keepalive_connections"],
+        keepalive_expiry=cfg["keepalive_expiry"],
+    )
+    timeout = httpx.Timeout(cfg["timeout"], connect=cfg["connect_timeout"])
+    # http2需要安装h2: pip install httpx[http2]
+    cls = httpx.AsyncClient if is_async else httpx.Client
+    return cls(limits=limits, timeout=timeout, http2=cfg["http2"])
+
+
+def get_client(provider: type, client_cfg: Dict, pool_cfg: Optional[Dict] = None, is_async: bool = False):
+    """
+    provider: OpenAI/AsyncOpenAI/Ark/ZhipuAI等接受http_client参数的SDK客户端类
+    同一个key的连接池配置以第一次创建时为准 单次请求的超时可以在调用时传timeout覆盖
+    """
+    key = (f"{provider.__module__}.{provider.__qualname__}", client_cfg.get("base_url"), client_cfg.get("api_key"), is_async)
+    clients = _clients
+    if is_async:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中创建时无法确定会在哪个循环使用 不缓存
+            return provider(**client_cfg, http_client=_http_client(pool_cfg or {}, is_async))
+        with _lock:
+            clients = _async_clients.setdefault(loop, {})
+    client = clients.get(key)
+    if client is None:
+        with _lock:
+            client = clients.get(key)
+            if client is None:
+                client = provider(**client_cfg, http_client=_http_client(pool_cfg or {}, is_async))
+                clients[key] = client
+    return client
+
+
+def close_clients():
+    with _lock:
+        for client in list(_clients.values()):
+            try:
+                client.close()
+            except Exception:
+                pass
+        _clients.clear()
+        # 异步客户端需要在事件循环中关闭 进程退出时由系统回收
+        _async_clients.clear()
+
+
+atexit.register(close_clients)
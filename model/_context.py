@@ -0,0 +1,182 @@
+"""
+按token预算管理上下文
+历史超过max_tokens时按顺序执行策略 原地压缩到low_water*max_tokens以下
+最近的keep_recent条消息(向前扩展到一条非tool消息)不会被改动 tool_call与tool_result始终成对保留
+一条prompt之后连续多轮工具调用的会话(FnCallAgent等)同样会被压缩
+策略:
+    truncate_tool_results: 截断过大的工具结果 只保留头尾
+    drop_tool_outputs: 从最旧的开始把工具结果替换为占位符
+    summarize: 把较早的对话用模型总结为一条消息(需要summarizer)
+    drop_turns: 从最旧的开始按轮删除 保证最终不超预算
+"""
+from typing import Callable, Dict, List, Optional
+from .msg import Message, Messages
+
+default_context_cfg = {
+    "max_tokens": 32000,
+    "low_water": 0.7,
+    "keep_recent": 6,
+    "tool_result_tokens": 2000,
+    "policies": ["truncate_tool_results", "drop_tool_outputs", "drop_turns"],
+}
+dropped_placeholder = "[tool output removed to save context]"
+summary_prefix = "[summary of earlier conversation]\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """与限流器一致的粗略估计 约2个字符一个token 需要准确计数时传入tokenizer"""
+    return len(text) // 2 + 1
+
+
+class ContextManager:
+    def __init__(self,
+                 max_tokens: int = default_context_cfg["max_tokens"],
+                 low_water: float = default_context_cfg["low_water"],
+                 keep_recent: int = default_context_cfg["keep_recent"],
+                 tool_result_tokens: int = default_context_cfg["tool_result_tokens"],
+                 policies: Optional[List] = None,
+                 counter: Callable[[str], int] = estimate_tokens):
+        """
+        max_tokens: 请求中历史消息的token预算
+        low_water: 超出预算时压缩到max_tokens*low_water 避免每轮都触发压缩
+        keep_recent: 不做改动的最近消息数
+        tool_result_tokens: truncate_tool_results保留的最大token数
+        policies: 策略名或可调用对象policy(manager,messages,target,summarizer) 按顺序执行直到低于target
+        counter: 文本的token计数函数
+        """
+        self.max_tokens = max_tokens
+        self.low_water = low_water
+        self.keep_recent = keep_recent
+        self.tool_result_tokens = tool_result_tokens
+        self.policies = policies or default_context_cfg["policies"]
+        self.counter = counter
+        self.stats = {"compactions": 0, "truncated": 0, "dropped": 0, "summarized": 0, "removed": 0}
+
+    @classmethod
+    def from_cfg(cls, context_cfg: Dict, model: Optional[str] = None) -> "ContextManager":
+        """context_cfg: default_context_cfg的字段 以及按模型覆盖的{"models":{"<model>":{...}}}"""
+        cfg = {**default_context_cfg, **{k: v for k, v in context_cfg.items() if k != "models"}}
+        cfg.update(context_cfg.get("models", {}).get(model, {}))
+        return cls(**cfg)
+
+    def total(self, messages: Messages) -> int:
+        return sum(messages.token_counts(self.counter))
+
+    def _recent_start(self, messages: Messages) -> int:
+        """
+        受保护的最近消息的起点 向前对齐到非tool消息(user或发起tool_calls的assistant)
+        tool_result总是跟在对应的tool_calls之后 这样不会拆开它们
+        """
+        start = max(messages.system_prompt_index, len(messages) - self.keep_recent)
+        while start > messages.system_prompt_index and messages[start].role == "tool":
+            start -= 1
+        return start
+
+    def fit(self, messages: Messages, summarizer: Optional[Callable[[List[Message]], str]] = None) -> bool:
+        """超出预算时原地压缩 返回是否进行了压缩"""
+        if self.total(messages) <= self.max_tokens:
+            return False
+        target = int(self.max_tokens * self.low_water)
+        for policy in self.policies:
+            fn = _policies[policy] if isinstance(policy, str) else policy
+            fn(self, messages, target, summarizer)
+            if self.total(messages) <= target:
+                break
+        self.stats["compactions"] += 1
+        return True
+
+
+def truncate_tool_results(manager: ContextManager, messages: Messages, target: int, summarizer=None):
+    counts = messages.token_counts(manager.counter)
+    limit = manager.tool_result_tokens
+    for index in range(messages.system_prompt_index, manager._recent_start(messages)):
+        msg = messages[index]
+        if msg.role != "tool" or counts[index] <= limit or not isinstance(msg.content, str):
+            continue
+        # 按token比例估算保留的字符数 头尾各一半
+        keep = max(1, len(msg.content) * limit // counts[index] // 2)
+        content = f"{msg.content[:keep]}\n...[truncated {len(msg.content) - 2 * keep} chars]...\n{msg.content[-keep:]}"
+        messages.replace(index, Message.tool_result(msg.tool_call_id, content))
+        manager.stats["truncated"] += 1
+        counts = messages.token_counts(manager.counter)
+
+
+def drop_tool_outputs(manager: ContextManager, messages: Messages, target: int, summarizer=None):
+    total = manager.total(messages)
+    for index in range(messages.system_prompt_index, manager._recent_start(messages)):
+        if total <= target:
+            return
+        msg = messages[index]
+        if msg.role != "tool" or msg.content == dropped_placeholder:
+            continue
+        before = messages.token_counts(manager.counter)[index]
+        # 保留消息本身 只替换内容 tool_call_id仍然与前面的tool_calls对应
+        messages.replace(index, Message.tool_result(msg.tool_call_id, dropped_placeholder))
+        total -= before - messages.token_counts(manager.counter)[index]
+        manager.stats["dropped"] += 1
+
+
+def summarize(manager: ContextManager, messages: Messages, target: int, summarizer=None):
+    if summarizer is None:
+        return
+    start, end = messages.system_prompt_index, manager._recent_start(messages)
+    # 已有的摘要也一起重新总结
+    old = messages[start:end]
+    if len(old) < 2:
+        return
+    summary = summarizer(old)
+    messages.replace(start, Message.assistant("-1", old[-1].created, content=summary_prefix + summary))
+    messages.remove(start + 1, end)
+    manager.stats["summarized"] += len(old)
+
+
+def drop_turns(manager: ContextManager, messages: Messages, target: int, summarizer=None):
+    """
+    按组(一条非tool消息及其后的tool结果)删除最旧的对话
+    可删除范围内只有一条user消息时保留它 单条prompt的工具循环不会丢掉任务本身
+    """
+    start, end = messages.system_prompt_index, manager._recent_start(messages)
+    if start < end and messages[start].role == "user" and \
+            not any(messages[i].role == "user" for i in range(start + 1, len(messages))):
+        start += 1
+    counts = messages.token_counts(manager.counter)
+    total = sum(counts)
+    cut = start
+    while cut < end and total > target:
+        total -= counts[cut]
+        cut += 1
+        while cut < end and messages[cut].role == "tool":
+            total -= counts[cut]
+            cut += 1
+    if cut > start:
+        messages.remove(start, cut)
+        manager.stats["removed"] += cut - start
+
+
+_policies: Dict[str, Callable] = {
+    "truncate_tool_results": truncate_tool_results,
+    "drop_tool_outputs": drop_tool_outputs,
+    "summarize": summarize,
+    "drop_turns": drop_turns,
+}
+
+
+if __name__ == "__main__":
+    # 检查单条prompt之后连续N轮工具调用的会话能保持在预算内 且tool_call/tool_result成对
+    # python -m model._context
+    manager = ContextManager(max_tokens=4000, keep_recent=4, tool_result_tokens=200)
+    messages = Messages(system_prompt="You are a helpful assistant.")
+    messages.add_user_msg("refactor the project")
+    peak = 0
+    for turn in range(200):
+        call_id = f"call_{turn}"
+        messages.append(Message.tool_call_response(str(turn), "0", "", [
+            {"id": call_id, "function": {"name": "read_file", "arguments": '{"file_path": "a.py"}'}}]))
+        messages.append(Message.tool_result(call_id, "x" * 3000))
+        manager.fit(messages)
+        peak = max(peak, manager.total(messages))
+        assert peak <= manager.max_tokens, (turn, peak)
+        ids = {call["id"] for msg in messages if msg.tool_calls for call in msg.tool_calls}
+        assert all(msg.tool_call_id in ids for msg in messages if msg.role == "tool"), turn
+    assert any(msg.role == "user" for msg in messages)
+    print(f"200 tool turns: peak {peak} tokens (budget {manager.max_tokens}) stats {manager.stats}")
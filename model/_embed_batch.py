@@ -0,0 +1,132 @@
+"""
+embed请求的微批合并
+多个线程同时发起的embed在max_wait_ms内或凑满max_batch条后合并为一次请求 结果按原顺序分发给各个调用方
+同一批内重复的文本只embed一次 每个(base_url,model)共享一个合并器
+每次提交都带上调用方自己的embed函数 同一个函数的请求才会合并 不同实例的密钥/限流/统计互不混用
+合并的请求失败时逐个调用方重试 错误只返回给引起它的调用方
+"""
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+default_embed_batch_cfg = {
+    # 单次请求的最大条数 超过时拆成多次请求
+    "max_batch": 64,
+    "max_wait_ms": 5,
+    # 同时在途的批次数
+    "max_inflight": 4,
+}
+
+
+class EmbeddingBatcher:
+    def __init__(self, embed_func: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 max_batch: int = default_embed_batch_cfg["max_batch"],
+                 max_wait_ms: float = default_embed_batch_cfg["max_wait_ms"],
+                 max_inflight: int = default_embed_batch_cfg["max_inflight"]):
+        """embed_func: 默认的embed函数 接收文本列表 返回(len(texts),dim)的矩阵 submit时可以另外指定"""
+        self._embed_func = embed_func
+        self._max_batch = max_batch
+        self._max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="embed_batch")
+        self._inflight = threading.Semaphore(max_inflight)
+        self.stats = {"calls": 0, "texts": 0, "requests": 0, "deduped": 0, "split": 0}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str], embed_func: Optional[Callable[[List[str]], np.ndarray]] = None) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype='float32')
+        embed_func = embed_func or self._embed_func
+        if embed_func is None:
+            raise ValueError("embed_func is required")
+        future = Future()
+        self._queue.put((texts, future, embed_func))
+        return future.result()
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        while size < self._max_batch:
+            try:
+                item = self._queue.get(timeout=self._max_wait)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _loop(self):
+        while True:
+            # 在途批次达到上限时先等待 期间新的请求继续在队列中排队 下一批可以合并更多
+            self._inflight.acquire()
+            batch = self._collect()
+            self._executor.submit(self._run, batch)
+
+    def _embed(self, embed_func: Callable, items: List[tuple]):
+        # 去重后按max_batch切分请求
+        unique: Dict[str, int] = {}
+        for texts, _, _ in items:
+            for text in texts:
+                unique.setdefault(text, len(unique))
+        keys = list(unique)
+        parts = [embed_func(keys[i:i + self._max_batch]) for i in range(0, len(keys), self._max_batch)]
+        vectors = np.concatenate([np.asarray(part) for part in parts]) if len(parts) > 1 else np.asarray(parts[0])
+        total = sum(len(texts) for texts, _, _ in items)
+        with self._lock:
+            self.stats["calls"] += len(items)
+            self.stats["texts"] += total
+            self.stats["requests"] += len(parts)
+            self.stats["deduped"] += total - len(keys)
+        for texts, future, _ in items:
+            future.set_result(vectors[[unique[text] for text in texts]])
+
+    def _run(self, batch: List[tuple]):
+        try:
+            groups: Dict[Callable, List[tuple]] = {}
+            for item in batch:
+                groups.setdefault(item[2], []).append(item)
+            for embed_func, items in groups.items():
+                try:
+                    self._embed(embed_func, items)
+                except Exception as e:
+                    if len(items) == 1:
+                        items[0][1].set_exception(e)
+                        continue
+                    with self._lock:
+                        self.stats["split"] += 1
+                    for item in items:
+                        try:
+                            self._embed(embed_func, [item])
+                        except Exception as item_error:
+                            item[1].set_exception(item_error)
+        finally:
+            self._inflight.release()
+
+
+_batchers: Dict[tuple, EmbeddingBatcher] = {}
+_lock = threading.Lock()
+
+
+def get_embedding_batcher(base_url: Optional[str], model: Optional[str],
+                          embed_batch_cfg: Optional[Dict]) -> Optional[EmbeddingBatcher]:
+    """
+    embed_batch_cfg: {"max_batch":..,"max_wait_ms":..,"max_inflight":..,"models":{"<model>":{...}}}
+    同一个(base_url,model)的参数以第一次创建时为准 embed_batch_cfg为空时不合并
+    合并器不持有embed函数 调用方在submit时传入自己的
+    """
+    if not embed_batch_cfg:
+        return None
+    key = (base_url, model)
+    batcher = _batchers.get(key)
+    if batcher is None:
+        with _lock:
+            batcher = _batchers.get(key)
+            if batcher is None:
+                cfg = {**default_embed_batch_cfg, **{k: v for k, v in embed_batch_cfg.items() if k != "models"}}
+                cfg.update(embed_batch_cfg.get("models", {}).get(model, {}))
+                batcher = _batchers[key] = EmbeddingBatcher(**cfg)
+    return batcher
@@ -0,0 +1,206 @@
+"""
+客户端限流
+每个(base_url,model)一个限流器: 请求数和预估token数两个令牌桶 + AIMD自适应并发
+调用方按到达顺序排队 保证公平
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def wait_time(self, n: float) -> float:
+        self._refill()
+        n = min(n, self.capacity)
+        return 0.0 if self.tokens >= n else (n - self.tokens) / self.rate
+
+    def take(self, n: float):
+        self.tokens -= min(n, self.capacity)
+
+
+class RateLimiter:
+    def __init__(self,
+                 rpm: Optional[float] = None,
+                 tpm: Optional[float] = None,
+                 max_concurrency: int = 16,
+                 min_concurrency: int = 1,
+                 latency_target: Optional[float] = None):
+        """
+        rpm/tpm: 每分钟请求数/token数配额 None表示不限
+        max_concurrency/min_concurrency: 并发上下限 遇到429并发减半 正常返回时缓慢增加
+        latency_target: 请求耗时超过该值(秒)时也会小幅降低并发
+        """
+        self._requests = TokenBucket(rpm) if rpm else None
+        self._tokens = TokenBucket(tpm) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_target = latency_target
+        self.limit = float(max_concurrency)
+        self.inflight = 0
+        self._cond = threading.Condition()
+        self._queue: deque = deque()
+        self.stats = {"requests": 0, "throttled": 0, "errors": 0, "waited": 0.0}
+
+    def _try_acquire(self, ticket: object, tokens: float) -> Optional[float]:
+        """轮到ticket且有配额时占用并返回None 否则返回建议的等待秒数"""
+        if self._queue[0] is not ticket or self.inflight >= int(self.limit):
+            return 0.05
+        wait = max(
+            self._requests.wait_time(1) if self._requests else 0.0,
+            self._tokens.wait_time(tokens) if self._tokens else 0.0,
+        )
+        if wait > 0:
+            return wait
+        if self._requests:
+            self._requests.take(1)
+        if self._tokens:
+            self._tokens.take(tokens)
+        self._queue.popleft()
+        self.inflight += 1
+        self.stats["requests"] += 1
+        return None
+
+    def acquire(self, tokens: float = 0):
+        ticket = object()
+        start = time.monotonic()
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    wait = self._try_acquire(ticket, tokens)
+                    if wait is None:
+                        break
+                    self._cond.wait(wait)
+            except BaseException:
+                # 等待中被中断(如KeyboardInterrupt)时让出队首 否则后面的请求永远轮不到
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                self._cond.notify_all()
+                raise
+            self.stats["waited"] += time.monotonic() - start
+            self._cond.notify_all()
+
+    async def aacquire(self, tokens: float = 0):
+        ticket = object()
+        start = time.monotonic()
+        with self._cond:
+            self._queue.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_acquire(ticket, tokens)
+                    if wait is None:
+                        self.stats["waited"] += time.monotonic() - start
+                        self._cond.notify_all()
+                        return
+                await asyncio.sleep(min(wait, 0.05))
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                self._cond.notify_all()
+            raise
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False, error: bool = False):
+        with self._cond:
+            self.inflight -= 1
+            if throttled:
+                # 乘性减
+                self.stats["throttled"] += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+            elif error:
+                self.stats["errors"] += 1
+            elif self.latency_target and latency and latency > self.latency_target:
+                self.limit = max(self.min_concurrency, self.limit * 0.9)
+            else:
+                # 加性增 大约每一轮并发+1
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def correct(self, tokens: float):
+        """用响应里的真实用量修正预估的token数 正数表示多用了 负数退回多扣的部分"""
+        if self._tokens:
+            with self._cond:
+                self._tokens.tokens = min(self._tokens.capacity, self._tokens.tokens - tokens)
+                self._cond.notify_all()
+
+
+_limiters: Dict[tuple, RateLimiter] = {}
+_lock = threading.Lock()
+
+
+def get_limiter(base_url: Optional[str], model: Optional[str], limit_cfg: Optional[Dict]) -> Optional[RateLimiter]:
+    """
+    limit_cfg: {"rpm":..,"tpm":..,"max_concurrency":..,"models":{"<model>":{...}}}
+    models中的配置会覆盖该模型的默认配置 limit_cfg为空时不限流
+    """
+    if not limit_cfg:
+        return None
+    key = (base_url, model)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _lock:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                cfg = {k: v for k, v in limit_cfg.items() if k != "models"}
+                cfg.update(limit_cfg.get("models", {}).get(model, {}))
+                limiter = _limiters[key] = RateLimiter(**cfg)
+    return limiter
+
+
+def error_status(e: Exception) -> Optional[int]:
+    """SDK异常和requests/httpx异常的HTTP状态码 网络错误等没有状态码时返回None"""
+    status = getattr(e, "status_code", None)
+    if status is None and getattr(e, "response", None) is not None:
+        status = getattr(e.response, "status_code", None)
+    return status
+
+
+def is_throttled(e: Exception) -> bool:
+    return error_status(e) == 429
+
+
+def is_retryable(e: Exception) -> bool:
+    """参数错误等4xx重试或换endpoint也不会成功 网络错误/408/409/429/5xx可以重试"""
+    status = error_status(e)
+    return status is None or status in (408, 409, 429) or status >= 500
+
+
+def usage_tokens(resp: Any) -> Optional[int]:
+    """响应中的真实用量(总token数) SDK响应/流式的usage块/rerank的dict 没有用量信息时返回None"""
+    if isinstance(resp, dict):
+        usage = resp.get("usage")
+        if usage:
+            return usage.get("total_tokens")
+        tokens = (resp.get("meta") or {}).get("tokens") or {}
+        if tokens:
+            return int(tokens.get("input_tokens", 0) or 0) + int(tokens.get("output_tokens", 0) or 0)
+        return None
+    usage = getattr(resp, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+def estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """粗略估计一次请求消耗的token: 约2个字符一个token 加上最大生成长度"""
+    if "messages" in kwargs:
+        chars = getattr(kwargs["messages"], "chars", 0) or len(json.dumps(kwargs["messages"], ensure_ascii=False))
+    elif "input" in kwargs:
+        texts = kwargs["input"] if isinstance(kwargs["input"], list) else [kwargs["input"]]
+        chars = sum(len(str(t)) for t in texts)
+    else:
+        chars = len(str(kwargs.get("prompt", ""))) + len(str(kwargs.get("query", ""))) + sum(len(d) for d in kwargs.get("documents", []))
+    return chars // 2 + int(kwargs.get("max_tokens", 0) or 0)
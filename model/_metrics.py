@@ -0,0 +1,132 @@
+"""
+用量与延迟统计
+每次chat/schat/embed/rerank调用记录prompt/completion/cached token数 首token时间 生成速度和总耗时
+按模型/会话/agent三个维度汇总 可以导出为JSON
+"""
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+from ._request_llm import LatencyHistogram
+
+
+def _get(obj: Any, name: str, default: Any = None) -> Any:
+    """usage可能是SDK对象也可能是dict(rerank接口)"""
+    if obj is None:
+        return default
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def usage_stats(usage: Any,
+                start: Optional[float] = None,
+                first_token: Optional[float] = None,
+                end: Optional[float] = None,
+                model: Optional[str] = None) -> Dict:
+    """
+    把响应中的usage和time.monotonic()的时间点整理为统一的字典
+    start/first_token/end为请求发出/第一个token/结束的时间点
+    """
+    end = end or time.monotonic()
+    prompt_tokens = _get(usage, "prompt_tokens", 0) or 0
+    completion_tokens = _get(usage, "completion_tokens", 0) or 0
+    cached_tokens = _get(_get(usage, "prompt_tokens_details"), "cached_tokens", 0) or 0
+    latency = end - start if start is not None else None
+    ttft = first_token - start if start is not None and first_token is not None else None
+    # 生成速度只统计首token之后的部分
+    gen_time = end - (first_token if first_token is not None else start) if start is not None else None
+    return {
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens,
+        "total_tokens": _get(usage, "total_tokens", 0) or prompt_tokens + completion_tokens,
+        "latency": latency,
+        "ttft": ttft,
+        "tokens_per_s": completion_tokens / gen_time if completion_tokens and gen_time else None,
+    }
+
+
+class _Aggregate:
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.ttft_total = 0.0
+        self.ttft_count = 0
+        self.latency = LatencyHistogram()
+
+    def add(self, stats: Dict):
+        self.calls += 1
+        self.prompt_tokens += stats["prompt_tokens"]
+        self.completion_tokens += stats["completion_tokens"]
+        self.cached_tokens += stats["cached_tokens"]
+        if stats["ttft"] is not None:
+            self.ttft_total += stats["ttft"]
+            self.ttft_count += 1
+        if stats["latency"] is not None:
+            self.latency.observe(stats["latency"])
+
+    def to_dict(self) -> Dict:
+        latency = self.latency.to_dict()
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "avg_ttft": self.ttft_total / self.ttft_count if self.ttft_count else None,
+            "avg_latency": latency["avg"],
+            "p50_latency": latency["p50"],
+            "p95_latency": latency["p95"],
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        # (维度,名称,调用类型) -> _Aggregate
+        self._aggregates: Dict[tuple, _Aggregate] = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, stats: Optional[Dict], tags: Optional[Dict] = None):
+        """
+        kind: chat/embed/rerank
+        tags: {"session":..,"agent":..} 由agent设置到llm.metrics_tags上
+        """
+        if not stats:
+            return
+        scopes = [("model", stats.get("model") or "unknown")]
+        scopes += [(scope, name) for scope, name in (tags or {}).items() if name]
+        with self._lock:
+            for scope, name in scopes:
+                key = (scope, name, kind)
+                if key not in self._aggregates:
+                    self._aggregates[key] = _Aggregate()
+                self._aggregates[key].add(stats)
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, Dict]]]:
+        """{维度:{名称:{调用类型:汇总}}}"""
+        result: Dict = {}
+        with self._lock:
+            for (scope, name, kind), aggregate in self._aggregates.items():
+                result.setdefault(scope, {}).setdefault(name, {})[kind] = aggregate.to_dict()
+        return result
+
+    def export(self, path: Optional[str] = None) -> str:
+        data = json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(data)
+        return data
+
+    def reset(self):
+        with self._lock:
+            self._aggregates.clear()
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    return _registry
@@ -0,0 +1,527 @@
+"""
+本地的OpenAI兼容mock服务 用于没有真实key时的压测和延迟基准
+POST /v1/chat/completions  流式/非流式 tools时先返回函数调用 拿到tool结果后返回文本 可选reasoning_content
+POST /v1/completions
+POST /v1/embeddings        按文本hash生成确定的单位向量 支持encoding_format=base64
+POST /v1/rerank            按字符bigram重叠打分
+POST /v1/files  GET /v1/files/{id}/content  POST /v1/batches  GET /v1/batches/{id}
+                           batch在后台线程中逐行执行 被429/500的行写入error文件
+GET  /v1/models  /health
+可配置首token延迟 生成速度 错误率和429比例 只依赖标准库
+"""
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+default_host = "127.0.0.1"
+default_port = 8766
+
+
+def _words(text: str, n: int) -> List[str]:
+    """确定性的回复 按空格切分的每个词算一个token"""
+    seed = text.split()[:8] or ["mock"]
+    return [(" " if i else "") + seed[i % len(seed)] for i in range(n)]
+
+
+def _embedding(text: str, dim: int) -> List[float]:
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dim)]
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+def _bigrams(text: str) -> set:
+    text = text.lower()
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def _mock_arguments(tool: Dict) -> str:
+    params = tool.get("function", {}).get("parameters", {}) or {}
+    props = params.get("properties", {}) or {}
+    defaults = {"string": "mock", "integer": 0, "number": 0, "boolean": True, "array": [], "object": {}}
+    return json.dumps({name: defaults.get(props[name].get("type"), "mock") for name in params.get("required", list(props))
+                       if name in props}, ensure_ascii=False)
+
+
+class MockLLMServer:
+    def __init__(self, host: str = default_host, port: int = default_port,
+                 ttft: float = 0.05, tokens_per_s: float = 200, reply_tokens: int = 32,
+                 reasoning_tokens: int = 0, error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 dim: int = 1024, seed: Optional[int] = None):
+        """
+        ttft: 首token延迟(秒) tokens_per_s: 之后每个token的生成速度
+        reply_tokens/reasoning_tokens: 每次回复的content/reasoning_content的token数
+        error_rate/throttle_rate: 返回500/429的比例
+        dim: embedding维度
+        """
+        self.ttft = ttft
+        self.tokens_per_s = tokens_per_s
+        self.reply_tokens = reply_tokens
+        self.reasoning_tokens = reasoning_tokens
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.dim = dim
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0, "connections": 0}
+        self._files: Dict[str, bytes] = {}
+        self._batches: Dict[str, Dict] = {}
+        self._routes = {
+            "/chat/completions": self._chat,
+            "/completions": self._completions,
+            "/embeddings": self._embeddings,
+            "/rerank": self._rerank,
+        }
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _sleep_tokens(self, n: int):
+        if n and self.tokens_per_s:
+            time.sleep(n / self.tokens_per_s)
+
+    def _fault(self) -> Optional[int]:
+        with self._lock:
+            self.stats["requests"] += 1
+            r = self._random.random()
+            if r < self.throttle_rate:
+                self.stats["throttled"] += 1
+                return 429
+            if r < self.throttle_rate + self.error_rate:
+                self.stats["errors"] += 1
+                return 500
+        return None
+
+    @staticmethod
+    def _usage(prompt: str, completion_tokens: int) -> Dict:
+        prompt_tokens = len(prompt) // 4 + 1
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": 0}}
+
+    def _plan(self, data: Dict) -> Dict:
+        """决定这次回复的内容: 有tools且上一条不是tool结果时调用第一个工具 否则回复文本"""
+        messages = data.get("messages", [])
+        last = messages[-1] if messages else {}
+        prompt = json.dumps(messages, ensure_ascii=False)
+        text = last.get("content") if isinstance(last.get("content"), str) else "mock"
+        tools = data.get("tools") or []
+        tool_call = None
+        if tools and last.get("role") != "tool" and data.get("tool_choice") != "none":
+            tool_call = {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                         "function": {"name": tools[0]["function"]["name"], "arguments": _mock_arguments(tools[0])}}
+        content = [] if tool_call else _words(f"mock reply to {text}", min(int(data.get("max_tokens") or self.reply_tokens), self.reply_tokens))
+        reasoning = _words(f"thinking about {text}", self.reasoning_tokens)
+        return {"prompt": prompt, "content": content, "reasoning": reasoning, "tool_call": tool_call,
+                "model": data.get("model", "mock-chat")}
+
+    def _chat(self, data: Dict):
+        plan = self._plan(data)
+        completion_tokens = len(plan["content"]) + len(plan["reasoning"]) + (8 if plan["tool_call"] else 0)
+        if data.get("stream"):
+            return self._chat_stream(data, plan, completion_tokens)
+        time.sleep(self.ttft)
+        self._sleep_tokens(completion_tokens)
+        message = {"role": "assistant", "content": "".join(plan["content"])}
+        if plan["reasoning"]:
+            message["reasoning_content"] = "".join(plan["reasoning"])
+        if plan["tool_call"]:
+            message["tool_calls"] = [plan["tool_call"]]
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:16]}", "object": "chat.completion", "created": int(time.time()),
+            "model": plan["model"],
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if plan["tool_call"] else "stop"}],
+            "usage": self._usage(plan["prompt"], completion_tokens),
+        }
+
+    def _chat_stream(self, data: Dict, plan: Dict, completion_tokens: int) -> Iterator[Dict]:
+        _id, created = f"chatcmpl-{uuid.uuid4().hex[:16]}", int(time.time())
+
+        def _chunk(delta: Dict, finish_reason: Optional[str] = None) -> Dict:
+            return {"id": _id, "object": "chat.completion.chunk", "created": created, "model": plan["model"],
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        time.sleep(self.ttft)
+        yield _chunk({"role": "assistant", "content": ""})
+        for token in plan["reasoning"]:
+            self._sleep_tokens(1)
+            yield _chunk({"reasoning_content": token})
+        for token in plan["content"]:
+            self._sleep_tokens(1)
+            yield _chunk({"content": token})
+        tool_call = plan["tool_call"]
+        if tool_call:
+            yield _chunk({"tool_calls": [{"index": 0, "id": tool_call["id"], "type": "function",
+                                          "function": {"name": tool_call["function"]["name"], "arguments": ""}}]})
+            arguments = tool_call["function"]["arguments"]
+            for i in range(0, len(arguments), 8):
+                self._sleep_tokens(1)
+                yield _chunk({"tool_calls": [{"index": 0, "function": {"arguments": arguments[i:i + 8]}}]})
+        yield _chunk({}, "tool_calls" if tool_call else "stop")
+        if (data.get("stream_options") or {}).get("include_usage"):
+            yield {"id": _id, "object": "chat.completion.chunk", "created": created, "model": plan["model"],
+                   "choices": [], "usage": self._usage(plan["prompt"], completion_tokens)}
+
+    def _completions(self, data: Dict):
+        prompt = str(data.get("prompt", ""))
+        words = _words(f"mock completion of {prompt}", self.reply_tokens)
+        time.sleep(self.ttft)
+        self._sleep_tokens(len(words))
+        return {"id": f"cmpl-{uuid.uuid4().hex[:16]}", "object": "text_completion", "created": int(time.time()),
+                "model": data.get("model", "mock-completion"),
+                "choices": [{"index": 0, "text": "".join(words), "finish_reason": "stop"}],
+                "usage": self._usage(prompt, len(words))}
+
+    def _embeddings(self, data: Dict):
+        texts = data.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        dim = int(data.get("dimensions") or self.dim)
+        time.sleep(self.ttft)
+        items = []
+        for index, text in enumerate(texts):
+            vector = _embedding(str(text), dim)
+            if data.get("encoding_format") == "base64":
+                embedding = base64.b64encode(struct.pack(f"<{dim}f", *vector)).decode("ascii")
+            else:
+                embedding = vector
+            items.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(len(str(t)) // 4 + 1 for t in texts)
+        return {"object": "list", "data": items, "model": data.get("model", "mock-embedding"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    def _rerank(self, data: Dict):
+        query, documents = data.get("query", ""), data.get("documents", [])
+        time.sleep(self.ttft)
+        query_terms = _bigrams(query)
+        results = [{"index": i, "relevance_score": len(query_terms & _bigrams(doc)) / len(query_terms | _bigrams(doc))}
+                   for i, doc in enumerate(documents)]
+        results.sort(key=lambda x: x["relevance_score"], reverse=True)
+        if data.get("top_n"):
+            results = results[:int(data["top_n"])]
+        tokens = len(query) // 4 + sum(len(doc) // 4 for doc in documents) + 1
+        return {"id": uuid.uuid4().hex, "model": data.get("model", "mock-rerank"), "results": results,
+                "meta": {"tokens": {"input_tokens": tokens, "output_tokens": 0}}}
+
+    def _upload(self, content_type: str, body: bytes) -> Dict:
+        """解析multipart/form-data中的file字段"""
+        form = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+        fields = {part.get_param("name", header="content-disposition"): part for part in form.iter_parts()}
+        if "file" not in fields:
+            raise ValueError("missing file")
+        data = fields["file"].get_payload(decode=True) or b""
+        file_id = f"file-{uuid.uuid4().hex[:16]}"
+        with self._lock:
+            self._files[file_id] = data
+        purpose = fields["purpose"].get_content() if "purpose" in fields else "batch"
+        return {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": fields["file"].get_filename() or "input.jsonl", "purpose": purpose.strip(), "status": "processed"}
+
+    def _create_batch(self, data: Dict) -> Dict:
+        input_file_id = data.get("input_file_id")
+        if input_file_id not in self._files:
+            raise ValueError(f"unknown file {input_file_id}")
+        batch = {"id": f"batch_{uuid.uuid4().hex[:16]}", "object": "batch", "endpoint": data.get("endpoint"),
+                 "input_file_id": input_file_id, "completion_window": data.get("completion_window", "24h"),
+                 "status": "in_progress", "output_file_id": None, "error_file_id": None,
+                 "created_at": int(time.time()), "request_counts": {"total": 0, "completed": 0, "failed": 0}}
+        with self._lock:
+            self._batches[batch["id"]] = batch
+        threading.Thread(target=self._run_batch, args=(batch,), daemon=True).start()
+        return dict(batch)
+
+    def _run_batch(self, batch: Dict):
+        outputs, errors = [], []
+        for line in self._files[batch["input_file_id"]].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            path = item.get("url", batch["endpoint"])
+            route = self._routes.get(path[3:] if path.startswith("/v1/") else path)
+            fault = self._fault()
+            if route is None or fault:
+                code = fault or 404
+                body = {"error": {"message": "rate limited" if code == 429 else f"error {code}", "code": code}}
+            else:
+                code, body = 200, route({**item.get("body", {}), "stream": False})
+            result = {"id": f"batch_req_{uuid.uuid4().hex[:16]}", "custom_id": item.get("custom_id"),
+                      "response": {"status_code": code, "request_id": uuid.uuid4().hex, "body": body}, "error": None}
+            (outputs if code == 200 else errors).append(json.dumps(result, ensure_ascii=False))
+        with self._lock:
+            for name, lines in (("output_file_id", outputs), ("error_file_id", errors)):
+                if lines:
+                    file_id = f"file-{uuid.uuid4().hex[:16]}"
+                    self._files[file_id] = ("\n".join(lines) + "\n").encode("utf-8")
+                    batch[name] = file_id
+            batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+            batch["status"] = "completed"
+
+    def _handler(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            # 支持keep-alive 连接池的效果才能体现出来
+            protocol_version = "HTTP/1.1"
+            # 头和body分两次写出 不关Nagle会叠加约40ms的延迟确认
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.stats["connections"] += 1
+
+            def _send(self, code: int, body: Dict, headers: Optional[Dict] = None):
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _send_bytes(self, payload: bytes):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _send_stream(self, chunks: Iterator[Dict]):
+                # 不使用chunked编码 流结束时关闭连接
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                for chunk in chunks:
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+            def _path(self) -> str:
+                path = self.path.split("?", 1)[0]
+                return path[3:] if path.startswith("/v1/") else path
+
+            def do_GET(self):
+                path = self._path()
+                if path == "/health":
+                    return self._send(200, {"ok": True, **server.stats})
+                if path == "/models":
+                    return self._send(200, {"object": "list", "data": [
+                        {"id": name, "object": "model", "owned_by": "mock"}
+                        for name in ("mock-chat", "mock-embedding", "mock-rerank")]})
+                parts = path.strip("/").split("/")
+                if parts[0] == "batches" and len(parts) == 2 and parts[1] in server._batches:
+                    with server._lock:
+                        return self._send(200, dict(server._batches[parts[1]]))
+                if parts[0] == "files" and len(parts) == 3 and parts[2] == "content" and parts[1] in server._files:
+                    return self._send_bytes(server._files[parts[1]])
+                self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+                path = self._path()
+                if path in ("/files", "/batches"):
+                    try:
+                        if path == "/files":
+                            return self._send(200, server._upload(self.headers.get("Content-Type", ""), body))
+                        return self._send(200, server._create_batch(json.loads(body or b"{}")))
+                    except Exception as e:
+                        return self._send(400, {"error": {"message": str(e), "type": "invalid_request_error"}})
+                route = server._routes.get(path)
+                if route is None:
+                    return self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+                fault = server._fault()
+                if fault == 429:
+                    return self._send(429, {"error": {"message": "rate limited", "type": "rate_limit_error"}}, {"Retry-After": "0"})
+                if fault == 500:
+                    return self._send(500, {"error": {"message": "injected error", "type": "server_error"}})
+                try:
+                    result = route(json.loads(body or b"{}"))
+                except Exception as e:
+                    return self._send(400, {"error": {"message": str(e), "type": "invalid_request_error"}})
+                if isinstance(result, dict):
+                    return self._send(200, result)
+                self._send_stream(result)
+
+            def log_message(self, format, *args):
+                pass
+        return _Handler
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def _bench_pool(base_url: str, requests_num: int, concurrency: int) -> Dict[str, Dict]:
+    """共享连接池的OpenaiLLM 对比 每次请求新建客户端"""
+    from concurrent.futures import ThreadPoolExecutor
+    from openai import OpenAI
+    from config import get_mock_model
+    from ._openai import OpenaiLLM
+    from .msg import Messages
+    llm_cfg = get_mock_model(base_url)
+    pooled = OpenaiLLM(llm_cfg)
+
+    def _pooled(i: int):
+        msgs = Messages(system_prompt="bench")
+        msgs.add_user_msg(f"question {i}")
+        for _ in pooled.chat(msgs, stream=False):
+            pass
+
+    def _unpooled(i: int):
+        client = OpenAI(**llm_cfg["client_cfg"])
+        try:
+            client.chat.completions.create(messages=[{"role": "user", "content": f"question {i}"}], **llm_cfg["chat_cfg"])
+        finally:
+            client.close()
+
+    results = {}
+    for name, fn in [("unpooled", _unpooled), ("pooled", _pooled)]:
+        latencies = []
+
+        def _timed(i: int):
+            start = time.perf_counter()
+            fn(i)
+            latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(_timed, range(requests_num)))
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        results[name] = {"rps": requests_num / elapsed,
+                         "p50_ms": latencies[len(latencies) // 2] * 1000,
+                         "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000}
+    return results
+
+
+def _bench_chat(base_url: str, requests_num: int, concurrency: int) -> Dict[str, Dict]:
+    """
+    流式chat的首token延迟 以及schat/aschat的函数调用回路(流式解析tool_calls->执行工具->带结果再请求)
+    mock在最后一条不是tool结果时总是调用第一个工具 所以每轮对话正好两次请求
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from config import get_mock_model
+    from tools import get_tools_list
+    from ._openai import OpenaiLLM
+    from .msg import Messages
+    llm = OpenaiLLM(get_mock_model(base_url))
+    tools = get_tools_list(["get_current_time"])
+
+    def _stream(i: int) -> Dict:
+        msgs = Messages(system_prompt="bench")
+        msgs.add_user_msg(f"question {i}")
+        start, ttft, content = time.perf_counter(), None, ""
+        for msg in llm.chat(msgs, stream=True):
+            if msg.content and ttft is None:
+                ttft = time.perf_counter() - start
+            content += msg.content or ""
+        assert content, "empty stream"
+        return {"ttft": ttft, "total": time.perf_counter() - start}
+
+    def _tool_loop(i: int) -> Dict:
+        msgs = Messages(system_prompt="bench")
+        msgs.add_user_msg(f"what time is it {i}")
+        start, rounds, tool_results = time.perf_counter(), 0, 0
+        while True:
+            rounds += 1
+            for msg in llm.schat(msgs, stream=True, tools=tools, tool_choice="auto"):
+                tool_results += msg.role == "tool"
+            if not msgs.check_tool_result():
+                break
+        assert rounds == 2 and tool_results == 1, (rounds, tool_results)
+        return {"total": time.perf_counter() - start}
+
+    async def _atool_loop(i: int) -> Dict:
+        msgs = Messages(system_prompt="bench")
+        msgs.add_user_msg(f"what time is it {i}")
+        start, tool_results = time.perf_counter(), 0
+        for _ in range(2):
+            async for msg in llm.aschat(msgs, stream=True, tools=tools, tool_choice="auto"):
+                tool_results += msg.role == "tool"
+        assert tool_results == 1 and msgs[-1].role == "assistant", tool_results
+        return {"total": time.perf_counter() - start}
+
+    async def _arun() -> List[Dict]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _one(i: int):
+            async with semaphore:
+                return await _atool_loop(i)
+        return await asyncio.gather(*(_one(i) for i in range(requests_num)))
+
+    def _summary(samples: List[Dict], elapsed: float) -> Dict:
+        result = {"rps": requests_num / elapsed}
+        for key in ("ttft", "total"):
+            values = sorted(sample[key] for sample in samples if sample.get(key) is not None)
+            if values:
+                result[f"{key}_p50_ms"] = values[len(values) // 2] * 1000
+                result[f"{key}_p95_ms"] = values[max(0, int(len(values) * 0.95) - 1)] * 1000
+        return result
+
+    results = {}
+    for name, fn in [("stream", _stream), ("tool_loop", _tool_loop)]:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(fn, range(requests_num)))
+        results[name] = _summary(samples, time.perf_counter() - start)
+    start = time.perf_counter()
+    samples = asyncio.run(_arun())
+    results["atool_loop"] = _summary(samples, time.perf_counter() - start)
+    return results
+
+
+if __name__ == "__main__":
+    # python -m model._mock_server [--bench N]
+    import argparse
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--host", default=default_host)
+    arg_parser.add_argument("--port", type=int, default=default_port)
+    arg_parser.add_argument("--ttft", type=float, default=0.05)
+    arg_parser.add_argument("--tokens_per_s", type=float, default=200)
+    arg_parser.add_argument("--reply_tokens", type=int, default=32)
+    arg_parser.add_argument("--reasoning_tokens", type=int, default=0)
+    arg_parser.add_argument("--error_rate", type=float, default=0.0)
+    arg_parser.add_argument("--throttle_rate", type=float, default=0.0)
+    arg_parser.add_argument("--dim", type=int, default=1024)
+    arg_parser.add_argument("--bench", type=int, default=0, help="启动后跑N次请求的连接池/流式/函数调用基准然后退出")
+    arg_parser.add_argument("--concurrency", type=int, default=16)
+    args = arg_parser.parse_args()
+    server = MockLLMServer(args.host, args.port, args.ttft, args.tokens_per_s, args.reply_tokens,
+                           args.reasoning_tokens, args.error_rate, args.throttle_rate, args.dim)
+    if args.bench:
+        server.start()
+        for name, result in _bench_pool(server.url, args.bench, args.concurrency).items():
+            print(f"{name}: {result['rps']:.1f} req/s p50 {result['p50_ms']:.1f} ms p95 {result['p95_ms']:.1f} ms")
+        for name, result in _bench_chat(server.url, args.bench, args.concurrency).items():
+            print(f"{name}: " + " ".join(f"{key} {value:.1f}" for key, value in result.items()))
+        print(f"server connections: {server.stats['connections']}")
+        server.shutdown()
+    else:
+        print(f"mock server on {server.url}")
+        server.serve_forever()
@@ -2,12 +2,103 @@
 Openai LLM 模型的实现
 实现了OpenAI的聊天、嵌入、文本生成等功能
 """
+import asyncio
+import base64
+import time
 import numpy as np
 import requests
-from .msg import Message,Messages
-from typing import Any, Generator, Optional,Dict,Callable,Union,List
-from openai import OpenAI
+from .msg import Message,Messages,to_wire
+from typing import Any, AsyncGenerator, Generator, Optional,Dict,Callable,Union,List
+from openai import OpenAI,AsyncOpenAI
 from .base import BaseLLM
+from ._client import get_client
+from ._limiter import get_limiter,is_throttled,estimate_tokens,usage_tokens
+from ._stream import StreamState,resp_message
+from ._cache import get_response_cache
+from ._metrics import get_metrics,usage_stats
+from ._context import ContextManager
+from ._embed_batch import get_embedding_batcher
+
+
+def decode_embeddings(data)->np.ndarray:
+    """
+    把embeddings响应解码为(n,dim)的float32矩阵
+    encoding_format为base64时每个向量直接np.frombuffer写入预分配的矩阵 不经过Python float列表
+    不支持base64的供应商返回float列表 同样转为float32
+    """
+    if not data:
+        return np.zeros((0,0),dtype=np.float32)
+    first=data[0].embedding
+    if not isinstance(first,str):
+        return np.asarray([item.embedding for item in data],dtype=np.float32)
+    dim=len(base64.b64decode(first))//4
+    out=np.empty((len(data),dim),dtype=np.float32)
+    for row,item in enumerate(data):
+        # 按index放回请求中的顺序
+        index=getattr(item,'index',None)
+        out[row if index is None else index]=np.frombuffer(base64.b64decode(item.embedding),dtype='<f4')
+    return out
+
+
+class _LimitedStream:
+    """
+    流式响应读完(或关闭)后才释放限流器的并发占用
+    最后的usage块(stream_options.include_usage)到达时按真实用量修正预估的token数
+    """
+    def __init__(self,resp,limiter,start:float,estimated:float=0):
+        self._resp=resp
+        self._limiter=limiter
+        self._start=start
+        self._estimated=estimated
+        self._actual=None
+        self._released=False
+    def _release(self,error:bool=False):
+        if not self._released:
+            self._released=True
+            if self._actual is not None:
+                self._limiter.correct(self._actual-self._estimated)
+            self._limiter.release(latency=time.monotonic()-self._start,error=error)
+    def _observe(self,chunk):
+        actual=usage_tokens(chunk)
+        if actual is not None:
+            self._actual=actual
+    def __iter__(self):
+        error=True
+        try:
+            for chunk in self._resp:
+                self._observe(chunk)
+                yield chunk
+            error=False
+        finally:
+            self._release(error)
+    def close(self):
+        if hasattr(self._resp,'close'):
+            self._resp.close()
+        self._release()
+    def __del__(self):
+        self._release()
+
+
+class _ALimitedStream(_LimitedStream):
+    async def __aiter__(self):
+        error=True
+        try:
+            async for chunk in self._resp:
+                self._observe(chunk)
+                yield chunk
+            error=False
+        finally:
+            self._release(error)
+    async def aclose(self):
+        if hasattr(self._resp,'close'):
+            await self._resp.close()
+        self._release()
+
+
+def _correct(limiter,resp,estimated:float):
+    actual=usage_tokens(resp)
+    if actual is not None:
+        limiter.correct(actual-estimated)
 
 
 class OpenaiLLM(BaseLLM):
@@ -19,21 +110,38 @@ class OpenaiLLM(BaseLLM):
         self.completion_cfg = llm_config.get('completion_cfg', {})
         self.embedding_cfg = llm_config.get('embedding_cfg', {})
         self.rerank_cfg = llm_config.get('rerank_cfg', {})
+        # 连接池配置 见model/_client.py:default_pool_cfg
+        self.pool_cfg = llm_config.get('pool_cfg', {})
+        # /rerank等非SDK接口的超时与重试配置 见model/_request_llm.py:default_request_cfg
+        self.request_cfg = llm_config.get('request_cfg', {})
+        # 按(base_url,model)限流 见model/_limiter.py:get_limiter 为空时不限流
+        self.limit_cfg = llm_config.get('limit_cfg', {})
+        # 响应的磁盘缓存 见model/_cache.py:get_response_cache 为空时不缓存
+        self.cache_cfg = llm_config.get('cache_cfg', {})
+        # 流式请求时附带stream_options.include_usage 让最后一个chunk返回用量
+        self.include_usage = llm_config.get('include_usage', True)
+        # 用量统计的维度 如{"session":..,"agent":..} 见model/_metrics.py
+        self.metrics_tags: Dict = {}
+        # 按token预算压缩Messages 见model/_context.py:default_context_cfg 为空时不压缩
+        self.context_cfg = llm_config.get('context_cfg', {})
+        self.context = ContextManager.from_cfg(self.context_cfg,self.chat_cfg.get('model')) if self.context_cfg else None
+        # 跨线程合并embed请求 见model/_embed_batch.py:default_embed_batch_cfg 为空时不合并
+        self.embed_batch_cfg = llm_config.get('embed_batch_cfg', {})
         def _chat(*args,**kwargs):
-            client=OpenAI(**self.client_cfg)
+            client=self.client()
             return client.chat.completions.create(*args,**{**self.chat_cfg,**kwargs})
         def _embed(*args,**kwargs):
-            client=OpenAI(**self.client_cfg)
+            client=self.client()
             return client.embeddings.create(*args,**{**self.embedding_cfg,**kwargs})
         def _multi_embed(*args,**kwargs):
             raise NotImplemented
         def _completion(*args,**kwargs):
-            client=OpenAI(**self.client_cfg)
+            client=self.client()
             return client.completions.create(*args,**{**self.completion_cfg,**kwargs})
         def _fn_chat(fn:Callable,model_fn:Callable,*args,**kwargs):
             return fn(model_fn(*args,**kwargs))
         def _img_gen(*args,**kwargs):
-            client=OpenAI(**self.client_cfg)
+            client=self.client()
             return client.images.generate(*args,**kwargs)
         def _rerank(*args,**kwargs):
             from ._request_llm import _base_requst
@@ -41,152 +149,279 @@ class OpenaiLLM(BaseLLM):
                 **self.rerank_cfg,
                 **kwargs,
             }
-            return _base_requst(self.client_cfg,suffix='/rerank',request_data=data)
-        self._chat = _chat
-        self._embed=_embed
+            return _base_requst(self.client_cfg,suffix='/rerank',request_data=data,request_cfg=self.request_cfg)
+        self._chat = self._cached(self._limited(_chat,self.chat_cfg),self.chat_cfg)
+        self._embed=self._limited(_embed,self.embedding_cfg)
         self._mutil_embed=_multi_embed
-        self._completion = _completion    
+        self._completion = self._cached(self._limited(_completion,self.completion_cfg),self.completion_cfg)
         self._fn_chat=_fn_chat  
         self._img_gen=_img_gen
-        self._rerank=_rerank
+        self._rerank=self._limited(_rerank,self.rerank_cfg)
+
+    def _cached(self,fn:Callable,cfg:Dict)->Callable:
+        """命中缓存时不经过限流也不发请求"""
+        cache=get_response_cache(self.cache_cfg)
+        scope={"provider":type(self).__name__,"base_url":self.client_cfg.get('base_url')}
+        return cache.wrap(fn,cfg,scope) if cache else fn
+
+    def _limited(self,fn:Callable,cfg:Dict)->Callable:
+        """
+        给请求函数加上限流 429会降低并发 流式响应读完才释放并发
+        请求前按max_tokens预扣token 响应后按usage退回多扣的部分
+        """
+        def _call(*args,**kwargs):
+            params={**cfg,**kwargs}
+            limiter=get_limiter(self.client_cfg.get('base_url'),params.get('model'),self.limit_cfg)
+            if limiter is None:
+                return fn(*args,**kwargs)
+            estimated=estimate_tokens(params)
+            limiter.acquire(estimated)
+            start=time.monotonic()
+            try:
+                resp=fn(*args,**kwargs)
+            except Exception as e:
+                limiter.release(throttled=is_throttled(e),error=True)
+                raise
+            if params.get('stream',False):
+                return _LimitedStream(resp,limiter,start,estimated)
+            _correct(limiter,resp,estimated)
+            limiter.release(latency=time.monotonic()-start)
+            return resp
+        return _call
     
+    def client(self)->OpenAI:
+        return get_client(OpenAI,self.client_cfg,self.pool_cfg)
+
+    def _usage_options(self,kwargs:Dict):
+        if kwargs.get("stream",False) and self.include_usage and 'stream_options' not in kwargs and 'stream_options' not in self.chat_cfg:
+            kwargs['stream_options']={"include_usage":True}
+
+    def _record(self,kind:str,stats:Optional[Dict]):
+        get_metrics().record(kind,stats,self.metrics_tags)
+
+    def _fit_context(self,messages:Messages):
+        """请求前把历史压缩到预算内 只处理Messages 普通list原样发送"""
+        if self.context is not None and isinstance(messages,Messages):
+            self.context.fit(messages,summarizer=self._summarize)
+
+    def _summarize(self,old:List[Message])->str:
+        """summarize策略使用的总结函数 同步请求 异步接口中会阻塞事件循环"""
+        history="\n".join(f"{m.role}: {m.content}" for m in old if m.content)
+        resp=self._chat(messages=[
+            {"role":"system","content":"Summarize the conversation below. Keep facts, decisions, file names and open tasks. Be concise."},
+            {"role":"user","content":history},
+        ],stream=False)
+        return resp.choices[0].message.content or ""
+
     def chat(self,messages:Messages,**kwargs)-> Generator[Message, Any, None]:
-        kwargs['messages']=[m.to_dict() for m in messages]
+        self._fit_context(messages)
+        kwargs['messages']=to_wire(messages)
+        self._usage_options(kwargs)
+        start=time.monotonic()
         def _stream_chat(resp):
-            content=''
-            reasoning_content=''
-            for chunk in resp:
-                id=chunk.id
-                created=chunk.created
-                delta=chunk.choices[0].delta
-                if hasattr(delta,"content") and delta.content:
-                    content+=delta.content
-                    yield Message.assistant(id,created,content=delta.content)
-                if hasattr(delta,"reasoning_content") and delta.reasoning_content:
-                    reasoning_content+=delta.reasoning_content
-                    yield Message.assistant(id,created,reasoning_content=delta.reasoning_content)
+            state=StreamState(start)
+            try:
+                for chunk in resp:
+                    yield from state.feed(chunk)
+            except GeneratorExit:
+                # 调用方已拿到需要的内容并关闭了生成器 断开连接停止生成 已收到的部分照常追加
+                if hasattr(resp,'close'):
+                    resp.close()
+            msg=state.final(with_tools=False)
+            self._record('chat',msg.usage)
             # 实现消息的追加
-            messages.append(Message.assistant(id,created,content=content,reasoning_content=reasoning_content))
-        def _no_stream_chat(resp):
-            msg=resp.choices[0].message
-            id=resp.id
-            created=resp.created
-            content=''
-            reasoning_content=''
-            if hasattr(msg, 'content') and msg.content:
-                content=msg.content
-            if hasattr(msg, 'reasoning_content') and msg.reasoning_content:
-                reasoning_content=msg.reasoning_content
-            yield Message.assistant(id,created,content, reasoning_content)
+            messages.append(msg)
+        def _no_stream_chat(resp,end:float):
+            msg=resp_message(resp,with_tools=False,start=start,end=end)
+            self._record('chat',msg.usage)
+            yield msg
             # 实现消息的追加
-            messages.append(Message.assistant(id,created,content, reasoning_content))
-        fn=_stream_chat if kwargs.get("stream",False) else _no_stream_chat
+            messages.append(msg)
+        # 非流式响应在返回时立即记下结束时间 不受调用方何时开始迭代的影响
+        fn=_stream_chat if kwargs.get("stream",False) else (lambda resp: _no_stream_chat(resp,time.monotonic()))
 
         return self._fn_chat(fn,self._chat,**kwargs)
     
-    def schat(self,messages:list[Message],parallel_tool_calls:bool=True,**kwargs):
-        return self._base_chat(messages=messages,model=self._chat,parallel_tool_calls=parallel_tool_calls,**kwargs)
+    def schat(self,messages:list[Message],parallel_tool_calls:bool=True,eager_tool_calls:bool=True,**kwargs):
+        return self._base_chat(messages=messages,model=self._chat,parallel_tool_calls=parallel_tool_calls,eager_tool_calls=eager_tool_calls,**kwargs)
         
-    def _base_chat(self,messages:list[Message],model:Callable,parallel_tool_calls:bool=True,**kwargs)-> Generator[Message, Any, None]:
-        kwargs['messages']=[m.to_dict() for m in messages]
+    def _base_chat(self,messages:list[Message],model:Callable,parallel_tool_calls:bool=True,eager_tool_calls:bool=True,**kwargs)-> Generator[Message, Any, None]:
+        """
+        eager_tool_calls: 流式且并行调用时 某个函数调用的参数一旦是完整JSON就提交执行 不等待整个流结束
+        结果仍按tool_calls的顺序产出
+        """
+        self._fit_context(messages)
+        kwargs['messages']=to_wire(messages)
+        self._usage_options(kwargs)
+        start=time.monotonic()
+        eager=eager_tool_calls and parallel_tool_calls
+        def _tool_results(msg:Message,futures:Optional[Dict]=None):
+            # 进行函数调用的执行
+            from .func import func_call,collect_func_call
+            if futures is not None:
+                tool_results = collect_func_call(msg.tool_calls, futures)
+            else:
+                tool_results = func_call(msg.tool_calls, parallel=parallel_tool_calls)
+            for tool_result in tool_results:
+                yield tool_result
+                messages.append(tool_result)
         def _stream_chat(resp):
-            content = ""
-            reasoning_content = ""
-            tool_calls = []
-            has_tool_calls = False
-            for chunk in resp:
-                id = chunk.id
-                created = chunk.created
-                if not chunk.choices:
-                    continue
-                delta = chunk.choices[0].delta
-                if hasattr(delta, 'content') and delta.content:
-                    content += delta.content
-                    yield Message.assistant(id,created,content=delta.content)
-                if hasattr(delta, 'reasoning_content') and delta.reasoning_content:
-                    reasoning_content += delta.reasoning_content
-                    yield Message.assistant(id,created,content="", reasoning_content=delta.reasoning_content)
-                if hasattr(delta, 'tool_calls') and delta.tool_calls:
-                    has_tool_calls = True
-                    for tool_call_delta in delta.tool_calls:
-                        while len(tool_calls) <= tool_call_delta.index:
-                            tool_calls.append({
-                                "id": "",
-                                "function": {"name": "", "arguments": ""}
-                            })
-                        current_tool_call = tool_calls[tool_call_delta.index]
-                        if hasattr(tool_call_delta, 'id') and tool_call_delta.id:
-                            current_tool_call["id"] = tool_call_delta.id
-                        if hasattr(tool_call_delta, 'function') and tool_call_delta.function:
-                            if hasattr(tool_call_delta.function, 'name') and tool_call_delta.function.name:
-                                current_tool_call["function"]["name"] = tool_call_delta.function.name
-                            if hasattr(tool_call_delta.function, 'arguments') and tool_call_delta.function.arguments:
-                                current_tool_call["function"]["arguments"] += tool_call_delta.function.arguments
-            if has_tool_calls and tool_calls:
-                # 添加对于函数调用的需求
-                msg=Message.tool_call_response(id,created,content,tool_calls)
-                yield msg
-                messages.append(msg)
+            from .func import submit_func_call
+            state=StreamState(start)
+            futures={}
+            try:
+                for chunk in resp:
+                    yield from state.feed(chunk)
+                    if eager:
+                        for index in state.completed_tool_calls():
+                            futures[index]=submit_func_call(state.tool_call(index))
+                msg=state.final()
+                self._record('chat',msg.usage)
+                if msg.tool_calls:
+                    # 添加对于函数调用的需求
+                    yield msg
+                    messages.append(msg)
+                    yield from _tool_results(msg,futures if eager else None)
+                else:
+                    # 如果没有函数调用的需求 直接添加msg信息即可
+                    messages.append(msg)
+            finally:
+                # 调用方提前关闭生成器或流中途出错时 已经提前提交但还没被取走结果的函数调用不再需要
+                for future in futures.values():
+                    if not future.done():
+                        future.cancel()
 
-                # 进行函数调用的执行
-                from .func import func_call
-                tool_results = func_call(tool_calls, parallel=parallel_tool_calls)
-                for tool_result in tool_results:
-                    yield tool_result
-                    messages.append(tool_result)
-            else:
-                # 如果没有函数调用的需求 直接添加msg信息即可
-                msg=Message.assistant(
-                    id,
-                    created,
-                    content=content,
-                    reasoning_content=reasoning_content,
-                )
-                messages.append(msg)
+        def _no_stream_chat(resp,end:float):
+            msg=resp_message(resp,start=start,end=end)
+            self._record('chat',msg.usage)
+            yield msg
+            messages.append(msg)
+            if msg.tool_calls:
+                # 存在函数调用的需求 返回函数调用的结果
+                yield from _tool_results(msg)
+        fn = (lambda resp: _stream_chat(resp)) if kwargs.get("stream", False) else (lambda resp: _no_stream_chat(resp,time.monotonic()))
+        return self._fn_chat(fn,model,**kwargs)
+
+    def aclient(self)->AsyncOpenAI:
+        return get_client(AsyncOpenAI,self.client_cfg,self.pool_cfg,is_async=True)
 
-        def _no_stream_chat(resp):
-            id=resp.id
-            created=resp.created
-            resp_msg =resp.choices[0].message
-            content=resp_msg.content
-            reasoning_content=getattr(resp_msg, 'reasoning_content', "") or ""
-            func_call_flag=resp.choices[0].finish_reason =="tool_calls"
-            if not func_call_flag:
-                # 如果没有函数调用的需求 直接添加msg信息即可
-                curr_msg=Message.assistant(
-                    id,created,
-                    content=content,
-                    reasoning_content=reasoning_content,
-                )
-                yield curr_msg
-                messages.append(curr_msg)
+    async def _alimited(self,fn:Callable,cfg:Dict,**kwargs):
+        """_limited的异步版本"""
+        params={**cfg,**kwargs}
+        limiter=get_limiter(self.client_cfg.get('base_url'),params.get('model'),self.limit_cfg)
+        if limiter is None:
+            return await fn(**params)
+        estimated=estimate_tokens(params)
+        await limiter.aacquire(estimated)
+        start=time.monotonic()
+        try:
+            resp=await fn(**params)
+        except Exception as e:
+            limiter.release(throttled=is_throttled(e),error=True)
+            raise
+        if params.get('stream',False):
+            return _ALimitedStream(resp,limiter,start,estimated)
+        _correct(limiter,resp,estimated)
+        limiter.release(latency=time.monotonic()-start)
+        return resp
+
+    async def _achat(self,**kwargs):
+        return await self._alimited(self.aclient().chat.completions.create,self.chat_cfg,**kwargs)
+
+    async def achat(self,messages:Messages,**kwargs)-> AsyncGenerator[Message, None]:
+        """chat的异步版本 产出的Message以及对messages的追加与chat一致"""
+        self._fit_context(messages)
+        kwargs['messages']=to_wire(messages)
+        self._usage_options(kwargs)
+        start=time.monotonic()
+        resp=await self._achat(**kwargs)
+        if kwargs.get("stream",False):
+            state=StreamState(start)
+            async for chunk in resp:
+                for msg in state.feed(chunk):
+                    yield msg
+            msg=state.final(with_tools=False)
+        else:
+            msg=resp_message(resp,with_tools=False,start=start)
+            yield msg
+        self._record('chat',msg.usage)
+        messages.append(msg)
+
+    async def aschat(self,messages:Messages,parallel_tool_calls:bool=True,eager_tool_calls:bool=True,**kwargs)-> AsyncGenerator[Message, None]:
+        """schat的异步版本 函数调用在事件循环中等待执行"""
+        from .func import afunc_call,arun_func_call
+        self._fit_context(messages)
+        kwargs['messages']=to_wire(messages)
+        self._usage_options(kwargs)
+        start=time.monotonic()
+        eager=eager_tool_calls and parallel_tool_calls
+        tasks={}
+        try:
+            resp=await self._achat(**kwargs)
+            if kwargs.get("stream",False):
+                state=StreamState(start)
+                async for chunk in resp:
+                    for msg in state.feed(chunk):
+                        yield msg
+                    if eager:
+                        for index in state.completed_tool_calls():
+                            tasks[index]=asyncio.ensure_future(arun_func_call(state.tool_call(index)))
+                msg=state.final()
+                self._record('chat',msg.usage)
+                if msg.tool_calls:
+                    yield msg
+                messages.append(msg)
             else:
-                # 存在函数调用的需求 直接添加函数调用需求 并且 返回函数调用的结果
-                meta_data=resp.choices[0].message.model_dump()
-                tools_calls = meta_data.get('tool_calls', None)
-                msg = Message.assistant(
-                    id,
-                    created,
-                    content=meta_data['content'],
-                    reasoning_content=meta_data.get('reasoning_content', None),
-                    tool_calls=tools_calls
-                )
+                msg=resp_message(resp,start=start)
+                self._record('chat',msg.usage)
                 yield msg
                 messages.append(msg)
-                
-                # 进行函数调用的实现
-                from .func import func_call
-                tool_results= func_call(tools_calls, parallel=parallel_tool_calls)
-                for tool_result in tool_results:
+            if msg.tool_calls and tasks:
+                for index,tool_call in enumerate(msg.tool_calls):
+                    if index not in tasks:
+                        tasks[index]=asyncio.ensure_future(arun_func_call(tool_call))
+                for index in range(len(msg.tool_calls)):
+                    tool_result=await tasks[index]
                     yield tool_result
                     messages.append(tool_result)
-        fn = (lambda resp: _stream_chat(resp)) if kwargs.get("stream", False) else (lambda resp: _no_stream_chat(resp))
-        return self._fn_chat(fn,model,**kwargs)
+            elif msg.tool_calls:
+                async for tool_result in afunc_call(msg.tool_calls,parallel=parallel_tool_calls):
+                    yield tool_result
+                    messages.append(tool_result)
+        finally:
+            # 调用方提前停止迭代(break/aclose/取消)时 已经提前提交但还没被取走结果的函数调用不再需要
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+
+    async def aembed(self,text:Union[str,list[str]],**kwargs):
+        text=text if isinstance(text,list) else [text]
+        start=time.monotonic()
+        resp=await self._alimited(self.aclient().embeddings.create,self.embedding_cfg,input=text)
+        self._record('embed',usage_stats(resp.usage,start,model=resp.model))
+        return decode_embeddings(resp.data)
+
+    async def arerank(self, query: str, documents: List[str],top_k=3) -> List[Dict[str, Union[int, float, str]]]:
+        from ._request_llm import _abase_requst
+        async def _arerank(**data):
+            return await _abase_requst(self.client_cfg,suffix='/rerank',request_data=data,request_cfg=self.request_cfg)
+        start=time.monotonic()
+        resp=await self._alimited(_arerank,self.rerank_cfg,query=query,documents=documents)
+        self._record('rerank',self._rerank_usage(resp,start))
+        return self._top_rerank(resp.get('results'),documents,top_k)
 
     def embed(self,text:Union[str,list[str]],**kwargs):
         text=text if isinstance(text,list) else [text]
+        batcher=get_embedding_batcher(self.client_cfg.get('base_url'),self.embedding_cfg.get('model'),self.embed_batch_cfg)
+        if batcher is not None:
+            return batcher.submit(text,self._embed_texts)
+        return self._embed_texts(text)
+
+    def _embed_texts(self,text:List[str]):
+        start=time.monotonic()
         resp=self._embed(input=text)
-        return np.array([data.embedding for data in resp.data])
+        self._record('embed',usage_stats(getattr(resp,'usage',None),start,model=getattr(resp,'model',None)))
+        return decode_embeddings(resp.data)
     
     def completion(self,text:str,**kwargs):
         return self._completion(prompt=text,**kwargs)
@@ -198,10 +433,21 @@ class OpenaiLLM(BaseLLM):
         return self._img_gen(*args,**kwargs)
 
     def rerank(self, query: str, documents: List[str],top_k=3) -> List[Dict[str, Union[int, float, str]]]:
-        results:List[Dict]=self._rerank(
+        start=time.monotonic()
+        resp=self._rerank(
             query=query,
             documents=documents,
-        ).get('results')
+        )
+        self._record('rerank',self._rerank_usage(resp,start))
+        return self._top_rerank(resp.get('results'),documents,top_k)
+
+    def _rerank_usage(self,resp:Dict,start:float)->Dict:
+        # 不同供应商返回usage或meta.tokens
+        usage=resp.get('usage') or {"prompt_tokens":resp.get('meta',{}).get('tokens',{}).get('input_tokens',0)}
+        return usage_stats(usage,start,model=resp.get('model') or self.rerank_cfg.get('model'))
+
+    @staticmethod
+    def _top_rerank(results:List[Dict],documents:List[str],top_k:int):
         top_results=sorted(results,key=lambda x:x['relevance_score'],reverse=1)[:top_k]
         return [{"text":documents[result['index']],'score':result['relevance_score']} for result in top_results]
 if __name__ == "__main__":
@@ -1,17 +1,187 @@
+"""
+非SDK接口(如/rerank)的通用请求
+共享连接池的requests.Session 连接/读取超时 gzip 以及429/5xx按Retry-After自动重试
+并记录每个接口的延迟直方图
+"""
 import os
+import asyncio
+import bisect
+import threading
+import time
+import weakref
 import requests
-from typing import List, Dict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Dict, Optional
 
-def _base_requst(client_cfg:Dict,request_data:Dict,suffix:str='/rerank'):
+default_request_cfg = {
+    "pool_connections": 10,
+    "pool_maxsize": 50,
+    "connect_timeout": 5,
+    "read_timeout": 60,
+    "retries": 3,
+    "backoff_factor": 0.5,
+}
+# 延迟直方图的桶上界(秒)
+latency_buckets = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+_sessions: Dict[tuple, requests.Session] = {}
+_lock = threading.Lock()
+
+
+class LatencyHistogram:
+    def __init__(self, buckets: List[float] = latency_buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, error: bool = False):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+            self.errors += int(error)
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估计分位数 落在最后一个桶时返回inf"""
+        with self._lock:
+            target = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets + [float("inf")], self.counts):
+                seen += count
+                if count and seen >= target:
+                    return bound
+        return 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+inf"], self.counts)),
+        }
+
+
+_histograms: Dict[str, LatencyHistogram] = {}
+
+
+def _histogram(name: str) -> LatencyHistogram:
+    with _lock:
+        if name not in _histograms:
+            _histograms[name] = LatencyHistogram()
+        return _histograms[name]
+
+
+def get_request_stats() -> Dict[str, Dict]:
+    return {name: hist.to_dict() for name, hist in list(_histograms.items())}
+
+
+def _get_session(base_url: str, cfg: Dict) -> requests.Session:
+    key = (base_url, cfg["pool_connections"], cfg["pool_maxsize"], cfg["retries"], cfg["backoff_factor"])
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            retry = Retry(
+                total=cfg["retries"],
+                backoff_factor=cfg["backoff_factor"],
+                status_forcelist=[429, 500, 502, 503, 504],
+                # rerank等接口是幂等的POST 允许重试
+                allowed_methods=None,
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=cfg["pool_connections"], pool_maxsize=cfg["pool_maxsize"], max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({"Accept-Encoding": "gzip, deflate"})
+            _sessions[key] = session
+    return session
+
+
+def _base_requst(client_cfg:Dict,request_data:Dict,suffix:str='/rerank',request_cfg:Optional[Dict]=None):
     api_key,base_url=client_cfg['api_key'],client_cfg['base_url']
+    cfg={**default_request_cfg,**(request_cfg or {})}
     url = f"{base_url}{suffix}"
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
         }
-    response = requests.post(url, headers=headers, json=request_data)
-    response.raise_for_status()
+    session=_get_session(base_url,cfg)
+    start=time.perf_counter()
+    error=True
+    try:
+        response = session.post(url, headers=headers, json=request_data, timeout=(cfg["connect_timeout"],cfg["read_timeout"]))
+        response.raise_for_status()
+        error=False
+    finally:
+        _histogram(suffix).observe(time.perf_counter()-start,error)
+
+    return response.json()
+
+# httpx.AsyncClient的连接绑定在创建它的事件循环上 按事件循环分别缓存
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, object]]" = weakref.WeakKeyDictionary()
+
+
+def _get_async_client(base_url: str, cfg: Dict):
+    import httpx
+    key = (base_url, cfg["pool_maxsize"], cfg["connect_timeout"], cfg["read_timeout"])
+    with _lock:
+        clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+        client = clients.get(key)
+        if client is None:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=cfg["pool_maxsize"]),
+                timeout=httpx.Timeout(cfg["read_timeout"], connect=cfg["connect_timeout"]),
+                headers={"Accept-Encoding": "gzip, deflate"},
+            )
+            clients[key] = client
+    return client
+
+
+def _retry_after(response, attempt: int, backoff_factor: float) -> float:
+    value = response.headers.get("Retry-After") if response is not None else None
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return backoff_factor * (2 ** attempt)
 
+
+async def _abase_requst(client_cfg:Dict,request_data:Dict,suffix:str='/rerank',request_cfg:Optional[Dict]=None):
+    """_base_requst的异步版本 重试策略相同"""
+    import httpx
+    api_key,base_url=client_cfg['api_key'],client_cfg['base_url']
+    cfg={**default_request_cfg,**(request_cfg or {})}
+    url = f"{base_url}{suffix}"
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        }
+    client=_get_async_client(base_url,cfg)
+    start=time.perf_counter()
+    error=True
+    try:
+        for attempt in range(cfg["retries"]+1):
+            response=None
+            try:
+                response = await client.post(url, headers=headers, json=request_data)
+                if response.status_code not in (429, 500, 502, 503, 504) or attempt==cfg["retries"]:
+                    break
+            except httpx.TransportError:
+                if attempt==cfg["retries"]:
+                    raise
+            await asyncio.sleep(_retry_after(response, attempt, cfg["backoff_factor"]))
+        response.raise_for_status()
+        error=False
+    finally:
+        _histogram(suffix).observe(time.perf_counter()-start,error)
     return response.json()
 
 if __name__ == "__main__":
@@ -0,0 +1,307 @@
+"""
+多供应商路由
+每个endpoint按请求类型(chat/completion/embed/rerank)记录EWMA延迟和错误率 请求发往最快的健康endpoint
+首个token之前出错自动切换到下一个endpoint 可选对冲: 超过该endpoint的p95延迟仍未返回时向次优endpoint再发一次 取先返回的
+embed/rerank只在同一个模型的endpoint之间切换 保证向量空间和分数一致
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Union
+from ._openai import OpenaiLLM
+from ._limiter import is_retryable
+
+default_router_cfg = {
+    # EWMA的平滑系数
+    "alpha": 0.3,
+    # 错误率超过该值时进入冷却 冷却期间只在其它endpoint都失败时使用
+    "max_error_rate": 0.5,
+    "cooldown": 30,
+    # 对冲请求 hedge_delay为样本不足hedge_min_samples时使用的等待秒数
+    "hedge": False,
+    "hedge_quantile": 0.95,
+    "hedge_delay": 2.0,
+    "hedge_min_samples": 20,
+    "window": 200,
+}
+_EMPTY = object()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="router")
+    return _executor
+
+
+class _Endpoint:
+    def __init__(self, llm: OpenaiLLM, name: str, window: int):
+        self.llm = llm
+        self.name = name
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.down_until = 0.0
+        self.samples: deque = deque(maxlen=window)
+        self.stats = {"requests": 0, "errors": 0, "hedged": 0}
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "latency": self.latency, "error_rate": self.error_rate,
+                "healthy": self.down_until <= time.monotonic(), **self.stats}
+
+
+def _close(resp):
+    if hasattr(resp, "close"):
+        resp.close()
+
+
+async def _aclose(resp):
+    if hasattr(resp, "aclose"):
+        await resp.aclose()
+
+
+class _Replay:
+    """
+    把peek出的第一个chunk放回流中 读完或close()时关闭底层响应
+    对冲中落后的响应还没有开始迭代 close()直接关闭底层响应 不依赖生成器的finally
+    """
+    def __init__(self, first, it, resp):
+        self._first = first
+        self._it = it
+        self._resp = resp
+
+    def __iter__(self):
+        try:
+            if self._first is not _EMPTY:
+                yield self._first
+            yield from self._it
+        finally:
+            self.close()
+
+    def close(self):
+        _close(self._resp)
+
+
+class _AReplay(_Replay):
+    async def __aiter__(self):
+        try:
+            if self._first is not _EMPTY:
+                yield self._first
+            async for chunk in self._it:
+                yield chunk
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        await _aclose(self._resp)
+
+
+def _close_result(future):
+    """落后的对冲请求成功返回时关闭它的流"""
+    if not future.cancelled() and future.exception() is None:
+        _close(future.result())
+
+
+class RouterLLM(OpenaiLLM):
+    def __init__(self, llm_configs: List[Dict], router_cfg: Optional[Dict] = None):
+        """
+        llm_configs: 多个OpenaiLLM的配置 顺序即没有延迟样本时的优先级
+        router_cfg: 见default_router_cfg 默认取第一个配置中的router_cfg
+        """
+        super().__init__(llm_configs[0])
+        self.router_cfg = {**default_router_cfg, **(router_cfg or llm_configs[0].get("router_cfg", {}))}
+        self.llms = [OpenaiLLM(cfg) for cfg in llm_configs]
+        for llm in self.llms:
+            # aembed/arerank由内部的llm记录用量 agent会替换路由器的metrics_tags 所以记录时转回路由器取当前的tags
+            llm._record = self._record
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, List[_Endpoint]] = {
+            "chat": self._group("chat_cfg", same_model=False),
+            "completion": self._group("completion_cfg", same_model=False),
+            "embed": self._group("embedding_cfg", same_model=True),
+            "rerank": self._group("rerank_cfg", same_model=True),
+        }
+        self._chat = lambda *args, **kwargs: self._route("chat", lambda llm: llm._chat(*args, **kwargs), kwargs.get("stream", False))
+        self._completion = lambda *args, **kwargs: self._route("completion", lambda llm: llm._completion(*args, **kwargs), kwargs.get("stream", False))
+        self._embed = lambda *args, **kwargs: self._route("embed", lambda llm: llm._embed(*args, **kwargs))
+        self._rerank = lambda *args, **kwargs: self._route("rerank", lambda llm: llm._rerank(*args, **kwargs))
+
+    def _group(self, cfg_name: str, same_model: bool) -> List[_Endpoint]:
+        llms = self.llms
+        if same_model:
+            # 以第一个配置了该模型的endpoint为准
+            models = [getattr(llm, cfg_name).get("model") for llm in llms]
+            model = next((m for m in models if m), None)
+            llms = [llm for llm, m in zip(llms, models) if m == model]
+        return [
+            _Endpoint(llm, f"{llm.client_cfg.get('base_url')}|{getattr(llm, cfg_name).get('model')}", self.router_cfg["window"])
+            for llm in llms
+        ]
+
+    @property
+    def stats(self) -> Dict[str, List[Dict]]:
+        with self._lock:
+            return {kind: [ep.to_dict() for ep in endpoints] for kind, endpoints in self._endpoints.items()}
+
+    def _ranked(self, kind: str) -> List[_Endpoint]:
+        """健康的在前 其中有延迟样本的按延迟*(1+错误率)排序 没有样本的按配置顺序排在后面"""
+        now = time.monotonic()
+        with self._lock:
+            endpoints = list(enumerate(self._endpoints[kind]))
+            endpoints.sort(key=lambda x: (
+                x[1].down_until > now,
+                x[1].latency is None,
+                (x[1].latency or 0.0) * (1 + x[1].error_rate),
+                x[1].error_rate,
+                x[0],
+            ))
+        return [ep for _, ep in endpoints]
+
+    def _observe(self, ep: _Endpoint, latency: Optional[float] = None, error: bool = False):
+        alpha = self.router_cfg["alpha"]
+        with self._lock:
+            ep.stats["requests"] += 1
+            ep.error_rate = (1 - alpha) * ep.error_rate + alpha * float(error)
+            if error:
+                ep.stats["errors"] += 1
+                if ep.error_rate > self.router_cfg["max_error_rate"]:
+                    ep.down_until = time.monotonic() + self.router_cfg["cooldown"]
+                return
+            ep.samples.append(latency)
+            ep.latency = latency if ep.latency is None else (1 - alpha) * ep.latency + alpha * latency
+
+    def _hedge_delay(self, ep: _Endpoint) -> float:
+        with self._lock:
+            samples = sorted(ep.samples)
+        if len(samples) < self.router_cfg["hedge_min_samples"]:
+            return self.router_cfg["hedge_delay"]
+        return samples[int(self.router_cfg["hedge_quantile"] * (len(samples) - 1))]
+
+    def _attempt(self, ep: _Endpoint, call: Callable, stream: bool):
+        """流式请求读到第一个chunk才算成功 延迟记为首token时间"""
+        start = time.monotonic()
+        try:
+            resp = call(ep.llm)
+            if stream:
+                it = iter(resp)
+                first = next(it, _EMPTY)
+                resp = _Replay(first, it, resp)
+        except Exception:
+            self._observe(ep, error=True)
+            raise
+        self._observe(ep, latency=time.monotonic() - start)
+        return resp
+
+    def _route(self, kind: str, call: Callable, stream: bool = False):
+        """按排序依次尝试 开启对冲时主endpoint超过p95未返回就同时请求下一个 取先成功的"""
+        executor = _get_executor()
+        endpoints = self._ranked(kind)
+        error = None
+        i = 0
+        while i < len(endpoints):
+            ep = endpoints[i]
+            backup = endpoints[i + 1] if self.router_cfg["hedge"] and i + 1 < len(endpoints) else None
+            i += 1
+            if backup is None:
+                try:
+                    return self._attempt(ep, call, stream)
+                except Exception as e:
+                    if not is_retryable(e):
+                        raise
+                    error = e
+                    continue
+            pending = {executor.submit(self._attempt, ep, call, stream)}
+            done, _ = wait(pending, timeout=self._hedge_delay(ep))
+            if not done:
+                with self._lock:
+                    backup.stats["hedged"] += 1
+                pending.add(executor.submit(self._attempt, backup, call, stream))
+                i += 1
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        # 落后的请求无法中断 流式响应在返回后立即关闭 同一轮中一起完成的也要关闭
+                        if stream:
+                            for loser in (done | pending) - {future}:
+                                loser.add_done_callback(_close_result)
+                        return future.result()
+                    error = future.exception()
+                    if not is_retryable(error):
+                        raise error
+                    # 对冲中的一个失败时补上下一个endpoint
+                    if pending and i < len(endpoints):
+                        pending.add(executor.submit(self._attempt, endpoints[i], call, stream))
+                        i += 1
+        raise error
+
+    async def _aattempt(self, ep: _Endpoint, call: Callable, stream: bool):
+        start = time.monotonic()
+        try:
+            resp = await call(ep.llm)
+            if stream:
+                it = resp.__aiter__()
+                try:
+                    first = await it.__anext__()
+                except StopAsyncIteration:
+                    first = _EMPTY
+                except asyncio.CancelledError:
+                    # 对冲中落后被取消 关闭已经建立的流
+                    await _aclose(resp)
+                    raise
+                resp = _AReplay(first, it, resp)
+        except Exception:
+            self._observe(ep, error=True)
+            raise
+        self._observe(ep, latency=time.monotonic() - start)
+        return resp
+
+    async def _aroute(self, kind: str, call: Callable, stream: bool = False):
+        endpoints = self._ranked(kind)
+        error = None
+        i = 0
+        while i < len(endpoints):
+            ep = endpoints[i]
+            backup = endpoints[i + 1] if self.router_cfg["hedge"] and i + 1 < len(endpoints) else None
+            primary = asyncio.ensure_future(self._aattempt(ep, call, stream))
+            tasks = {primary}
+            i += 1
+            if backup is not None:
+                done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay(ep))
+                if not done:
+                    with self._lock:
+                        backup.stats["hedged"] += 1
+                    tasks.add(asyncio.ensure_future(self._aattempt(backup, call, stream)))
+                    i += 1
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        for loser in tasks:
+                            loser.cancel()
+                        # 同一轮中一起完成的落后请求
+                        for other in done - {task}:
+                            if stream and other.exception() is None:
+                                await other.result().aclose()
+                        return task.result()
+                    error = task.exception()
+                    if not is_retryable(error):
+                        raise error
+                    if tasks and i < len(endpoints):
+                        tasks.add(asyncio.ensure_future(self._aattempt(endpoints[i], call, stream)))
+                        i += 1
+        raise error
+
+    async def _achat(self, **kwargs):
+        return await self._aroute("chat", lambda llm: llm._achat(**kwargs), kwargs.get("stream", False))
+
+    async def aembed(self, text: Union[str, list[str]], **kwargs):
+        return await self._aroute("embed", lambda llm: llm.aembed(text, **kwargs))
+
+    async def arerank(self, query: str, documents: List[str], top_k=3) -> List[Dict[str, Union[int, float, str]]]:
+        return await self._aroute("rerank", lambda llm: llm.arerank(query, documents, top_k))
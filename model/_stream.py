@@ -0,0 +1,194 @@
+"""
+chat/schat共用的响应解析
+流式响应逐chunk累积 同步和异步接口共用 保证产出的Message完全一致
+"""
+import time
+from typing import Any, Dict, Generator, List, Optional
+from utils._json_stream import JsonStreamParser
+from .msg import Message, MessageDelta
+from ._metrics import usage_stats
+
+
+class StreamState:
+    """
+    增量内容先放进list 结束时只join一次 避免长回答上的二次方字符串拼接
+    每个token只产出一个轻量的MessageDelta 完整的Message在final中只构建一次
+    """
+    __slots__ = ('id', 'created', 'model', 'usage', 'start', 'first_token', '_content', '_reasoning', '_tool_calls', '_taken')
+
+    def __init__(self, start: Optional[float] = None):
+        """start: 发出请求的time.monotonic() 用于计算首token时间和生成速度"""
+        self.id: Optional[str] = None
+        self.model: Optional[str] = None
+        # stream_options.include_usage时最后一个chunk的usage
+        self.usage = None
+        self.start = start
+        self.first_token: Optional[float] = None
+        self.created: Optional[str] = None
+        self._content: List[str] = []
+        self._reasoning: List[str] = []
+        # [id,name,[arguments片段],JsonStreamParser] 参数片段到达时增量解析
+        self._tool_calls: List[list] = []
+        # 已经被completed_tool_calls取走的下标
+        self._taken: set = set()
+
+    @property
+    def content(self) -> str:
+        return "".join(self._content)
+
+    @property
+    def reasoning_content(self) -> str:
+        return "".join(self._reasoning)
+
+    @property
+    def tool_calls(self) -> List[Dict]:
+        return [{"id": _id, "function": {"name": name, "arguments": "".join(args)}} for _id, name, args, _ in self._tool_calls]
+
+    def feed(self, chunk) -> Generator[MessageDelta, Any, None]:
+        """累积一个chunk 产出需要推送给调用方的增量"""
+        self.id = chunk.id
+        self.created = chunk.created
+        self.model = getattr(chunk, 'model', None) or self.model
+        # usage在choices为空的最后一个chunk中 必须在跳过空choices之前读取
+        usage = getattr(chunk, 'usage', None)
+        if usage:
+            self.usage = usage
+        choices = chunk.choices
+        if not choices:
+            return
+        delta = choices[0].delta
+        content = getattr(delta, 'content', None)
+        reasoning_content = getattr(delta, 'reasoning_content', None)
+        tool_call_deltas = getattr(delta, 'tool_calls', None)
+        if self.first_token is None and (content or reasoning_content or tool_call_deltas):
+            self.first_token = time.monotonic()
+        if content:
+            self._content.append(content)
+            yield MessageDelta(self.id, self.created, content=content)
+        if reasoning_content:
+            self._reasoning.append(reasoning_content)
+            yield MessageDelta(self.id, self.created, content="", reasoning_content=reasoning_content)
+        if tool_call_deltas:
+            for tool_call_delta in tool_call_deltas:
+                self._feed_tool_call(tool_call_delta)
+
+    def _feed_tool_call(self, tool_call_delta) -> list:
+        tool_calls = self._tool_calls
+        while len(tool_calls) <= tool_call_delta.index:
+            tool_calls.append(["", "", [], JsonStreamParser()])
+        current_tool_call = tool_calls[tool_call_delta.index]
+        _id = getattr(tool_call_delta, 'id', None)
+        if _id:
+            current_tool_call[0] = _id
+        function = getattr(tool_call_delta, 'function', None)
+        if function:
+            name = getattr(function, 'name', None)
+            if name:
+                current_tool_call[1] = name
+            arguments = getattr(function, 'arguments', None)
+            if arguments:
+                current_tool_call[2].append(arguments)
+                current_tool_call[3].feed(arguments)
+        return current_tool_call
+
+    def tool_call(self, index: int) -> Dict:
+        _id, name, args, _ = self._tool_calls[index]
+        return {"id": _id, "function": {"name": name, "arguments": "".join(args)}}
+
+    def completed_tool_calls(self) -> List[int]:
+        """
+        返回id/name已知且arguments已经是完整JSON 并且还没被取走的tool call下标
+        参数在到达时已经增量扫描过 这里只检查解析器的状态 不再重复解析整个参数
+        """
+        ready = []
+        for index, (_id, name, args, parser) in enumerate(self._tool_calls):
+            if index in self._taken or not (_id and name) or not parser.complete or parser.error is not None:
+                continue
+            self._taken.add(index)
+            ready.append(index)
+        return ready
+
+    def final(self, with_tools: bool = True) -> Message:
+        """流结束后追加到Messages中的完整消息"""
+        if with_tools and self._tool_calls:
+            msg = Message.tool_call_response(self.id, self.created, self.content, self.tool_calls)
+        else:
+            msg = Message.assistant(self.id, self.created, content=self.content, reasoning_content=self.reasoning_content)
+        msg.usage = usage_stats(self.usage, self.start, self.first_token, model=self.model)
+        return msg
+
+
+def resp_message(resp, with_tools: bool = True, start: Optional[float] = None, end: Optional[float] = None) -> Message:
+    """非流式响应转为Message with_tools时保留函数调用 start/end为请求的起止时间"""
+    msg = _resp_message(resp, with_tools)
+    msg.usage = usage_stats(getattr(resp, 'usage', None), start, end=end, model=getattr(resp, 'model', None))
+    return msg
+
+
+def _resp_message(resp, with_tools: bool) -> Message:
+    resp_msg = resp.choices[0].message
+    content = getattr(resp_msg, 'content', None) or ""
+    reasoning_content = getattr(resp_msg, 'reasoning_content', None) or ""
+    if with_tools and resp.choices[0].finish_reason == "tool_calls":
+        meta_data = resp_msg.model_dump()
+        return Message.assistant(
+            resp.id,
+            resp.created,
+            content=meta_data['content'],
+            reasoning_content=meta_data.get('reasoning_content', None),
+            tool_calls=meta_data.get('tool_calls', None)
+        )
+    return Message.assistant(resp.id, resp.created, content=content, reasoning_content=reasoning_content)
+
+
+if __name__ == "__main__":
+    # 回放一个5万token的流 对比逐token拼接字符串+构建Message的旧实现
+    # python -m model._stream [recorded.jsonl] jsonl每行是一个chunk的model_dump()
+    import json
+    import sys
+    import time
+    from types import SimpleNamespace
+
+    def _ns(data):
+        if isinstance(data, dict):
+            return SimpleNamespace(**{k: _ns(v) for k, v in data.items()})
+        if isinstance(data, list):
+            return [_ns(v) for v in data]
+        return data
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            chunks = [_ns(json.loads(line)) for line in f if line.strip()]
+    else:
+        chunks = [
+            _ns({"id": "bench", "created": 0, "choices": [{"delta": {
+                "content": None if i < 20000 else f"tok{i % 97} ",
+                "reasoning_content": f"r{i % 89} " if i < 20000 else None,
+                "tool_calls": None}}]})
+            for i in range(50000)
+        ]
+
+    def _baseline(resp):
+        content, reasoning_content = '', ''
+        for chunk in resp:
+            delta = chunk.choices[0].delta
+            if hasattr(delta, 'content') and delta.content:
+                content += delta.content
+                yield Message.assistant(chunk.id, chunk.created, content=delta.content)
+            if hasattr(delta, 'reasoning_content') and delta.reasoning_content:
+                reasoning_content += delta.reasoning_content
+                yield Message.assistant(chunk.id, chunk.created, content="", reasoning_content=delta.reasoning_content)
+        yield Message.assistant(chunk.id, chunk.created, content=content, reasoning_content=reasoning_content)
+
+    def _lean(resp):
+        state = StreamState()
+        for chunk in resp:
+            yield from state.feed(chunk)
+        yield state.final()
+
+    for name, fn in [("baseline", _baseline), ("lean", _lean)]:
+        start = time.perf_counter()
+        for _ in range(5):
+            for _msg in fn(chunks):
+                pass
+        print(f"{name}: {(time.perf_counter() - start) / 5 * 1000:.1f} ms per {len(chunks)} chunks")
@@ -0,0 +1,358 @@
+"""
+常驻的函数调用执行器
+所有agent共享一个线程池 不再为每批工具调用新建线程池
+func_call是async函数时在执行器的事件循环中运行 同步工具在该循环中转到线程池
+同一批中的async工具/MCP工具/同步工具共用一个事件循环 大量I/O型调用不需要同样多的线程
+按工具限制并发 超出上限的调用在该工具的队列中等待 不占用线程
+每个调用有截止时间 到期时仍在排队的直接取消 运行中的协程被取消
+运行中的同步调用无法中断 结果被丢弃(orphan) 在线程真正结束后才归还并发名额
+协程中通过run_in_executor/to_thread转到线程池的同步部分同样按orphan处理 线程结束后才归还名额
+卡住的同步工具会一直占用一个线程 使可用的max_workers永久减少 可能卡住的工具应设置较小的max_concurrency
+按工具统计排队深度/运行数/超时数和延迟分布
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import fnmatch
+import heapq
+import inspect
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Generator, List, Optional
+from ._request_llm import LatencyHistogram
+from .msg import Message
+
+logger = logging.getLogger(__name__)
+
+default_tool_executor_cfg = {
+    "max_workers": 16,
+    # 单个工具的并发上限 小于max_workers 一个工具不会占满所有线程
+    "max_concurrency": 4,
+    # 截止时间(秒) None表示不限
+    "timeout": 120,
+    # 按工具名覆盖 支持通配符 如{"mcp_*":{"timeout":30},"bash":{"max_concurrency":1}}
+    # MCP工具直接在事件循环中await 不占用线程 可以有更高的并发
+    "tools": {"mcp_*": {"max_concurrency": 64}},
+}
+# 正在执行的协程调用 线程池据此记录它转到线程中的部分
+_current_job: contextvars.ContextVar = contextvars.ContextVar("tool_job", default=None)
+
+
+class _ToolState:
+    def __init__(self, max_concurrency: int, timeout: Optional[float]):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.running = 0
+        self.queue: Deque["_Job"] = deque()
+        self.latency = LatencyHistogram()
+        self.stats = {"submitted": 0, "completed": 0, "errors": 0, "timeouts": 0,
+                      "cancelled": 0, "orphaned": 0, "max_queued": 0, "wait_total": 0.0}
+
+    def to_dict(self) -> Dict:
+        latency = self.latency.to_dict()
+        started = self.stats["submitted"] - self.stats["cancelled"] - len(self.queue)
+        return {
+            **{k: v for k, v in self.stats.items() if k != "wait_total"},
+            "running": self.running,
+            "queued": len(self.queue),
+            "avg_wait": self.stats["wait_total"] / started if started else 0.0,
+            "avg_latency": latency["avg"],
+            "p50_latency": latency["p50"],
+            "p95_latency": latency["p95"],
+            "p99_latency": latency["p99"],
+        }
+
+
+class _Job:
+    __slots__ = ('name', 'fn', 'tool_call', 'future', 'state', 'submitted', 'started', 'deadline', 'task',
+                 'threads', 'finished')
+
+    def __init__(self, name: str, fn: Callable, tool_call: Dict, state: _ToolState):
+        self.name = name
+        self.fn = fn
+        self.tool_call = tool_call
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        self.state = state
+        self.submitted = time.monotonic()
+        self.started: Optional[float] = None
+        self.deadline = self.submitted + state.timeout if state.timeout else None
+        # 协程调用在事件循环中的句柄 超时时用于取消
+        self.task: Optional[concurrent.futures.Future] = None
+        # 协程调用转到线程池中还没有结束的部分
+        self.threads: set = set()
+        self.finished = False
+
+
+class _ToolPool(concurrent.futures.ThreadPoolExecutor):
+    """记录协程调用提交到线程池的同步部分 协程被取消后线程仍在运行 要等它结束才归还并发名额"""
+    def __init__(self, executor: "ToolExecutor", **kwargs):
+        super().__init__(**kwargs)
+        self._executor = executor
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = super().submit(fn, *args, **kwargs)
+        job = _current_job.get()
+        if job is not None:
+            self._executor._track(job, future)
+        return future
+
+
+def _resolve(future: concurrent.futures.Future, result: Any = None, error: Optional[BaseException] = None) -> bool:
+    """超时和执行结束可能同时发生 只有先到的一方生效"""
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+        return True
+    except concurrent.futures.InvalidStateError:
+        return False
+
+
+class ToolExecutor:
+    def __init__(self,
+                 max_workers: int = default_tool_executor_cfg["max_workers"],
+                 max_concurrency: int = default_tool_executor_cfg["max_concurrency"],
+                 timeout: Optional[float] = default_tool_executor_cfg["timeout"],
+                 tools: Optional[Dict[str, Dict]] = None):
+        """
+        max_workers: 所有工具共享的线程数
+        max_concurrency/timeout: 单个工具的并发上限和截止时间
+        tools: 按工具名(可用通配符)覆盖max_concurrency/timeout
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.tools = tools or {}
+        self._pool = _ToolPool(self, max_workers=max_workers, thread_name_prefix="tool")
+        # async工具的事件循环 其中的to_thread/run_in_executor使用同一个线程池
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._pool)
+        threading.Thread(target=self._loop.run_forever, name="tool_loop", daemon=True).start()
+        self._states: Dict[str, _ToolState] = {}
+        self._lock = threading.Lock()
+        # 截止时间的小顶堆 由一个线程统一等待
+        self._deadlines: List[tuple] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition(self._lock)
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def _tool_cfg(self, name: str) -> Dict:
+        cfg = self.tools.get(name)
+        if cfg is None:
+            cfg = next((v for k, v in self.tools.items() if fnmatch.fnmatchcase(name, k)), {})
+        return cfg
+
+    def _state(self, name: str) -> _ToolState:
+        state = self._states.get(name)
+        if state is None:
+            cfg = self._tool_cfg(name)
+            state = self._states[name] = _ToolState(cfg.get("max_concurrency", self.max_concurrency),
+                                                    cfg.get("timeout", self.timeout))
+        return state
+
+    def submit(self, tool_call: Dict, func_call: Callable[[Dict], Any]) -> concurrent.futures.Future:
+        """
+        提交一个函数调用 返回的Future在完成/出错/超时时结束 超时时为TimeoutError
+        func_call可以是同步函数(在线程池中执行)或async函数(在执行器的事件循环中执行)
+        """
+        name = tool_call['function']['name']
+        with self._lock:
+            state = self._state(name)
+            job = _Job(name, func_call, tool_call, state)
+            state.stats["submitted"] += 1
+            start = state.running < state.max_concurrency
+            if start:
+                state.running += 1
+                job.started = job.submitted
+            else:
+                state.queue.append(job)
+                state.stats["max_queued"] = max(state.stats["max_queued"], len(state.queue))
+            if job.deadline is not None:
+                heapq.heappush(self._deadlines, (job.deadline, next(self._seq), job))
+                self._cond.notify()
+        # 调用方不再需要结果时(如流式对话被提前关闭)可以直接cancel返回的Future
+        job.future.add_done_callback(lambda f: self._cancel(job) if f.cancelled() else None)
+        if start:
+            self._dispatch(job)
+        return job.future
+
+    def _cancel(self, job: _Job):
+        """调用方取消了Future 还在排队的直接移出队列 运行中的协程被取消 运行中的同步调用无法中断 照常结束"""
+        with self._lock:
+            if job.started is None:
+                if job in job.state.queue:
+                    job.state.queue.remove(job)
+                    job.state.stats["cancelled"] += 1
+            elif job.task is not None:
+                job.task.cancel()
+
+    def _dispatch(self, job: _Job):
+        if inspect.iscoroutinefunction(job.fn):
+            # 在锁内记下句柄 到期时一定能取消
+            with self._lock:
+                job.task = asyncio.run_coroutine_threadsafe(self._arun(job), self._loop)
+            # 开始执行之前就被取消时_arun不会运行 在这里归还名额
+            # 取消发生在持有锁的_expire中 回调会同步执行 所以转到事件循环中处理
+            job.task.add_done_callback(lambda _: self._loop.call_soon_threadsafe(self._finish, job, None, None, False))
+        else:
+            self._pool.submit(self._run, job)
+
+    def _run(self, job: _Job):
+        if job.future.done():
+            # 在线程池的队列中等待时已经到期 调用方已经收到TimeoutError 不再执行 避免超时之后才产生副作用
+            with self._lock:
+                # 到期时按orphan记录 实际没有执行 被调用方取消的没有记过orphan
+                if not job.future.cancelled():
+                    job.state.stats["orphaned"] -= 1
+                job.state.stats["cancelled"] += 1
+            self._finish(job, None, None, ran=False)
+            return
+        result, error = None, None
+        try:
+            result = job.fn(job.tool_call)
+        except Exception as e:
+            error = e
+        self._finish(job, result, error)
+
+    async def _arun(self, job: _Job):
+        if job.future.done():
+            self._finish(job, None, None, ran=False)
+            return
+        token = _current_job.set(job)
+        result, error = None, None
+        try:
+            result = await job.fn(job.tool_call)
+        except asyncio.CancelledError as e:
+            # 超时取消 Future已经以TimeoutError结束
+            error = e
+        except Exception as e:
+            error = e
+        finally:
+            # _finish可能从队列中开始下一个同步调用 不能让线程池把它记到这个已结束的调用名下
+            _current_job.reset(token)
+        self._finish(job, result, error)
+
+    def _finish(self, job: _Job, result: Any, error: Optional[BaseException], ran: bool = True):
+        end = time.monotonic()
+        state = job.state
+        resolved = ran and _resolve(job.future, result, error)
+        with self._lock:
+            if job.finished:
+                return
+            # 超时的协程在_expire中已经记下延迟
+            if ran and (resolved or job.task is None):
+                state.latency.observe(end - job.started, error=error is not None)
+            if resolved:
+                state.stats["completed"] += 1
+                state.stats["errors"] += int(error is not None)
+            job.finished = True
+            if job.threads:
+                # 协程已经结束(通常是超时取消) 但转到线程中的同步部分还在运行
+                return
+            next_job = self._release(state, end)
+        if next_job is not None:
+            self._dispatch(next_job)
+
+    def _release(self, state: _ToolState, now: float) -> Optional[_Job]:
+        """持有锁时调用 归还并发名额 返回可以开始的下一个调用"""
+        state.running -= 1
+        if state.queue and state.running < state.max_concurrency:
+            # 在锁内标记为已开始 之后到期的按orphan处理
+            next_job = state.queue.popleft()
+            next_job.started = now
+            state.stats["wait_total"] += now - next_job.submitted
+            state.running += 1
+            return next_job
+        return None
+
+    def _track(self, job: _Job, future: concurrent.futures.Future):
+        with self._lock:
+            job.threads.add(future)
+        future.add_done_callback(lambda f: self._thread_done(job, f))
+
+    def _thread_done(self, job: _Job, future: concurrent.futures.Future):
+        with self._lock:
+            job.threads.discard(future)
+            if not job.finished or job.threads:
+                return
+            next_job = self._release(job.state, time.monotonic())
+        if next_job is not None:
+            self._dispatch(next_job)
+
+    def _watch(self):
+        with self._cond:
+            while True:
+                while self._deadlines and self._deadlines[0][2].future.done():
+                    heapq.heappop(self._deadlines)
+                if not self._deadlines:
+                    self._cond.wait()
+                    continue
+                wait = self._deadlines[0][0] - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                _, _, job = heapq.heappop(self._deadlines)
+                self._expire(job)
+
+    def _expire(self, job: _Job):
+        """持有锁时调用"""
+        state = job.state
+        error = TimeoutError(f"tool {job.name} timed out after {state.timeout}s")
+        if not _resolve(job.future, error=error):
+            return
+        state.stats["timeouts"] += 1
+        if job.started is None:
+            state.queue.remove(job)
+            state.stats["cancelled"] += 1
+        elif job.task is not None:
+            # 协程可以真正取消 但其中已经在线程里运行的同步部分无法中断
+            # 取消后协程可能来不及运行到_finish 在这里按超时记下延迟
+            state.latency.observe(time.monotonic() - job.started, error=True)
+            job.task.cancel()
+            if any(f.running() for f in job.threads):
+                state.stats["orphaned"] += 1
+                logger.warning(f"tool {job.name} exceeded {state.timeout}s, its thread keeps running and the result will be discarded")
+            else:
+                state.stats["cancelled"] += 1
+        else:
+            state.stats["orphaned"] += 1
+            logger.warning(f"tool {job.name} exceeded {state.timeout}s, result will be discarded")
+
+    def collect(self, tool_calls: List[Dict], futures: Optional[Dict[int, concurrent.futures.Future]],
+                func_call: Callable[[Dict], Any]) -> Generator[Message, None, None]:
+        """按tool_calls的顺序产出结果 futures为提前提交的调用 其余的在这里提交"""
+        futures = {**(futures or {})}
+        for index, tool_call in enumerate(tool_calls):
+            if index not in futures:
+                futures[index] = self.submit(tool_call, func_call)
+        for index, tool_call in enumerate(tool_calls):
+            try:
+                content = str(futures[index].result())
+            except Exception as exc:
+                content = f'Error: {exc}'
+            yield Message.tool_result(tool_call_id=tool_call['id'], content=content)
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: state.to_dict() for name, state in self._states.items()}
+
+    def shutdown(self, wait: bool = False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_executor: Optional[ToolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_tool_executor(tool_executor_cfg: Optional[Dict] = None) -> ToolExecutor:
+    """进程内共享的执行器 参数以第一次创建时为准"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ToolExecutor(**{**default_tool_executor_cfg, **(tool_executor_cfg or {})})
+    return _executor
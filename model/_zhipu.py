@@ -6,31 +6,37 @@ from zhipuai import ZhipuAI
 from typing import Any, Callable, Dict, List, Union
 from ._openai import OpenaiLLM
 from .msg import Message, Messages
+from ._client import get_client
 class ZhiPuLLm(OpenaiLLM):
     def __init__(self, llm_config: Dict | None = None):
         super().__init__(llm_config)
+        # 智谱的SDK不接受stream_options 流式响应的最后一个chunk本身就带usage
+        self.include_usage = (llm_config or {}).get('include_usage', False)
         def _chat(*args,**kwargs):
-            client=ZhipuAI(**self.client_cfg)
+            client=self.client()
             return client.chat.completions.create(*args,**{**self.generation_cfg,**kwargs})
         def _embed(*args,**kwargs):
-            client=ZhipuAI(**self.client_cfg)
+            client=self.client()
             return client.embeddings.create(*args,**{**self.embedding_cfg,**kwargs})
         def _video_gen(*args,**kwargs):
-            client=ZhipuAI(**self.client_cfg)
+            client=self.client()
             return  client.videos.generations(*args,**kwargs)
         def _assistant(*args,**kwargs):
-            client=ZhipuAI(**self.client_cfg)
+            client=self.client()
             return client.assistant.conversation(*args,**kwargs)
         def _moderations(*args,**kwargs):
             """内容安全部分"""
-            client=ZhipuAI(**self.client_cfg)
+            client=self.client()
             return client.moderations.create(*args,**kwargs)
-        self._chat=_chat
-        self._embed=_embed
+        self._chat=self._limited(_chat,self.chat_cfg)
+        self._embed=self._limited(_embed,self.embedding_cfg)
         self._video_gen=_video_gen
         self._assistant=_assistant
         self._moderations=_moderations
 
+    def client(self)->ZhipuAI:
+        return get_client(ZhipuAI,self.client_cfg,self.pool_cfg)
+
     def video_gen(self,*args,**kwargs):
         """
         https://www.bigmodel.cn/dev/api/videomodel/cogvideox
@@ -1,12 +1,15 @@
 """
 实现对于函数调用的执行
 支持并行和非并行执行
+func_call可以是同步函数或async函数 默认使用aexecute_func
 """
 import json
 from typing import Callable, Dict, List,  Union,Any,Generator
 from .msg import Message
-import concurrent
-MAX_WORKERS=5
+import asyncio
+import concurrent.futures
+from typing import AsyncGenerator
+from ._tool_executor import get_tool_executor
 def execute_func(tool_call):
     tool_result=None
     try:
@@ -18,44 +21,56 @@ def execute_func(tool_call):
         tool_result=f"error:{e}"
     return str(tool_result)
 
+async def aexecute_func(tool_call):
+    """
+    execute_func的异步版本 默认的执行方式
+    在执行器的事件循环中运行 async工具和MCP工具直接await 同步工具转到线程池
+    """
+    tool_result=None
+    try:
+        from tools import aexecute_tool
+        tool_name = tool_call['function']['name']
+        args = json.loads(tool_call['function']['arguments'])
+        tool_result = await aexecute_tool(tool_name, args)
+    except  Exception as e:
+        tool_result=f"error:{e}"
+    return str(tool_result)
+
+def submit_func_call(tool_call: Dict[str, Union[str, Dict]], func_call: Callable[[Dict[str, Union[str, Dict]]], Any]=aexecute_func) -> concurrent.futures.Future:
+    """提前提交单个函数调用 流式生成过程中参数完整后即可开始执行 超时的Future以TimeoutError结束"""
+    return get_tool_executor().submit(tool_call, func_call)
+
+def collect_func_call(tool_calls: List[Dict[str, Union[str, Dict]]], futures: Dict[int, concurrent.futures.Future], func_call: Callable[[Dict[str, Union[str, Dict]]], Any]=aexecute_func) -> Generator[Message, None, None]:
+    """按tool_calls的顺序产出结果 没有提前提交的调用在这里补交"""
+    return get_tool_executor().collect(tool_calls, futures, func_call)
+
 def _parallel_func_call(tool_calls: List[Dict[str, Union[str, Dict]]], func_call: Callable[[Dict[str, Union[str, Dict]]], Any]) -> Generator[Message, None, None]:
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_tool_call = {executor.submit(func_call, tool_call): tool_call for tool_call in tool_calls}
-        for future in concurrent.futures.as_completed(future_to_tool_call):
-            tool_call = future_to_tool_call[future]
-            try:
-                result = future.result()
-                print(f"Tool call {tool_call} result: {result}")
-                curr_msg = Message.tool_result(
-                    tool_call_id=tool_call['id'],
-                    content=str(result)
-                )
-                yield curr_msg
-            except Exception as exc:
-                curr_msg = Message.tool_result(
-                    tool_call_id=tool_call['id'],
-                    content=f'Error: {exc}'
-                )
-                yield curr_msg
+    # 共享的常驻执行器 结果按tool_calls的顺序产出
+    return get_tool_executor().collect(tool_calls, None, func_call)
 
 def _normal_func_call(tool_calls: List[Dict[str, Union[str, Dict]]], func_call: Callable[[Dict[str, Union[str, Dict]]], Any]) -> Generator[Message, None, None]:
+    # 逐个提交并等待 同样受截止时间约束
     for tool_call in tool_calls:
-        try:
-            result_content = func_call(tool_call)
-            curr_msg = Message.tool_result(
-                tool_call_id=tool_call.id,
-                content=str(result_content)
-            )
-            yield curr_msg
-        except Exception as exc:
-            curr_msg = Message.tool_result(
-                tool_call_id=tool_call.id,
-                content=f'Error: {exc}'
-            )
-            yield curr_msg
-
-def func_call(tool_calls: List[Dict[str, Union[str, Dict]]], func_call: Callable[[Dict[str, Union[str, Dict]]], Any]=execute_func, parallel: bool = True) -> Generator[Message, None, None]:
+        yield from get_tool_executor().collect([tool_call], None, func_call)
+
+def func_call(tool_calls: List[Dict[str, Union[str, Dict]]], func_call: Callable[[Dict[str, Union[str, Dict]]], Any]=aexecute_func, parallel: bool = True) -> Generator[Message, None, None]:
     if parallel:
         return _parallel_func_call(tool_calls, func_call)
     else:
-        return _normal_func_call(tool_calls, func_call)
\ No newline at end of file
+        return _normal_func_call(tool_calls, func_call)
+
+async def afunc_call(tool_calls: List[Dict[str, Union[str, Dict]]], func_call: Callable[[Dict[str, Union[str, Dict]]], Any]=aexecute_func, parallel: bool = True) -> AsyncGenerator[Message, None]:
+    """func_call的异步版本 工具在共享的执行器中执行 结果按tool_calls的顺序产出"""
+    if parallel:
+        for tool_result in await asyncio.gather(*[arun_func_call(tool_call, func_call) for tool_call in tool_calls]):
+            yield tool_result
+    else:
+        for tool_call in tool_calls:
+            yield await arun_func_call(tool_call, func_call)
+
+async def arun_func_call(tool_call: Dict[str, Union[str, Dict]], func_call: Callable[[Dict[str, Union[str, Dict]]], Any]=aexecute_func) -> Message:
+    try:
+        content = str(await asyncio.wrap_future(submit_func_call(tool_call, func_call)))
+    except Exception as exc:
+        content = f'Error: {exc}'
+    return Message.tool_result(tool_call_id=tool_call['id'], content=content)
@@ -4,9 +4,10 @@
 并提供了消息的创建、转换为字典和JSON格式的方法
 """
 from dataclasses import dataclass
+from hashlib import sha256
 from time import time
 import json
-from typing import Union,Dict,List,Optional
+from typing import Union,Dict,List,Optional,Callable
 
 @dataclass(frozen=False)
 class Message:
@@ -18,6 +19,8 @@ class Message:
     reasoning_content:Optional[Union[str, Dict, List]]=None 
     tool_call_id: Optional[str] = None 
     tool_calls:Optional[List[Dict]]=None 
+    # 用量与延迟 见model/_metrics.py:usage_stats 不会发送给模型
+    usage:Optional[Dict]=None
     
     """补充字段 候补 后续来进行优化"""
     # refusal: None
@@ -52,12 +55,16 @@ class Message:
     def check_tool_result(message:'Message'):
         return message.role=="tool" and message.tool_call_id and message.content
     def to_dict(self):
-        required_fields=['role','content',"tool_call_id","tool_calls"]
+        """请求用的wire格式 只保留非空的role/content/tool_call_id/tool_calls"""
         msg={}
-        for field in required_fields:
-            val=getattr(self,field,None)
-            if val:
-                msg[field]=val
+        if self.role:
+            msg['role']=self.role
+        if self.content:
+            msg['content']=self.content
+        if self.tool_call_id:
+            msg['tool_call_id']=self.tool_call_id
+        if self.tool_calls:
+            msg['tool_calls']=self.tool_calls
         return msg
     
     def to_json(self):
@@ -82,7 +89,50 @@ class Message:
             reasoning_content=data.get("reasoning_content"),
             tool_call_id=data.get("tool_call_id"),
             tool_calls=data.get("tool_calls"),
+            usage=data.get("usage"),
         )
+class MessageDelta:
+    """
+    流式增量事件 字段与Message一致但不是dataclass 每个token只做一次轻量的对象创建
+    需要完整Message时调用to_message
+    """
+    __slots__=('role','id','created','content','reasoning_content','tool_call_id','tool_calls')
+    def __init__(self,id:str,created:str,content:Optional[str]=None,reasoning_content:Optional[str]=None):
+        self.role='assistant'
+        self.id=id
+        self.created=created
+        self.content=content
+        self.reasoning_content=reasoning_content
+        self.tool_call_id=None
+        self.tool_calls=None
+    def to_message(self)->Message:
+        return Message.assistant(self.id,self.created,content=self.content,reasoning_content=self.reasoning_content)
+    def to_dict(self):
+        return self.to_message().to_dict()
+    def to_json(self):
+        return self.to_message().to_json()
+    def __repr__(self):
+        return self.to_message().__repr__()
+class WireMessages(list):
+    """
+    请求用的消息列表 附带整个前缀的规范化JSON的sha256(digest)和字符数(chars)
+    响应缓存和token预估可以直接使用 不必再序列化整个历史
+    """
+    digest:str=""
+    chars:int=0
+
+
+def _canonical(msg:Dict)->str:
+    return json.dumps(msg,sort_keys=True,ensure_ascii=False,separators=(',',':'),default=str)
+
+
+def to_wire(messages)->List[Dict]:
+    """Messages使用增量缓存 普通的Message列表逐条转换"""
+    if isinstance(messages,Messages):
+        return messages.to_wire()
+    return [m.to_dict() for m in messages]
+
+
 class Messages:
     def __init__(self,system_prompt:Optional[str]=None):
         self.messages:List[Message]=[]
@@ -91,9 +141,87 @@ class Messages:
             self.system_prompt_index+=1
             self.messages.append(Message.system(system_prompt))
 
+    @property
+    def messages(self)->List[Message]:
+        return self._messages
+
+    @messages.setter
+    def messages(self,messages:List[Message]):
+        self._messages=messages
+        self._invalidate(0)
+
+    def _invalidate(self,n:int):
+        """
+        只保留前n条消息的wire缓存 消息只追加时缓存一直有效
+        _wire[i]/_texts[i]为第i条消息的to_dict和规范化JSON _chars[i]/_hashers[i]为前i+1条的JSON长度和sha256状态
+        注意: 直接修改已追加的Message对象的字段不会使缓存失效
+        """
+        if n<=0:
+            self._wire:List[Dict]=[]
+            self._texts:List[str]=[]
+            self._chars:List[int]=[]
+            self._hashers:list=[]
+            self._tokens:List[int]=[]
+            self._counter:Optional[Callable[[str],int]]=None
+        else:
+            del self._wire[n:],self._texts[n:],self._chars[n:],self._hashers[n:],self._tokens[n:]
+
+    def to_wire(self)->WireMessages:
+        """增量地把新追加的消息转为wire格式 已缓存的消息不再重复序列化"""
+        wire,chars,hashers=self._wire,self._chars,self._hashers
+        for msg in self._messages[len(wire):]:
+            data=msg.to_dict()
+            text=_canonical(data)
+            hasher=hashers[-1].copy() if hashers else sha256()
+            hasher.update(text.encode('utf-8'))
+            hasher.update(b'\n')
+            wire.append(data)
+            self._texts.append(text)
+            chars.append((chars[-1] if chars else 0)+len(text))
+            hashers.append(hasher)
+        result=WireMessages(wire)
+        result.digest=self.prefix_hash()
+        result.chars=chars[-1] if chars else 0
+        return result
+
+    def prefix_hash(self,n:Optional[int]=None)->str:
+        """前n条消息(默认全部)的规范化JSON的sha256 可用于前缀缓存的key"""
+        if len(self._wire)<len(self._messages):
+            self.to_wire()
+        n=len(self._hashers) if n is None else n
+        return self._hashers[n-1].hexdigest() if n>0 else sha256().hexdigest()
+
+    def token_counts(self,counter:Callable[[str],int])->List[int]:
+        """每条消息的token数 按wire格式计数 与wire缓存一起失效 每条消息只计数一次"""
+        self.to_wire()
+        if self._counter is not counter:
+            self._counter=counter
+            self._tokens=[]
+        for text in self._texts[len(self._tokens):]:
+            self._tokens.append(counter(text))
+        return self._tokens
+
+    def replace(self,index:int,msg:Message):
+        """替换一条消息 其后的缓存失效"""
+        index=index%len(self.messages)
+        self.messages[index]=msg
+        self._invalidate(index)
+
+    def remove(self,start:int,end:int):
+        """删除[start,end)的消息 不能删除系统提示词"""
+        start=max(start,self.system_prompt_index)
+        del self.messages[start:end]
+        self._invalidate(start)
+
+    def canonical_json(self)->str:
+        """整个历史的规范化JSON 与prefix_hash使用相同的序列化"""
+        self.to_wire()
+        return '['+','.join(self._texts)+']'
+
     def _add_msg(self, msg:Message):
         if msg.role == 'system':
             self.messages.insert(self.system_prompt_index, msg)
+            self._invalidate(self.system_prompt_index)
             self.system_prompt_index +=1
         else:
             self.messages.append(msg)
@@ -101,6 +229,7 @@ class Messages:
     def _system_prompt(self, system_prompt: str,insert_flag:bool=True):
         if insert_flag: 
             self.messages.insert(self.system_prompt_index, Message.system(system_prompt))   
+            self._invalidate(self.system_prompt_index)
             self.system_prompt_index += 1   
         else:
             self.messages=[Message.system(system_prompt)]+self.messages[self.system_prompt_index:]
@@ -121,12 +250,14 @@ class Messages:
     def rollback(self, n: int = 1):
         if n <= 0:
             return
-        self.messages = self.messages[:-n]
+        del self.messages[-n:]
+        self._invalidate(len(self.messages))
         self.system_prompt_index = min(self.system_prompt_index, len(self.messages))
     
     def clear(self, keep_system: bool = True):
         if keep_system:
-            self.messages = self.messages[:self.system_prompt_index]
+            del self.messages[self.system_prompt_index:]
+            self._invalidate(self.system_prompt_index)
         else:
             self.messages = []
             self.system_prompt_index = 0
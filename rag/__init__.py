@@ -3,6 +3,10 @@ from ._chunk import get_chunks
 from ._parser import Parser,Document
 from ._tokenizer import Tokenizer,TiktokenTokenizer
 from ._vector_db import VectorStore
+from ._shard import ShardedVectorStore
+from ._rank import RankCascade
+from ._server import VectorStoreServer,VectorStoreClient,serve
+from ._media import MediaCache,get_media_cache
 
 all=[
     _Cache,
@@ -11,5 +15,12 @@ all=[
     Document,
     Tokenizer,
     TiktokenTokenizer,
-    VectorStore
+    VectorStore,
+    ShardedVectorStore,
+    RankCascade,
+    VectorStoreServer,
+    VectorStoreClient,
+    serve,
+    MediaCache,
+    get_media_cache
 ]
\ No newline at end of file
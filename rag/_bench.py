@@ -0,0 +1,108 @@
+"""
+基于本地mock服务的检索基准 不需要真实的key
+python -m rag._bench [N]
+embed/rerank走model._mock_server 向量按文本hash生成 同一段文本的向量相同 检索原文应排在第一
+"""
+import contextlib
+import io
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from ._parser import Document, _get_doc_id
+from ._server import VectorStoreClient, VectorStoreServer
+from ._tokenizer import Tokenizer
+from ._vector_db import VectorStore
+
+
+class _CharTokenizer(Tokenizer):
+    """按字符切分 基准不依赖tiktoken的词表下载"""
+    def encode(self, content: str) -> List[int]:
+        return [ord(c) for c in content]
+
+    def decode(self, tokens: List[int]) -> str:
+        return "".join(chr(t) for t in tokens)
+
+
+def _docs(n: int, seed: int = 0) -> List[Document]:
+    rng = random.Random(seed)
+    words = ["vector", "index", "agent", "model", "token", "stream", "cache", "batch", "query", "shard"]
+    docs = []
+    for i in range(n):
+        content = "\n".join(" ".join(rng.choice(words) for _ in range(30)) + f" doc{i}-{p}" for p in range(4))
+        file_path = f"bench/{i}.txt"
+        docs.append(Document(doc_id=_get_doc_id("_doc", content=content), content=content, file_path=file_path,
+                             _meta={"file_path": file_path}))
+    return docs
+
+
+def mock_store(base_url: str, index_path: str, docs: List[Document], dim: int = 64, **kwargs) -> VectorStore:
+    """连接mock服务的VectorStore 已写入docs"""
+    from config import get_mock_model
+    from model import OpenaiLLM
+    with contextlib.redirect_stdout(io.StringIO()):
+        vb = VectorStore(dim=dim, tokenizer=_CharTokenizer(), index_path=index_path,
+                         llm=OpenaiLLM(get_mock_model(base_url)), chunk_size=200, leap_size=20, split_char="\n", **kwargs)
+        for doc in docs:
+            vb.add_doc(doc)
+    return vb
+
+
+def _latency(fn, items: List, concurrency: int = 1) -> Dict:
+    samples = []
+
+    def _timed(item):
+        start = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(_timed, items))
+    elapsed = time.perf_counter() - start
+    samples.sort()
+    return {"qps": len(items) / elapsed, "p50_ms": samples[len(samples) // 2] * 1000,
+            "p95_ms": samples[max(0, int(len(samples) * 0.95) - 1)] * 1000}
+
+
+def bench(n: int = 200, concurrency: int = 16, base_url: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    retrieve/retrieve_batch/rereank的延迟 以及通过VectorStoreServer并发检索(服务端合并embed)的吞吐
+    base_url为空时在本进程启动mock服务
+    """
+    from model._mock_server import MockLLMServer
+    server = None
+    if base_url is None:
+        server = MockLLMServer(port=0, ttft=0.005, dim=64).start()
+        base_url = server.url
+    docs = _docs(max(1, n // 4))
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        vb = mock_store(base_url, tmp, docs)
+        chunks = [chunk.content for chunk in vb._docs]
+        queries = [chunks[i % len(chunks)] for i in range(n)]
+        # 原文的向量与索引中的完全相同 必须排在第一
+        for query in queries[:20]:
+            assert vb.retrieve(query, top_k=3)[0]["text"] == query
+        results["retrieve"] = _latency(lambda q: vb.retrieve(q, top_k=5), queries)
+        results["retrieve_batch"] = _latency(lambda i: vb.retrieve_batch(queries[i:i + 32], top_k=5), list(range(0, n, 32)))
+        results["rereank"] = _latency(lambda q: vb.rereank(q, top_k=3), queries[:max(1, n // 4)])
+        vs_server = VectorStoreServer(vb, port=0).start()
+        try:
+            client = VectorStoreClient(vs_server.url)
+            assert client.retrieve(queries[0], top_k=1)[0]["text"] == queries[0]
+            results["server_retrieve"] = _latency(lambda q: client.retrieve(q, top_k=5), queries, concurrency)
+        finally:
+            vs_server.shutdown()
+    results["chunks"] = {"count": len(chunks)}
+    if server is not None:
+        results["mock_server"] = dict(server.stats)
+        server.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    for name, result in bench(int(sys.argv[1]) if len(sys.argv) > 1 else 200).items():
+        print(f"{name}: " + " ".join(f"{key} {value:.1f}" if isinstance(value, float) else f"{key} {value}"
+                                     for key, value in result.items()))
@@ -13,9 +13,11 @@ class ChunkInfo:
     file_path: str
     _meta: Dict[str, Any] = field(default_factory=dict)
     _llm_cache: List[Any] = field(default_factory=list)
+    # 子块在原文中对应的片段(含strip掉的空白和切分用的分隔符) 仅在子块互不重叠(leap_size=0)时记录 依次拼接即为原文
+    raw: Optional[str] = None
 
     @staticmethod
-    def from_doc(tokens: int, content: str, chunk_order_index: int, doc: Document):
+    def from_doc(tokens: int, content: str, chunk_order_index: int, doc: Document, raw: Optional[str] = None):
         return ChunkInfo(
             tokens=tokens,
             content=content,
@@ -23,7 +25,8 @@ class ChunkInfo:
             doc_id=doc.doc_id,
             file_path=doc.file_path,
             _meta=doc._meta,
-            _llm_cache=doc._llm_cache
+            _llm_cache=doc._llm_cache,
+            raw=raw
         )
 
     @property
@@ -36,7 +39,8 @@ class ChunkInfo:
             "doc_id": self.doc_id,
             "file_path": self.file_path,
             "_meta": self._meta,
-            "_llm_cache": self._llm_cache
+            "_llm_cache": self._llm_cache,
+            "raw": self.raw
         }
 
 def get_chunks(
@@ -47,29 +51,29 @@ def get_chunks(
     split_char: Optional[str] = None,
     only_char: bool = False,
 ):
+    keep_raw = leap_size == 0
+
     def _tokenizer_chunk():
         tokens = tokenizer.encode(doc.content)
         
         def _split_tokens(split_char: str, only_char: bool = True):
             raw_chunks = doc.content.split(split_char)
             new_chunks = []
-            if only_char:
-                for chunk in raw_chunks:
-                    _tokens = tokenizer.encode(chunk)
-                    new_chunks.append((len(_tokens), chunk))
-            else:
-                for chunk in raw_chunks:
-                    _tokens = tokenizer.encode(chunk)
-                    step = chunk_size - leap_size
-                    if len(_tokens) > chunk_size:
-                        for idx in range(0, len(_tokens), step if step > 0 else chunk_size):
-                            _chunk_content = tokenizer.decode(_tokens[idx:idx + chunk_size])
-                            new_chunks.append((min(chunk_size, len(_tokens) - idx), _chunk_content))
-                    else:
-                        new_chunks.append((len(_tokens), chunk))
+            for n, chunk in enumerate(raw_chunks):
+                # 分隔符算在每段的末尾 最后一段没有
+                sep = split_char if n < len(raw_chunks) - 1 else ""
+                _tokens = tokenizer.encode(chunk)
+                step = chunk_size - leap_size
+                if not only_char and len(_tokens) > chunk_size:
+                    pieces = [(min(chunk_size, len(_tokens) - idx), tokenizer.decode(_tokens[idx:idx + chunk_size]))
+                              for idx in range(0, len(_tokens), step if step > 0 else chunk_size)]
+                    for k, (_len, _chunk) in enumerate(pieces):
+                        new_chunks.append((_len, _chunk, _chunk + sep if k == len(pieces) - 1 else _chunk))
+                else:
+                    new_chunks.append((len(_tokens), chunk, chunk + sep))
             results: List[ChunkInfo] = []
-            for i, (_len, _chunk) in enumerate(new_chunks):
-                results.append(ChunkInfo.from_doc(_len, _chunk, i, doc))
+            for i, (_len, _chunk, _raw) in enumerate(new_chunks):
+                results.append(ChunkInfo.from_doc(_len, _chunk, i, doc, _raw if keep_raw else None))
             return results
         
         def _simple_chunk():
@@ -77,7 +81,8 @@ def get_chunks(
             step = chunk_size - leap_size
             for i, idx in enumerate(range(0, len(tokens), step if step > 0 else chunk_size)):
                 _chunk_content = tokenizer.decode(tokens[idx:idx + chunk_size])
-                results.append(ChunkInfo.from_doc(min(chunk_size, len(tokens) - idx), _chunk_content.strip(), i, doc))
+                results.append(ChunkInfo.from_doc(min(chunk_size, len(tokens) - idx), _chunk_content.strip(), i, doc,
+                                                  _chunk_content if keep_raw else None))
             return results
         
         return _simple_chunk() if not split_char else _split_tokens(split_char, only_char)
@@ -88,7 +93,8 @@ def get_chunks(
         results: List[ChunkInfo] = []
         for i, idx in enumerate(range(0, len(data), step if step > 0 else chunk_size)):
             _chunk_content = data[idx:idx + chunk_size]
-            results.append(ChunkInfo.from_doc(min(chunk_size, len(data) - idx), _chunk_content.strip(), i, doc))
+            results.append(ChunkInfo.from_doc(min(chunk_size, len(data) - idx), _chunk_content.strip(), i, doc,
+                                              _chunk_content if keep_raw else None))
         return results
     
     return _tokenizer_chunk() if tokenizer else _no_tokenizer_chunk()
\ No newline at end of file
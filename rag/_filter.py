@@ -0,0 +1,80 @@
+"""
+元数据过滤
+入库时维护 元数据(key,value) -> chunk id 的倒排 检索时把过滤条件换成faiss的IDSelector
+命中的子集很小时直接对子集做暴力检索
+"""
+from typing import Any, Dict, List, Optional
+import numpy as np
+import faiss
+from ._chunk import ChunkInfo
+
+# 子集小于这个数量时直接扫描子集 不走全量索引
+filter_scan_size = 1024
+
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
+
+
+class _MetaIndex:
+    """
+    filter格式: {"doc_id": "...", "file_path": ["a.txt","b.txt"], "<_meta key>": value}
+    同一个key多个取值为或 不同key之间为与
+    """
+    def __init__(self):
+        self._ids: Dict[str, Dict[Any, List[int]]] = {}
+
+    def _add(self, key: str, value: Any, idx: int):
+        if value is None or not _hashable(value):
+            return
+        self._ids.setdefault(key, {}).setdefault(value, []).append(idx)
+
+    def add(self, chunks: List[ChunkInfo], start: int):
+        for idx, chunk in enumerate(chunks, start):
+            self._add("doc_id", chunk.doc_id, idx)
+            self._add("file_path", chunk.file_path, idx)
+            for key, value in chunk._meta.items():
+                if key not in ("doc_id", "file_path"):
+                    self._add(key, value, idx)
+
+    def rebuild(self, chunks: List[ChunkInfo]):
+        self._ids = {}
+        self.add(chunks, 0)
+
+    def select(self, filter: Dict[str, Any]) -> np.ndarray:
+        result: Optional[np.ndarray] = None
+        for key, values in filter.items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            _by_value = self._ids.get(key, {})
+            ids = np.unique(np.fromiter((i for v in values for i in _by_value.get(v, [])), dtype='int64'))
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+            if not len(result):
+                break
+        return result if result is not None else np.empty(0, dtype='int64')
+
+
+def filtered_search(index: faiss.Index, query_vectors: np.ndarray, top_k: int, ids: np.ndarray):
+    """返回与index.search相同形状的(scores,indices)"""
+    n = len(query_vectors)
+    if not len(ids):
+        return np.full((n, top_k), np.inf, dtype='float32'), np.full((n, top_k), -1, dtype='int64')
+    if len(ids) <= filter_scan_size:
+        # 子集很小 取出子集向量直接暴力检索
+        subset = index.reconstruct_batch(ids)
+        k = min(top_k, len(ids))
+        scores, local = faiss.knn(query_vectors, subset, k)
+        # 子集不足top_k时和faiss一样用-1/inf补齐列数
+        out_scores = np.full((n, top_k), np.inf, dtype='float32')
+        out_indices = np.full((n, top_k), -1, dtype='int64')
+        out_scores[:, :k] = scores
+        out_indices[:, :k] = np.where(local >= 0, ids[np.clip(local, 0, None)], -1)
+        return out_scores, out_indices
+    mask = np.zeros(index.ntotal, dtype=bool)
+    mask[ids] = True
+    bitmap = np.packbits(mask, bitorder='little')
+    selector = faiss.IDSelectorBitmap(index.ntotal, faiss.swig_ptr(bitmap))
+    return index.search(query_vectors, top_k, params=faiss.SearchParameters(sel=selector))
@@ -0,0 +1,214 @@
+"""
+多模态消息的媒体编码缓存
+按文件内容的sha256寻址: 内容hash -> 变体(缩放/转码参数) -> data URL
+同一张图片在多轮对话中反复发送时 只在第一次解码/缩放/编码
+内存中按LRU保留 可选的磁盘层在进程重启后继续复用
+大文件按块编码base64 不会同时持有原始文件和多份编码结果
+"""
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+default_media_cache_cfg = {
+    # 磁盘层目录 为None时只使用内存
+    "path": None,
+    "max_bytes": 256 * 1024 * 1024,
+    "disk_max_bytes": 2 * 1024 * 1024 * 1024,
+    # 记住的(路径,大小,mtime)->内容hash的条数
+    "max_digests": 4096,
+}
+# 3的倍数 每块的编码结果可以直接拼接
+_chunk_size = 3 * 1024 * 1024
+
+
+def b64_data_url(prefix: str, data: Optional[bytes] = None, path: Optional[str] = None) -> str:
+    """
+    把bytes或文件编码为prefix+base64 文件按块读取
+    结果写入预先分配好的缓冲区 只在最后解码为str时复制一次
+    """
+    size = len(data) if data is not None else os.path.getsize(path)
+    head = prefix.encode("ascii")
+    out = bytearray(len(head) + (size + 2) // 3 * 4)
+    out[:len(head)] = head
+    pos = len(head)
+    if data is not None:
+        view = memoryview(data)
+        chunks = (view[i:i + _chunk_size] for i in range(0, size, _chunk_size))
+        pos = _fill(out, pos, chunks)
+    else:
+        with open(path, "rb") as f:
+            pos = _fill(out, pos, iter(lambda: f.read(_chunk_size), b""))
+    # 文件在读取期间被截断时去掉多余的部分
+    del out[pos:]
+    return out.decode("ascii")
+
+
+def _fill(out: bytearray, pos: int, chunks) -> int:
+    for chunk in chunks:
+        encoded = base64.b64encode(chunk)
+        out[pos:pos + len(encoded)] = encoded
+        pos += len(encoded)
+    return pos
+
+
+class MediaCache:
+    def __init__(self, path: Optional[str] = default_media_cache_cfg["path"],
+                 max_bytes: int = default_media_cache_cfg["max_bytes"],
+                 disk_max_bytes: int = default_media_cache_cfg["disk_max_bytes"],
+                 max_digests: int = default_media_cache_cfg["max_digests"]):
+        """
+        path: 磁盘层目录 为None时不落盘
+        max_bytes: 内存中data URL的总大小上限 超过时淘汰最久未使用的
+        disk_max_bytes: 磁盘层的大小上限
+        max_digests: 文件hash的记录条数上限 超过时淘汰最久未使用的
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.max_digests = max_digests
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "hashed_bytes": 0}
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+        self._size = 0
+        # (路径,大小,mtime) -> 内容hash 文件没有变化时不必重新hash
+        self._digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_size = 0
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            self._disk_size = sum(os.path.getsize(f) for f in self._files())
+
+    def file_digest(self, path: str) -> str:
+        st = os.stat(path)
+        stamp = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(stamp)
+            if digest is not None:
+                self._digests.move_to_end(stamp)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(_chunk_size), b""):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            with self._lock:
+                self._digests[stamp] = digest
+                while len(self._digests) > self.max_digests:
+                    self._digests.popitem(last=False)
+                self.stats["hashed_bytes"] += st.st_size
+        return digest
+
+    def data_url(self, path: str, variant: str, prefix: str,
+                 encode: Optional[Callable[[str], bytes]] = None) -> str:
+        """
+        variant: 变体名 包含影响编码结果的所有参数 如image-1080
+        prefix: data URL的前缀 如data:image/jpeg;base64,
+        encode: 把文件转为要发送的bytes(如缩放后重新编码) 为None时直接编码原文件
+        """
+        key = f"{self.file_digest(path)}-{variant}"
+        url = self._get(key)
+        if url is not None:
+            return url
+        url = b64_data_url(prefix, data=encode(path)) if encode else b64_data_url(prefix, path=path)
+        self._put(key, url)
+        return url
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            url = self._lru.get(key)
+            if url is not None:
+                self._lru.move_to_end(key)
+                self.stats["hits"] += 1
+                return url
+        if self.path:
+            file = self._file(key)
+            try:
+                with open(file, "r", encoding="ascii") as f:
+                    url = f.read()
+            except FileNotFoundError:
+                url = None
+            if url is not None:
+                try:
+                    os.utime(file)
+                except OSError:
+                    # 只读目录 或者刚被其它进程淘汰 不影响这次命中
+                    pass
+                self._remember(key, url)
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                return url
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def _put(self, key: str, url: str):
+        self._remember(key, url)
+        if not self.path:
+            return
+        file = self._file(key)
+        tmp = f"{file}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="ascii") as f:
+            f.write(url)
+        # 覆盖已有的文件(如并发编码同一个变体)时只计算大小的差
+        old = os.path.getsize(file) if os.path.exists(file) else 0
+        os.replace(tmp, file)
+        with self._lock:
+            self._disk_size += len(url) - old
+            if self._disk_size > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _remember(self, key: str, url: str):
+        # 单个超过上限的结果只放在磁盘层
+        if len(url) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._lru:
+                return
+            self._lru[key] = url
+            self._size += len(url)
+            while self._size > self.max_bytes:
+                _, old = self._lru.popitem(last=False)
+                self._size -= len(old)
+                self.stats["evictions"] += 1
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.b64")
+
+    def _files(self):
+        for name in os.listdir(self.path):
+            if name.endswith(".b64"):
+                yield os.path.join(self.path, name)
+
+    def _evict_disk(self):
+        # 与ResponseCache一致 按mtime从旧到新删除到容量的90%
+        for file in sorted(self._files(), key=os.path.getmtime):
+            if self._disk_size <= self.disk_max_bytes * 0.9:
+                break
+            size = os.path.getsize(file)
+            os.remove(file)
+            self._disk_size -= size
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self._size = 0
+            self._digests.clear()
+
+
+_caches: Dict[tuple, MediaCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_media_cache(media_cache_cfg: Optional[Dict] = None) -> MediaCache:
+    """media_cache_cfg: {"path":..,"max_bytes":..,"disk_max_bytes":..,"max_digests":..} 为空时使用进程内的默认内存缓存"""
+    cfg = {**default_media_cache_cfg, **(media_cache_cfg or {})}
+    key = (os.path.abspath(cfg["path"]) if cfg["path"] else None, cfg["max_bytes"], cfg["disk_max_bytes"], cfg["max_digests"])
+    cache = _caches.get(key)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(key)
+            if cache is None:
+                cache = _caches[key] = MediaCache(**cfg)
+    return cache
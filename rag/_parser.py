@@ -1,10 +1,10 @@
 
-import base64
 from io import BytesIO
 from dataclasses import dataclass, field
 from collections import defaultdict
 from typing import Any, List, Dict, Optional
 from hashlib import md5
+from ._media import get_media_cache
 def _get_doc_id(prefix:str="_doc",content:str=None):
     return prefix+md5(content.encode()).hexdigest()
 
@@ -64,29 +64,49 @@ def _resize_image(img, short_side_length: int = 1080):
     resized_img = img.resize((new_width, new_height), resample=Image.Resampling.BILINEAR)
     return resized_img
 
+def _encode_image(path:str,max_short_side_length:int=-1,draft:bool=False)->bytes:
+    """
+    draft: JPEG直接按缩小的比例解码(DCT缩放) 省去全尺寸解码
+    缩放的结果与全尺寸解码后再缩放的像素略有不同 所以默认关闭
+    """
+    from PIL import Image
+    image = Image.open(path)
+
+    if (max_short_side_length > 0) and (min(image.size) > max_short_side_length):
+        if draft:
+            # 解码尺寸不小于目标 之后仍按目标尺寸缩放
+            width, height = image.size
+            scale = max_short_side_length / min(width, height)
+            image.draft(image.mode, (int(width * scale), int(height * scale)))
+        if min(image.size) > max_short_side_length:
+            image = _resize_image(image, short_side_length=max_short_side_length)
+    image = image.convert(mode='RGB')
+    buffered = BytesIO()
+    image.save(buffered, format='JPEG')
+    return buffered.getvalue()
+
 class ToBase64:
+    """
+    结果按文件内容缓存 见_media.MediaCache
+    cache_cfg: get_media_cache的配置 为空时使用进程内的默认内存缓存
+    """
     @staticmethod
-    def audio(path:str):
-        with open(path, "rb") as f: 
-            return 'data:;base64,' + base64.b64encode(f.read()).decode('utf-8')
+    def audio(path:str,cache_cfg:Optional[Dict]=None):
+        return get_media_cache(cache_cfg).data_url(path,'raw','data:;base64,')
     
     @staticmethod
-    def video(path:str):
-        with open(path, "rb") as f: 
-            return 'data:;base64,' + base64.b64encode(f.read()).decode('utf-8')
+    def video(path:str,cache_cfg:Optional[Dict]=None):
+        return get_media_cache(cache_cfg).data_url(path,'raw','data:;base64,')
     
     @staticmethod
-    def image(path:str,max_short_side_length: int = -1):
-        from PIL import Image
-        image = Image.open(path)
-
-        if (max_short_side_length > 0) and (min(image.size) > max_short_side_length):
-            ori_size = image.size
-            image = _resize_image(image, short_side_length=max_short_side_length)
-        image = image.convert(mode='RGB')
-        buffered = BytesIO()
-        image.save(buffered, format='JPEG')
-        return 'data:image/jpeg;base64,' + base64.b64encode(buffered.getvalue()).decode('utf-8')
+    def image(path:str,max_short_side_length: int = -1,cache_cfg:Optional[Dict]=None,draft:bool=False):
+        """draft: 见_encode_image 开启后结果与原来的编码不完全相同 缓存中作为不同的变体"""
+        return get_media_cache(cache_cfg).data_url(
+            path,
+            f'image-{max_short_side_length}' + ('-draft' if draft else ''),
+            'data:image/jpeg;base64,',
+            encode=lambda p: _encode_image(p,max_short_side_length,draft)
+        )
     
     
 if __name__ == '__main__':
@@ -0,0 +1,98 @@
+"""
+级联排序
+ANN召回 -> 可选的词法重打分 -> 可选的交叉编码器rerank
+第一阶段分数差距足够明显时跳过rerank 并按(query,候选集)缓存rerank结果
+"""
+import threading
+from collections import OrderedDict
+from hashlib import md5
+from typing import Callable, Dict, List, Optional, Set
+from ._tokenizer import Tokenizer
+
+
+class RankCascade:
+    def __init__(self,
+                 candidate_factor: int = 3,
+                 min_candidates: int = 10,
+                 max_candidates: int = 100,
+                 lexical: bool = False,
+                 lexical_weight: float = 0.3,
+                 rerank: bool = True,
+                 skip_margin: Optional[float] = None,
+                 cache_size: int = 1024,
+                 tokenizer: Optional[Tokenizer] = None):
+        """
+        candidate_factor/min_candidates/max_candidates: 召回深度=clip(candidate_factor*top_k)
+        lexical/lexical_weight: 是否用词法重叠对召回结果重打分 以及在总分中的权重
+        rerank: 是否调用rerank接口
+        skip_margin: 第top_k名与第top_k+1名的相对分差超过该值时跳过rerank 默认None表示从不跳过(与不使用级联时一致)
+            候选不多于top_k时没有第top_k+1名 仍然调用rerank决定顺序
+        cache_size: rerank结果缓存的条数 0表示不缓存
+        """
+        self.candidate_factor = candidate_factor
+        self.min_candidates = min_candidates
+        self.max_candidates = max_candidates
+        self.lexical = lexical
+        self.lexical_weight = lexical_weight
+        self.rerank = rerank
+        self.skip_margin = skip_margin
+        self.cache_size = cache_size
+        self._tokenizer = tokenizer
+        self._cache: "OrderedDict[tuple, List[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"rerank": 0, "skipped": 0, "cache_hit": 0}
+
+    def candidate_depth(self, top_k: int) -> int:
+        return max(top_k, min(self.max_candidates, max(self.min_candidates, self.candidate_factor * top_k)))
+
+    def _terms(self, text: str) -> Set:
+        if self._tokenizer:
+            return set(self._tokenizer.encode(text))
+        # 没有分词器时用字符bigram 对中文也适用
+        text = text.lower()
+        return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+    def _first_stage(self, query: str, candidates: List[Dict]) -> List[Dict]:
+        # L2距离转为越大越好的相似度
+        results = [{**c, "score": 1 / (1 + max(c["score"], 0.0))} for c in candidates]
+        if self.lexical and results:
+            query_terms = self._terms(query)
+            for result in results:
+                overlap = len(query_terms & self._terms(result["text"])) / (len(query_terms) or 1)
+                result["score"] = (1 - self.lexical_weight) * result["score"] + self.lexical_weight * overlap
+        return sorted(results, key=lambda x: x["score"], reverse=True)
+
+    def _decisive(self, results: List[Dict], top_k: int) -> bool:
+        if self.skip_margin is None or len(results) <= top_k:
+            return False
+        last, nxt = results[top_k - 1]["score"], results[top_k]["score"]
+        return last > 0 and (last - nxt) / last >= self.skip_margin
+
+    def _cached_rerank(self, query: str, documents: List[str], rerank_func: Callable) -> List[Dict]:
+        key = (query, tuple(sorted(md5(doc.encode()).hexdigest() for doc in documents)))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.stats["cache_hit"] += 1
+                return [dict(r) for r in self._cache[key]]
+        # 对全部候选排序后缓存 不同top_k可以复用
+        results = rerank_func(query=query, documents=documents, top_k=len(documents))
+        with self._lock:
+            self.stats["rerank"] += 1
+            if self.cache_size > 0:
+                # 缓存副本 调用方修改返回的结果不会影响缓存
+                self._cache[key] = [dict(r) for r in results]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return results
+
+    def rank(self, query: str, candidates: List[Dict], top_k: int, rerank_func: Callable) -> List[Dict]:
+        results = self._first_stage(query, candidates)
+        if not self.rerank or not results or self._decisive(results, top_k):
+            with self._lock:
+                self.stats["skipped"] += 1
+            return results[:top_k]
+        reranked = self._cached_rerank(query, [r["text"] for r in results], rerank_func)[:top_k]
+        # rerank接口只返回text/score 按text补回doc_id等字段
+        by_text = {r["text"]: r for r in results}
+        return [{**by_text.get(r["text"], {}), **r} for r in reranked]
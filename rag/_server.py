@@ -0,0 +1,257 @@
+"""
+向量库服务模式
+一个进程持有VectorStore(索引只加载一次) 多个agent进程通过VectorStoreClient共享
+服务端会把并发到达的query合并成一次embed + 一次index.search
+"""
+import json
+import queue
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Union
+import numpy as np
+import requests
+from ._parser import Parser, Document, _get_doc_id
+from ._vector_db import VectorStore
+
+default_host = "127.0.0.1"
+default_port = 8765
+
+
+class _QueryBatcher:
+    def __init__(self, vb: VectorStore, max_batch: int = 32, max_wait_ms: float = 5):
+        self._vb = vb
+        self._max_batch = max_batch
+        self._max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, queries: List[str], top_k: int, filter: Optional[Dict] = None) -> List[List[Dict]]:
+        # 空请求在入队前拒绝 不让它和其它请求合并到同一批里
+        if not queries or not all(isinstance(q, str) and q.strip() for q in queries):
+            raise ValueError("queries must be a non-empty list of non-empty strings")
+        future = Future()
+        self._queue.put((queries, top_k, filter, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        while size < self._max_batch:
+            try:
+                item = self._queue.get(timeout=self._max_wait)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _search(self, group: List[tuple]):
+        """同一filter的请求合并成一次embed 按最大的top_k检索一次 再按请求切分"""
+        queries = [q for _queries, _, _, _ in group for q in _queries]
+        vectors = np.ascontiguousarray(self._vb._embed_func(queries), dtype='float32').reshape(len(queries), -1)
+        results = self._vb.search_vectors(vectors, max(item[1] for item in group), group[0][2])
+        offset = 0
+        for _queries, _top_k, _, future in group:
+            future.set_result([r[:_top_k] for r in results[offset:offset + len(_queries)]])
+            offset += len(_queries)
+
+    def _loop(self):
+        while True:
+            groups: Dict[str, List[tuple]] = {}
+            for item in self._collect():
+                groups.setdefault(json.dumps(item[2], sort_keys=True), []).append(item)
+            for group in groups.values():
+                try:
+                    self._search(group)
+                except Exception as e:
+                    if len(group) == 1:
+                        group[0][3].set_exception(e)
+                        continue
+                    # 合并的批次出错时逐个请求重试 错误只返回给引起它的请求
+                    for item in group:
+                        try:
+                            self._search([item])
+                        except Exception as item_error:
+                            item[3].set_exception(item_error)
+
+
+class VectorStoreServer:
+    """
+    POST /retrieve {"queries":[...],"top_k":5,"filter":{...}}
+    POST /rereank  {"query":"...","top_k":3,"filter":{...}}
+    POST /get      {"query":"...","top_k":3,"filter":{...},"kwargs":{}}
+    POST /ingest   {"file_paths":[...]} / {"docs":[{"content":"...","file_path":"..."}]}
+    POST /save
+    GET  /health
+    """
+    def __init__(self, vb: VectorStore, host: str = default_host, port: int = default_port,
+                 max_batch: int = 32, max_wait_ms: float = 5):
+        self._vb = vb
+        self._batcher = _QueryBatcher(vb, max_batch, max_wait_ms)
+        self._routes = {
+            "/retrieve": self._retrieve,
+            "/rereank": self._rereank,
+            "/get": self._get,
+            "/ingest": self._ingest,
+            "/save": self._save,
+        }
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _retrieve(self, data: Dict):
+        return {"results": self._batcher.submit(data["queries"], int(data.get("top_k", 5)), data.get("filter"))}
+
+    def _rerank_results(self, data: Dict) -> List[Dict]:
+        # 候选集的向量检索同样经过批处理 和其它请求合并embed
+        query, top_k = data["query"], int(data.get("top_k", 3))
+        candidates = self._batcher.submit([query], self._vb._cascade.candidate_depth(top_k), data.get("filter"))[0]
+        return self._vb._rank_candidates(query, candidates, top_k)
+
+    def _rereank(self, data: Dict):
+        return {"results": self._rerank_results(data)}
+
+    def _get(self, data: Dict):
+        results = self._rerank_results(data)
+        return {"content": self._vb._chat(self._vb._formated_result(results), **data.get("kwargs", {}))}
+
+    def _ingest(self, data: Dict):
+        docs = [Parser.parser(path) for path in data.get("file_paths", [])]
+        for item in data.get("docs", []):
+            content = item["content"]
+            file_path = item.get("file_path", "")
+            docs.append(Document(doc_id=item.get("doc_id") or _get_doc_id("_doc", content=content),
+                                 content=content, file_path=file_path, _meta={"file_path": file_path, **item.get("_meta", {})}))
+        for doc in docs:
+            self._vb.add_doc(doc)
+        return {"doc_ids": [doc.doc_id for doc in docs], "num_docs": self._vb.num_docs}
+
+    def _save(self, data: Dict):
+        self._vb.save_index()
+        return {"ok": True}
+
+    def _handler(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def _send(self, code: int, body: Dict):
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                if self.path == "/health":
+                    return self._send(200, {"ok": True, "num_docs": server._vb.num_docs})
+                self._send(404, {"error": f"unknown path {self.path}"})
+
+            def do_POST(self):
+                route = server._routes.get(self.path)
+                if route is None:
+                    return self._send(404, {"error": f"unknown path {self.path}"})
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    data = json.loads(self.rfile.read(length) or b"{}")
+                    self._send(200, route(data))
+                except (KeyError, ValueError) as e:
+                    self._send(400, {"error": str(e)})
+                except Exception as e:
+                    self._send(500, {"error": str(e)})
+
+            def log_message(self, format, *args):
+                pass
+        return _Handler
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class VectorStoreClient:
+    """与VectorStore相同的retrieve/rereank/get接口 请求转发给VectorStoreServer"""
+    def __init__(self, base_url: str = f"http://{default_host}:{default_port}", timeout: float = 60):
+        self._base_url = base_url.rstrip("/")
+        self._timeout = timeout
+        self._session = requests.Session()
+
+    def _post(self, suffix: str, data: Dict) -> Dict:
+        response = self._session.post(f"{self._base_url}{suffix}", json=data, timeout=self._timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"vector store server error {response.status_code}: {response.text}")
+        return response.json()
+
+    def retrieve(self, query: Union[str, List[str]], top_k: int = 5, filter: Optional[Dict] = None) -> List[Dict[str, Union[str, float]]]:
+        """与VectorStore.retrieve一致 list只能包含一条query 多条请使用retrieve_batch"""
+        query = [query] if isinstance(query, str) else list(query)
+        if len(query) != 1:
+            raise ValueError(f"retrieve takes one query, got {len(query)}; use retrieve_batch")
+        return self._post("/retrieve", {"queries": query, "top_k": top_k, "filter": filter})["results"][0]
+
+    def retrieve_batch(self, queries: List[str], top_k: int = 5, filter: Optional[Dict] = None) -> List[List[Dict[str, Union[str, float]]]]:
+        return self._post("/retrieve", {"queries": queries, "top_k": top_k, "filter": filter})["results"]
+
+    def rereank(self, query: str, top_k=3, filter: Optional[Dict] = None):
+        return self._post("/rereank", {"query": query, "top_k": top_k, "filter": filter})["results"]
+
+    def get(self, query: str, top_k=3, filter: Optional[Dict] = None, **kwargs):
+        return self._post("/get", {"query": query, "top_k": top_k, "filter": filter, "kwargs": kwargs})["content"]
+
+    def add_doc(self, doc: Document) -> None:
+        self._post("/ingest", {"docs": [{"doc_id": doc.doc_id, "content": doc.content, "file_path": doc.file_path, "_meta": doc._meta}]})
+
+    def ingest(self, file_paths: Optional[List[str]] = None, docs: Optional[List[Dict[str, Any]]] = None) -> Dict:
+        return self._post("/ingest", {"file_paths": file_paths or [], "docs": docs or []})
+
+    def save_index(self):
+        self._post("/save", {})
+
+    def health(self) -> Dict:
+        return self._session.get(f"{self._base_url}/health", timeout=self._timeout).json()
+
+    def _formated_result(self, result: List[Dict]):
+        return VectorStore._formated_result(self, result)
+
+
+def serve(vb: VectorStore, host: str = default_host, port: int = default_port, **kwargs):
+    server = VectorStoreServer(vb, host=host, port=port, **kwargs)
+    print(f"vector store server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    import argparse
+    from model import OpenaiLLM
+    from config import get_siliconflow_model
+    from ._tokenizer import TiktokenTokenizer
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--host", default=default_host)
+    arg_parser.add_argument("--port", type=int, default=default_port)
+    arg_parser.add_argument("--dim", type=int, default=1024 * 4)
+    arg_parser.add_argument("--index_path", default="storage")
+    args = arg_parser.parse_args()
+    llm = OpenaiLLM(llm_config=get_siliconflow_model())
+    tokenizer = TiktokenTokenizer(encoding_name='cl100k_base')
+    vb = VectorStore(dim=args.dim, llm=llm, tokenizer=tokenizer, index_path=args.index_path, chunk_size=512 * 4, leap_size=128)
+    serve(vb, host=args.host, port=args.port)
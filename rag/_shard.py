@@ -0,0 +1,188 @@
+"""
+分片向量库
+按doc_id的hash把chunk分到N个子索引 每个分片在index_path/shard_{i}下有独立的文件
+检索时并行扇出到各分片(faiss检索会释放GIL) 再用堆合并各分片的top_k
+"""
+import json
+import os
+import shutil
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+from itertools import islice
+from typing import Dict, List, Optional, Union
+import numpy as np
+from ._tokenizer import Tokenizer
+from ._parser import Document
+from ._vector_db import VectorStore, default_index_path
+from ._rank import RankCascade
+from model import OpenaiLLM
+
+shards_meta = "shards.json"
+
+
+def _shard_of(doc_id: str, num_shards: int) -> int:
+    # 不能用内置hash 每个进程的hash种子不同
+    return int(md5(doc_id.encode()).hexdigest()[:8], 16) % num_shards
+
+
+class ShardedVectorStore(VectorStore):
+    def __init__(self, dim: int,
+                 num_shards: int = 4,
+                 tokenizer: Optional[Tokenizer] = None,
+                 index_path: str = default_index_path,
+                 llm: OpenaiLLM = None,
+                 chunk_size: int = 1024,
+                 leap_size: int = 128,
+                 split_char: Optional[str] = None,
+                 only_char: bool = False,
+                 max_workers: Optional[int] = None,
+                 lazy: bool = False,
+                 cascade: Optional[RankCascade] = None,
+                 parent_window: int = 0):
+        self.num_shards = num_shards
+        self._max_workers = max_workers
+        self._lazy = lazy
+        # 查询相关的属性(_lock/_meta_index/_cache等)由VectorStore初始化 _pre_load改为加载分片
+        super().__init__(dim=dim, tokenizer=tokenizer, index_path=index_path, llm=llm, chunk_size=chunk_size,
+                         leap_size=leap_size, split_char=split_char, only_char=only_char, cascade=cascade,
+                         parent_window=parent_window)
+        # VectorStore.__init__会把num_docs置0 这里改为已加载分片的文档数之和
+        self._count_docs()
+
+    def _count_docs(self):
+        """文档数由各分片统计 分片加载/卸载或写入后重新汇总"""
+        self.num_docs = sum(shard.num_docs for shard in list(self._shards.values()))
+
+    def _pre_load(self):
+        os.makedirs(self._index_path, exist_ok=True)
+        self._meta_path = os.path.join(self._index_path, shards_meta)
+        # 已经存在的分片以落盘的分片数为准 分片数变化需要走rebalance
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r") as f:
+                self.num_shards = json.load(f)["num_shards"]
+        self._shards: Dict[int, VectorStore] = {}
+        self._shards_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self._max_workers or self.num_shards)
+        if not self._lazy:
+            for i in range(self.num_shards):
+                self.load_shard(i)
+
+    def _shard_path(self, i: int) -> str:
+        return os.path.join(self._index_path, f"shard_{i}")
+
+    def load_shard(self, i: int) -> VectorStore:
+        shard = self._shards.get(i)
+        if shard is None:
+            # 并发的检索/写入可能同时触发加载 同一个分片只能创建一次
+            with self._shards_lock:
+                shard = self._shards.get(i)
+                if shard is None:
+                    shard = self._shards[i] = VectorStore(
+                        dim=self._dim, tokenizer=self._tokenizer, index_path=self._shard_path(i),
+                        llm=self._llm, chunk_size=self._chunk_size, leap_size=self._leap_size,
+                        split_char=self._split_char, only_char=self._only_char, parent_window=self._parent_window)
+                    self._count_docs()
+        return shard
+
+    def unload_shard(self, i: int):
+        with self._shards_lock:
+            self._shards.pop(i, None)
+            self._count_docs()
+
+    def shard_for(self, doc_id: str) -> VectorStore:
+        return self.load_shard(_shard_of(doc_id, self.num_shards))
+
+    def add_doc(self, doc: Document) -> None:
+        self.shard_for(doc.doc_id).add_doc(doc)
+        self._count_docs()
+
+    def _parent_text(self, doc_id: str, start: int, end: int) -> str:
+        return self.shard_for(doc_id)._parent_text(doc_id, start, end)
+
+    def add_docs(self, docs: List[Document]) -> None:
+        """不同分片的文档并行切片和embed"""
+        groups: Dict[int, List[Document]] = {}
+        for doc in docs:
+            groups.setdefault(_shard_of(doc.doc_id, self.num_shards), []).append(doc)
+
+        def _add(i: int):
+            shard = self.load_shard(i)
+            for doc in groups[i]:
+                shard.add_doc(doc)
+        list(self._pool.map(_add, list(groups)))
+        self._count_docs()
+
+    def _target_shards(self, filter: Optional[Dict] = None) -> List[int]:
+        # 按doc_id过滤时只需要查doc_id所在的分片
+        doc_ids = (filter or {}).get("doc_id")
+        if doc_ids is None:
+            return list(range(self.num_shards))
+        doc_ids = doc_ids if isinstance(doc_ids, (list, tuple, set)) else [doc_ids]
+        return sorted({_shard_of(doc_id, self.num_shards) for doc_id in doc_ids})
+
+    def search_vectors(self, query_vectors: np.ndarray, top_k: int = 5, filter: Optional[Dict] = None) -> List[List[Dict[str, Union[str, float]]]]:
+        shards = [self.load_shard(i) for i in self._target_shards(filter)]
+        if not shards:
+            return [[] for _ in range(len(query_vectors))]
+        per_shard = list(self._pool.map(lambda shard: shard.search_vectors(query_vectors, top_k, filter), shards))
+        # 每个分片内部已按L2距离升序 用堆做多路归并
+        return [
+            list(islice(heapq.merge(*[results[q] for results in per_shard], key=lambda r: r['score']), top_k))
+            for q in range(len(query_vectors))
+        ]
+
+    def save_index(self):
+        for shard in list(self._shards.values()):
+            shard.save_index()
+        with open(self._meta_path, "w") as f:
+            json.dump({"num_shards": self.num_shards}, f)
+
+    def load_index(self):
+        for i in range(self.num_shards):
+            self.load_shard(i).load_index()
+
+    def rebalance(self, num_shards: int):
+        """
+        离线重新分片 复用已保存的向量 不会重新embed
+        重新分片期间不能有写入
+        """
+        for i in range(self.num_shards):
+            self.load_shard(i)
+        tmp_path = os.path.join(self._index_path, "_rebalance")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        new_shards = [
+            VectorStore(dim=self._dim, tokenizer=self._tokenizer, index_path=os.path.join(tmp_path, f"shard_{i}"),
+                        llm=self._llm, chunk_size=self._chunk_size, leap_size=self._leap_size,
+                        split_char=self._split_char, only_char=self._only_char, parent_window=self._parent_window)
+            for i in range(num_shards)
+        ]
+        for shard in self._shards.values():
+            groups: Dict[int, tuple] = {}
+            for chunk, vector in zip(shard._docs, shard._vectors):
+                chunks, vectors = groups.setdefault(_shard_of(chunk.doc_id, num_shards), ([], []))
+                chunks.append(chunk)
+                vectors.append(vector)
+            for i, (chunks, vectors) in groups.items():
+                new_shards[i]._add_chunks(chunks, vectors)
+                for chunk in chunks:
+                    new_shards[i]._cache.hit(chunk)
+        for new_shard in new_shards:
+            new_shard.num_docs = len({chunk.doc_id for chunk in new_shard._docs})
+            new_shard.save_index()
+        for i in range(self.num_shards):
+            shutil.rmtree(self._shard_path(i), ignore_errors=True)
+        for i in range(num_shards):
+            shutil.move(os.path.join(tmp_path, f"shard_{i}"), self._shard_path(i))
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        self.num_shards = num_shards
+        with self._shards_lock:
+            self._shards = {}
+            self._count_docs()
+        self._pool.shutdown(wait=False)
+        self._pool = ThreadPoolExecutor(max_workers=self._max_workers or num_shards)
+        with open(self._meta_path, "w") as f:
+            json.dump({"num_shards": self.num_shards}, f)
+        for i in range(self.num_shards):
+            self.load_shard(i)
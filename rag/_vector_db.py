@@ -1,5 +1,6 @@
 import gc
 import os
+import threading
 from typing import List, Optional, Union
 import numpy as np
 import faiss
@@ -11,6 +12,8 @@ from config import get_siliconflow_model
 from typing import List,Dict,Optional,Callable
 from ._chunk import ChunkInfo
 from ._cache import _Cache
+from ._filter import _MetaIndex,filtered_search
+from ._rank import RankCascade
 
 default_index_path="storage"
 faiss_index='faiss.index'
@@ -31,7 +34,13 @@ class VectorStore:
                  chunk_size:int=1024,
                  leap_size:int=128,
                  split_char:Optional[str]= None,
-                 only_char:bool=False):
+                 only_char:bool=False,
+                 cascade:Optional[RankCascade]=None,
+                 parent_window:int=0):
+        """
+        parent_window>0时为父子分块模式: 以chunk_size切出的小块(相互不重叠)做embed和检索
+        回答时命中的小块按doc_id/chunk_order_index扩展为前后各parent_window块组成的父窗口
+        """
         self._tokenizer=tokenizer
         self._index_path=index_path
         self._llm=llm
@@ -44,6 +53,13 @@ class VectorStore:
         self._vectors_idx=0
         self._dim=dim
         self.num_docs = 0
+        # index.add与index.search互斥 embed等网络请求不持锁
+        self._lock=threading.RLock()
+        self._meta_index=_MetaIndex()
+        self._cascade=cascade or RankCascade()
+        self._parent_window=parent_window
+        # (doc_id,chunk_order_index) -> self._docs中的位置
+        self._chunk_pos:Dict[tuple,int]={}
 
         self._embed_func=self._llm.embed
         self._rerank_func=self._llm.rerank
@@ -55,37 +71,106 @@ class VectorStore:
         self._cache=_Cache(self._cache_path)
         self._pre_load()
     def _get_chunks(self,doc:Document):
-        _chunks=get_chunks(doc,self._tokenizer,self._chunk_size,self._leap_size,self._split_char,self._only_char)
+        leap_size=0 if self._parent_window else self._leap_size
+        _chunks=get_chunks(doc,self._tokenizer,self._chunk_size,leap_size,self._split_char,self._only_char)
         embeddings=self._embed_func([chunk.content for chunk in _chunks])
-        if len(embeddings) > 0:
-            vectors = np.array(embeddings).astype('float32')
-            self._index.add(vectors)
-        self._docs.extend(_chunks)
-        self._vectors.extend(embeddings)
-        self.num_docs += 1
+        self._add_chunks(_chunks,embeddings)
+        with self._lock:
+            self.num_docs += 1
         print("add doc",self.num_docs)
+    def _add_chunks(self,chunks:List[ChunkInfo],embeddings):
+        """写入已经embed好的chunk 重新分片时不需要再次embed"""
+        with self._lock:
+            if len(embeddings) > 0:
+                # embed已经返回float32矩阵时不再复制
+                vectors = np.ascontiguousarray(embeddings, dtype='float32')
+                self._index.add(vectors)
+            self._meta_index.add(chunks,len(self._docs))
+            for idx,chunk in enumerate(chunks,len(self._docs)):
+                self._chunk_pos[(chunk.doc_id,chunk.chunk_order_index)]=idx
+            self._docs.extend(chunks)
+            self._vectors.extend(embeddings)
     def add_doc(self, doc: Document) -> None:
         if self._cache.hit(doc):
             print("cache hit",doc)
         return self._get_chunks(doc)
-    def retrieve(self, query:Union[str,List[str]], top_k: int = 5) -> List[Dict[str, Union[str, float]]]:
-        query=[query] if isinstance(query,str) else query
+    def retrieve(self, query:Union[str,List[str]], top_k: int = 5,filter:Optional[Dict]=None) -> List[Dict[str, Union[str, float]]]:
+        query=[query] if isinstance(query,str) else list(query)
+        if len(query)!=1:
+            raise ValueError(f"retrieve takes one query, got {len(query)}; use retrieve_batch")
         query_embedding = self._embed_func(query)
-        query_vector = np.array(query_embedding).astype('float32').reshape(1, -1)
-        scores, indices = self._index.search(query_vector, top_k)
-        results = [
-            {'text': self._docs[idx].content, 'score': float(score)}
-            for idx, score in zip(indices[0], scores[0])
+        query_vector = np.ascontiguousarray(query_embedding, dtype='float32').reshape(1, -1)
+        return self.search_vectors(query_vector, top_k,filter)[0]
+    def retrieve_batch(self, queries:List[str], top_k: int = 5,filter:Optional[Dict]=None) -> List[List[Dict[str, Union[str, float]]]]:
+        """多条query只做一次embed和一次index.search"""
+        if not queries:
+            return []
+        query_vectors = np.ascontiguousarray(self._embed_func(queries), dtype='float32').reshape(len(queries), -1)
+        return self.search_vectors(query_vectors, top_k,filter)
+    def search_vectors(self, query_vectors:np.ndarray, top_k: int = 5,filter:Optional[Dict]=None) -> List[List[Dict[str, Union[str, float]]]]:
+        with self._lock:
+            if filter:
+                scores, indices = filtered_search(self._index, query_vectors, top_k, self._meta_index.select(filter))
+            else:
+                scores, indices = self._index.search(query_vectors, top_k)
+        return [
+            [
+                {'text': self._docs[idx].content, 'score': float(score),
+                 'doc_id': self._docs[idx].doc_id, 'chunk_order_index': self._docs[idx].chunk_order_index}
+                for idx, score in zip(_indices, _scores) if idx != -1
+            ]
+            for _indices, _scores in zip(indices, scores)
         ]
-        return results
     def _rerank(self,query: str, documents: List[str],top_k=3)->List[Dict]:
         return self._rerank_func(query, documents,top_k)
-    def rereank(self,query: str,top_k=3):
-        retrieve_topk=max(10,min(5,2*top_k))
-        results=self.retrieve(query=query,top_k=retrieve_topk)
-        return self._rerank(query=query,documents=[result['text'] for result in results],top_k=top_k)
-    def get(self,query: str,top_k=3,**kwargs):
-        results=self.rereank(query=query,top_k=top_k)
+    def rereank(self,query: str,top_k=3,filter:Optional[Dict]=None):
+        results=self.retrieve(query=query,top_k=self._cascade.candidate_depth(top_k),filter=filter)
+        return self._rank_candidates(query,results,top_k)
+    def _rank_candidates(self,query:str,results:List[Dict],top_k:int)->List[Dict]:
+        """对candidate_depth(top_k)条向量检索结果做级联rerank 父子分块时再扩展为父窗口"""
+        results=self._cascade.rank(query,results,top_k,self._rerank)
+        return self.expand(results) if self._parent_window else results
+    def _parent_text(self,doc_id:str,start:int,end:int)->str:
+        # 父子分块模式下子块互不重叠 拼接各子块在原文中的片段(raw)即为原文 content去掉了空白和分隔符不能直接拼
+        # 旧索引里的子块没有raw 退回用换行连接content
+        chunks=[self._docs[self._chunk_pos[(doc_id,i)]] for i in range(start,end+1) if (doc_id,i) in self._chunk_pos]
+        if all(getattr(chunk,'raw',None) is not None for chunk in chunks):
+            return ''.join(chunk.raw for chunk in chunks).strip()
+        return '\n'.join(chunk.content for chunk in chunks)
+    def expand(self,results:List[Dict])->List[Dict]:
+        """
+        把命中的子块扩展为父窗口 同一文档重叠的窗口会合并 分数取最高的子块
+        每个文档的窗口按起点排序后一次扫描合并 A与B、B与C重叠时三者合为一个窗口
+        合并后的窗口排在其中排名最靠前的子块的位置
+        """
+        windows:List[Dict]=[]
+        spans:Dict[str,List[tuple]]={}
+        for rank,result in enumerate(results):
+            doc_id,order=result.get('doc_id'),result.get('chunk_order_index')
+            if doc_id is None or order is None:
+                windows.append({**result,'_rank':rank})
+                continue
+            spans.setdefault(doc_id,[]).append((max(0,order-self._parent_window),order+self._parent_window,rank,result))
+        for doc_spans in spans.values():
+            doc_spans.sort(key=lambda span:span[0])
+            window=None
+            for start,end,rank,result in doc_spans:
+                if window is not None and start<=window['_end']:
+                    window['_end']=max(window['_end'],end)
+                    window['score']=max(window['score'],result['score'])
+                    window['_rank']=min(window['_rank'],rank)
+                    continue
+                window={**result,'_start':start,'_end':end,'_rank':rank}
+                windows.append(window)
+        windows.sort(key=lambda window:window['_rank'])
+        # 只有最终保留的父窗口才读取文本
+        for window in windows:
+            window.pop('_rank')
+            if '_start' in window:
+                window['text']=self._parent_text(window['doc_id'],window.pop('_start'),window.pop('_end'))
+        return windows
+    def get(self,query: str,top_k=3,filter:Optional[Dict]=None,**kwargs):
+        results=self.rereank(query=query,top_k=top_k,filter=filter)
         _formated_result=self._formated_result(results)
         return self._chat(_formated_result,**kwargs)
     def _chat(self,formated_result:str,**kwargs):
@@ -110,9 +195,14 @@ class VectorStore:
         self._docs=data['_docs'].tolist()
         self._vectors=data['_vectors'].tolist()
         self._index=faiss.read_index(self._faiss_index_path)
+        self._meta_index.rebuild(self._docs)
+        self._chunk_pos={(chunk.doc_id,chunk.chunk_order_index):idx for idx,chunk in enumerate(self._docs)}
         del data
         gc.collect()
     def save_index(self):
+        with self._lock:
+            self._save_index()
+    def _save_index(self):
         np.savez(
             self._index_npz_path,
             _docs=self._docs,
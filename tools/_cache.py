@@ -0,0 +1,123 @@
+"""
+工具结果缓存
+register_tool(cacheable=True,ttl=..,key=..)声明的工具按(工具名,规范化参数,key(参数))缓存结果
+key返回None时不保存结果 文件类工具用file_stamp把mtime放进key 文件变化后自动失效
+相同的调用正在执行时后来者等待同一个结果 同一批中的重复调用只执行一次
+只缓存正常返回的结果 抛出异常的调用不缓存
+"""
+import asyncio
+import concurrent.futures
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+default_max_entries = 1024
+
+
+def file_stamp(path: str) -> Tuple:
+    """文件/目录的(绝对路径,mtime,大小) 不存在时mtime为None 相对路径受当前目录影响所以取绝对路径"""
+    path = os.path.abspath(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (path, None, None)
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+class ToolResultCache:
+    def __init__(self, max_entries: int = default_max_entries):
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "deduped": 0, "evictions": 0}
+        # key -> (过期时间或None,结果)
+        self._entries: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(tool_name: str, arguments: Dict, key: Optional[Callable[[Dict], Any]] = None) -> Tuple[str, bool]:
+        """返回(缓存key,是否保存结果)"""
+        extra = key(arguments) if key else None
+        store = key is None or extra is not None
+        data = json.dumps([tool_name, arguments, extra], sort_keys=True, ensure_ascii=False, default=str)
+        return data, store
+
+    def _lookup(self, cache_key: str) -> Tuple[str, Any]:
+        """hit:已缓存的结果 wait:执行中的Future run:由调用方执行并complete"""
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                expires, result = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(cache_key)
+                    self.stats["hits"] += 1
+                    return "hit", result
+                del self._entries[cache_key]
+            future = self._inflight.get(cache_key)
+            if future is not None:
+                self.stats["deduped"] += 1
+                return "wait", future
+            self.stats["misses"] += 1
+            future = self._inflight[cache_key] = concurrent.futures.Future()
+            return "run", future
+
+    def _complete(self, cache_key: str, future: concurrent.futures.Future, store: bool, ttl: Optional[float],
+                  result: Any = None, error: Optional[BaseException] = None):
+        with self._lock:
+            self._inflight.pop(cache_key, None)
+            if error is None and store:
+                self._entries[cache_key] = (time.monotonic() + ttl if ttl is not None else None, result)
+                self._entries.move_to_end(cache_key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.stats["evictions"] += 1
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def call(self, cache_key: str, store: bool, ttl: Optional[float], fn: Callable[[], Any]) -> Any:
+        state, value = self._lookup(cache_key)
+        if state == "hit":
+            return value
+        if state == "wait":
+            return value.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._complete(cache_key, value, store, ttl, error=e)
+            raise
+        self._complete(cache_key, value, store, ttl, result=result)
+        return result
+
+    async def acall(self, cache_key: str, store: bool, ttl: Optional[float], afn: Callable[[], Awaitable]) -> Any:
+        state, value = self._lookup(cache_key)
+        if state == "hit":
+            return value
+        if state == "wait":
+            # 等待者超时被取消时不能连带取消共享的Future
+            return await asyncio.shield(asyncio.wrap_future(value))
+        try:
+            result = await afn()
+        except asyncio.CancelledError:
+            # 只有发起者被取消 等待同一结果的调用不应跟着被取消
+            self._complete(cache_key, value, store, ttl, error=RuntimeError("shared tool call was cancelled"))
+            raise
+        except BaseException as e:
+            self._complete(cache_key, value, store, ttl, error=e)
+            raise
+        self._complete(cache_key, value, store, ttl, result=result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = ToolResultCache()
+
+
+def get_tool_cache() -> ToolResultCache:
+    return _cache
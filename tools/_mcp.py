@@ -133,10 +133,26 @@ class MCPManager:
                             logger.error(f'Failed to execute MCP tool: {e}')
                             return f"Tool execution error: {str(e)}"
                     return tool_func
+
+                def create_tool_afunc(client_id, tool_name):
+                    async def tool_afunc(**kwargs):
+                        # 会话绑定在manager.loop上 在其他事件循环中通过wrap_future等待 不占用线程
+                        manager = MCPManager()
+                        client = manager.clients[client_id]
+                        coro = client.execute_function(tool_name, kwargs)
+                        try:
+                            if asyncio.get_running_loop() is manager.loop:
+                                return await coro
+                            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, manager.loop))
+                        except Exception as e:
+                            logger.error(f'Failed to execute MCP tool: {e}')
+                            return f"Tool execution error: {str(e)}"
+                    return tool_afunc
                 
                 _mcp_registered_tools[register_name] = {
                     "def": tool_definition,
-                    "fn": create_tool_func(client_id, tool.name)
+                    "fn": create_tool_func(client_id, tool.name),
+                    "afn": create_tool_afunc(client_id, tool.name)
                 }
                 
                 tools.append(tool_definition)
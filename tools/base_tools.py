@@ -2,7 +2,7 @@ import os
 import requests
 from .register import register_tool
 
-@register_tool(description="获取指定城市的天气信息", name="get_weather", allow_overwrite=True)
+@register_tool(description="获取指定城市的天气信息", name="get_weather", allow_overwrite=True, cacheable=True, ttl=600)
 def get_weather(city: str):
     """
     {
@@ -1,12 +1,17 @@
 """
 实现工具注册 
 目前schema仅仅支持openai格式的
+工具可以是同步函数或async函数 async工具同时登记afn 在事件循环中直接await
+cacheable的工具结果按参数缓存 见_cache.py
 """
+import asyncio
 import inspect
 import json
 import re
-from typing import Dict, List, Callable, Optional
+import threading
+from typing import Any, Dict, List, Callable, Optional
 import logging
+from ._cache import get_tool_cache
 logger = logging.getLogger(__name__)
 _local_registered_tools: Dict[str, Dict] = {}
 _mcp_registered_tools: Dict[str, Dict] = {}
@@ -58,6 +63,14 @@ def execute_tool(tool_name: str, arguments: Dict) -> str:
         return str(result)
     except Exception as e:
         return f"Error executing tool {tool_name}: {str(e)}"
+def _cache_key(tool_name: str, tool_info: Dict, arguments: Dict):
+    """补全默认参数后计算缓存key 返回(参数,key,是否保存)"""
+    bound = tool_info["sig"].bind(**arguments)
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    cache_key, store = get_tool_cache().make_key(tool_name, arguments, tool_info["cache"]["key"])
+    return arguments, cache_key, store
+
 def execute_tool(tool_name: str, arguments: Dict,search_tools:Callable=_search_tool) -> str:
     _ok_tool = search_tools(tool_name)
     if _ok_tool:
@@ -65,11 +78,55 @@ def execute_tool(tool_name: str, arguments: Dict,search_tools:Callable=_search_t
     else:
         return f"Error: Tool '{tool_name}' not found"
     try:
-        result = tool_info["fn"](**arguments)
+        if "cache" in tool_info:
+            arguments, cache_key, store = _cache_key(tool_name, tool_info, arguments)
+            result = get_tool_cache().call(cache_key, store, tool_info["cache"]["ttl"], lambda: str(tool_info["fn"](**arguments)))
+        else:
+            result = tool_info["fn"](**arguments)
         return str(result)
     except Exception as e:
         return f"Error executing tool {tool_name}: {str(e)}"
 
+async def aexecute_tool(tool_name: str, arguments: Dict,search_tools:Callable=_search_tool) -> str:
+    """
+    execute_tool的异步版本
+    有afn(async工具/MCP工具)时直接await 不占用线程 同步工具转到当前事件循环的默认线程池
+    """
+    _ok_tool = search_tools(tool_name)
+    if _ok_tool:
+        tool_info = _ok_tool
+    else:
+        return f"Error: Tool '{tool_name}' not found"
+    async def _run(arguments: Dict) -> str:
+        afn = tool_info.get("afn")
+        if afn is not None:
+            return str(await afn(**arguments))
+        return str(await asyncio.get_running_loop().run_in_executor(None, lambda: tool_info["fn"](**arguments)))
+    try:
+        if "cache" in tool_info:
+            arguments, cache_key, store = _cache_key(tool_name, tool_info, arguments)
+            return await get_tool_cache().acall(cache_key, store, tool_info["cache"]["ttl"], lambda: _run(arguments))
+        return await _run(arguments)
+    except Exception as e:
+        return f"Error executing tool {tool_name}: {str(e)}"
+
+_sync_loop = None
+_sync_loop_lock = threading.Lock()
+
+def _get_sync_loop() -> asyncio.AbstractEventLoop:
+    """同步调用async工具时使用的后台事件循环 所有同步调用共用一个"""
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="tool_sync_loop", daemon=True).start()
+    return _sync_loop
+
+def _sync_wrapper(func: Callable) -> Callable:
+    def tool_func(**kwargs):
+        return asyncio.run_coroutine_threadsafe(func(**kwargs), _get_sync_loop()).result()
+    return tool_func
+
 """
 本地工具注册到local_registered_tools
 """
@@ -78,6 +135,9 @@ def _base_regsiter(
     description: Optional[str] = None, 
     allow_overwrite: bool = False,
     register_map:Dict=_local_registered_tools,
+    cacheable: bool = False,
+    ttl: Optional[float] = None,
+    key: Optional[Callable[[Dict], Any]] = None,
 ):
     if callable(name):
         func = name
@@ -136,10 +196,18 @@ def _base_regsiter(
         if tool_name in _local_registered_tools and not allow_overwrite:
             if allow_overwrite:
                 return func
-        register_map[tool_name] = {
+        tool_info = {
             "def": tool_definition,
             "fn": func
         }
+        if inspect.iscoroutinefunction(func):
+            # fn供execute_tool同步调用 afn供aexecute_tool直接await
+            tool_info["fn"] = _sync_wrapper(func)
+            tool_info["afn"] = func
+        if cacheable:
+            tool_info["sig"] = sig
+            tool_info["cache"] = {"ttl": ttl, "key": key}
+        register_map[tool_name] = tool_info
         return func
     return decorator
 
@@ -147,8 +215,17 @@ def register_tool(
     name: Optional[str] = None, 
     description: Optional[str] = None, 
     allow_overwrite: bool = False,
+    cacheable: bool = False,
+    ttl: Optional[float] = None,
+    key: Optional[Callable[[Dict], Any]] = None,
 ) -> None:
-    return _base_regsiter(name, description, allow_overwrite,register_map=_local_registered_tools)
+    """
+    cacheable: 结果只取决于参数(和key)的只读工具 相同参数的调用复用结果 并发的相同调用只执行一次
+    ttl: 结果的有效期(秒) None表示一直有效
+    key: 接收补全默认值后的参数 返回额外的key部分(如file_stamp(path)) 返回None时不保存结果 只合并并发调用
+    """
+    return _base_regsiter(name, description, allow_overwrite,register_map=_local_registered_tools,
+                          cacheable=cacheable,ttl=ttl,key=key)
 
 
 
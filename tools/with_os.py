@@ -13,6 +13,7 @@ import glob
 import platform
 from typing import  Dict, Any
 from .base_tools import register_tool
+from ._cache import file_stamp
 
 def get_os_info():
     os_version=platform.platform()
@@ -94,7 +95,7 @@ def delete_file(file_path: str) -> Dict[str, Any]:
             "error": str(e)
         }
 
-@register_tool
+@register_tool(cacheable=True, key=lambda args: file_stamp(args["file_path"]))
 def read_file(file_path: str, encoding: str = "utf-8") -> Dict[str, Any]:
     """
     {
@@ -337,7 +338,8 @@ def delete_directory(dir_path: str, force: bool = False) -> Dict[str, Any]:
             "error": str(e)
         }
 
-@register_tool
+# 结果中有每个文件的大小和修改时间 目录的mtime反映不了这些变化 只合并并发的相同调用 不保存结果
+@register_tool(cacheable=True, key=lambda args: None)
 def list_directory(dir_path: str, show_hidden: bool = False, recursive: bool = False) -> Dict[str, Any]:
     """
     {
@@ -519,7 +521,8 @@ def get_absolute_path(path: str) -> Dict[str, Any]:
             "error": str(e)
         }
 
-@register_tool
+# 同list_directory 只合并并发的相同调用
+@register_tool(cacheable=True, key=lambda args: None)
 def find_files(pattern: str, search_path: str = ".", recursive: bool = True) -> Dict[str, Any]:
     """
     {
@@ -650,7 +653,8 @@ def get_file_times(file_path: str) -> Dict[str, Any]:
 
 # ==================== System Information Tools ====================
 
-@register_tool
+# 结果中包含当前目录 change_directory之后需要重新获取
+@register_tool(cacheable=True, key=lambda args: os.getcwd())
 def get_system_info() -> Dict[str, Any]:
     """
     {
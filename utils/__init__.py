@@ -1,6 +1,8 @@
 from ._format import format_agent_config,parse_json_resp
+from ._json_stream import JsonStreamParser
 
 all=[
     format_agent_config,
-    parse_json_resp
+    parse_json_resp,
+    JsonStreamParser
 ]
\ No newline at end of file
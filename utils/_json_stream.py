@@ -0,0 +1,166 @@
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+_WS = " \t\r\n"
+# 字符串内部只需要关心引号和转义 用正则直接跳过普通字符
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+class JsonStreamParser:
+    """
+    流式JSON的增量解析
+    每次feed只扫描新到达的字符 跳过第一个{或[之前的内容(如```json)
+    complete: 根值是否已经闭合 value(): 完整的值
+    fields: 根对象中已经完整的字段 字段一完整就解析并回调on_field 可以在流结束之前使用
+    partial(key): 正在生成的字符串字段的前缀
+    """
+    __slots__ = ('_buf', '_pos', '_root', '_stack', '_in_string', '_escape',
+                 '_expect', '_key', '_key_start', '_value_start', '_value_kind',
+                 'fields', 'complete', 'error', '_end', '_on_field', '_value')
+
+    def __init__(self, on_field: Optional[Callable[[str, Any], None]] = None):
+        self._buf = ""
+        self._pos = 0
+        self._root = -1
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        # 根对象中的位置: key/colon/value/in_value/comma
+        self._expect = "key"
+        self._key: Optional[str] = None
+        self._key_start = -1
+        self._value_start = -1
+        self._value_kind = ""
+        self._end = -1
+        self._value: Any = None
+        self._on_field = on_field
+        self.fields: Dict[str, Any] = {}
+        self.complete = False
+        self.error: Optional[Exception] = None
+
+    def feed(self, text: str) -> bool:
+        """追加一段文本 返回根值是否已经完整"""
+        if self.complete or not text:
+            return self.complete
+        self._buf += text
+        buf = self._buf
+        stack = self._stack
+        i = self._pos
+        n = len(buf)
+        while i < n:
+            c = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                match = _STRING_SPECIAL.search(buf, i)
+                if match is None:
+                    i = n
+                    break
+                i = match.start()
+                c = buf[i]
+                if c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if len(stack) == 1 and stack[0] == "{":
+                        self._string_end(i)
+                i += 1
+                continue
+            if self._root < 0:
+                if c == "{" or c == "[":
+                    self._root = i
+                    stack.append(c)
+                i += 1
+                continue
+            depth = len(stack)
+            if c == '"':
+                self._in_string = True
+                if depth == 1 and stack[0] == "{":
+                    if self._expect == "key":
+                        self._key_start = i
+                    elif self._expect == "value":
+                        self._value_start, self._value_kind, self._expect = i, "string", "in_value"
+            elif c == "{" or c == "[":
+                if depth == 1 and stack[0] == "{" and self._expect == "value":
+                    self._value_start, self._value_kind, self._expect = i, "container", "in_value"
+                stack.append(c)
+            elif c == "}" or c == "]":
+                if depth == 1 and self._expect == "in_value" and self._value_kind == "scalar":
+                    self._field_end(i)
+                stack.pop()
+                if not stack:
+                    self._end = i + 1
+                    self._finish()
+                    break
+                if len(stack) == 1 and stack[0] == "{" and self._expect == "in_value" and self._value_kind == "container":
+                    self._field_end(i + 1)
+            elif depth == 1 and stack[0] == "{":
+                if c == ":" and self._expect == "colon":
+                    self._expect = "value"
+                elif c == ",":
+                    if self._expect == "in_value" and self._value_kind == "scalar":
+                        self._field_end(i)
+                    self._expect = "key"
+                elif c not in _WS and self._expect == "value":
+                    self._value_start, self._value_kind, self._expect = i, "scalar", "in_value"
+            i += 1
+        self._pos = i
+        return self.complete
+
+    def _string_end(self, i: int):
+        if self._expect == "key" and self._key_start >= 0:
+            self._key = json.loads(self._buf[self._key_start:i + 1])
+            self._key_start = -1
+            self._expect = "colon"
+        elif self._expect == "in_value" and self._value_kind == "string":
+            self._field_end(i + 1)
+
+    def _field_end(self, end: int):
+        start, key = self._value_start, self._key
+        self._expect = "comma"
+        try:
+            value = json.loads(self._buf[start:end])
+        except ValueError:
+            return
+        self.fields[key] = value
+        if self._on_field is not None:
+            self._on_field(key, value)
+
+    def _finish(self):
+        self.complete = True
+        try:
+            self._value = json.loads(self._buf[self._root:self._end])
+        except ValueError as e:
+            self.error = e
+
+    def value(self) -> Any:
+        if not self.complete:
+            raise ValueError("json value is not complete")
+        if self.error is not None:
+            raise self.error
+        return self._value
+
+    def partial(self, key: str) -> Optional[str]:
+        """key是正在生成的字符串字段时返回已生成的前缀 已完成时返回完整值"""
+        if key in self.fields:
+            return self.fields[key]
+        if self._key != key or self._expect != "in_value" or self._value_kind != "string":
+            return None
+        raw = self._buf[self._value_start + 1:self._pos]
+        # 去掉末尾不完整的转义
+        for cut in range(0, 7):
+            try:
+                return json.loads('"' + raw[:len(raw) - cut] + '"')
+            except ValueError:
+                continue
+        return None
+
+    @property
+    def text(self) -> str:
+        """根值对应的原文 未开始时为空"""
+        if self._root < 0:
+            return ""
+        return self._buf[self._root:self._end if self.complete else len(self._buf)]